@@ -0,0 +1,60 @@
+"""Parse and analyse a ruleset into an API response body.
+
+This module deliberately does not import Django models, so its functions
+can run in worker processes that have not set up Django.
+"""
+
+from core.parsers.iptables_parser import IptablesParser
+from core.parsers.nftables_parser import NftablesParser
+from core.anomalies.analysis import AnalysisResult
+from core.optimizer.rule_optimizer import optimize_rules
+from core.optimizer.metrics import compute_metrics
+
+
+def detect_rule_type(rules_text):
+    """Return 'nftables' or 'iptables' for the given ruleset text."""
+    if "table" in rules_text and "{" in rules_text:
+        return "nftables"
+    return "iptables"
+
+
+def get_parser(rule_type):
+    return NftablesParser() if rule_type == "nftables" else IptablesParser()
+
+
+def serialize_rule(rule):
+    return {
+        "order": rule.order,
+        "table": rule.table,
+        "chain": rule.chain,
+        "action": rule.action,
+        "raw": rule.raw,
+    }
+
+
+def analyze_text(rules_text):
+    """Parse and analyse a ruleset, returning the API response body."""
+    rules = get_parser(detect_rule_type(rules_text)).parse(rules_text)
+
+    # Run every detector once and share the results below.
+    analysis = AnalysisResult.from_rules(rules)
+
+    return {
+        "metrics": compute_metrics(rules, analysis),
+        "redundant_rules": [
+            serialize_rule(r) for r in analysis.redundant
+        ],
+        "shadowed_rules": [
+            serialize_rule(r) for r in analysis.shadowed
+        ],
+        "conflicts": [
+            {
+                "rule1": serialize_rule(r1),
+                "rule2": serialize_rule(r2)
+            }
+            for r1, r2 in analysis.conflicts
+        ],
+        "optimized_rules": [
+            serialize_rule(r) for r in optimize_rules(rules, analysis)
+        ]
+    }
@@ -0,0 +1,40 @@
+"""Compression of stored ruleset text.
+
+Kept free of model imports so that migrations can use it as well.
+"""
+
+import hashlib
+import lzma
+import zlib
+
+ZLIB = 'zlib'
+LZMA = 'lzma'
+
+_COMPRESSORS = {
+    ZLIB: lambda data: zlib.compress(data, 9),
+    LZMA: lambda data: lzma.compress(data, preset=6),
+}
+
+_DECOMPRESSORS = {
+    ZLIB: zlib.decompress,
+    LZMA: lzma.decompress,
+}
+
+
+def text_digest(text):
+    """Return the SHA-256 hex digest of the exact ruleset text."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def compress_text(text, codec=ZLIB):
+    """Compress `text` with `codec` ('zlib' or 'lzma')."""
+    if codec not in _COMPRESSORS:
+        raise ValueError(f"Unknown compression codec: {codec!r}")
+    return _COMPRESSORS[codec](text.encode('utf-8'))
+
+
+def decompress_text(data, codec):
+    """Inverse of `compress_text`."""
+    if codec not in _DECOMPRESSORS:
+        raise ValueError(f"Unknown compression codec: {codec!r}")
+    return _DECOMPRESSORS[codec](bytes(data)).decode('utf-8')
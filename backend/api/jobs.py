@@ -0,0 +1,73 @@
+"""Local worker pool for asynchronous analysis jobs.
+
+Jobs run on a `ThreadPoolExecutor` inside the Django process, so no
+external broker is needed. Job state lives in the `AnalysisJob` table,
+which is what the poll endpoint reads. Jobs that were still pending or
+running when the process stopped are not resumed.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from .models import AnalysisJob
+from .services import cached_analysis, record_session
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide job executor, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'ANALYSIS_JOB_WORKERS', 2),
+                thread_name_prefix='analysis-job',
+            )
+        return _executor
+
+
+def submit_job(rules_text):
+    """Create an `AnalysisJob` and queue it on the worker pool."""
+    job = AnalysisJob.objects.create()
+    get_executor().submit(run_job, job.id, rules_text)
+    return job
+
+
+def _update(job_id, **fields):
+    AnalysisJob.objects.filter(id=job_id).update(**fields)
+
+
+def run_job(job_id, rules_text):
+    """Run one job, recording progress and the result on its row."""
+    close_old_connections()
+    try:
+        _update(job_id, status=AnalysisJob.RUNNING, progress=10)
+
+        response, cache_hit = cached_analysis(rules_text)
+        _update(job_id, progress=90)
+
+        session = record_session(rules_text, response)
+        _update(
+            job_id,
+            status=AnalysisJob.DONE,
+            progress=100,
+            finished_at=timezone.now(),
+            session=session,
+            result=dict(response, cached=cache_hit, session_id=str(session.id)),
+        )
+    except Exception as exc:
+        _update(
+            job_id,
+            status=AnalysisJob.FAILED,
+            finished_at=timezone.now(),
+            error=str(exc),
+        )
+    finally:
+        # Worker threads get their own DB connection; do not leak it.
+        connection.close()
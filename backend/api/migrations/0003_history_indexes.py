@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_analysisjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='analysissession',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='analysissession',
+            index=models.Index(fields=['rule_type', '-created_at'], name='session_type_created_idx'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+from api.compression import ZLIB, compress_text, text_digest
+
+
+def move_raw_rules_to_blobs(apps, schema_editor):
+    AnalysisSession = apps.get_model('api', 'AnalysisSession')
+    RulesetBlob = apps.get_model('api', 'RulesetBlob')
+
+    for session in AnalysisSession.objects.only('id', 'raw_rules').iterator():
+        text = session.raw_rules
+        digest = text_digest(text)
+        if not RulesetBlob.objects.filter(digest=digest).exists():
+            RulesetBlob.objects.create(
+                digest=digest,
+                codec=ZLIB,
+                size=len(text.encode('utf-8')),
+                data=compress_text(text, ZLIB),
+            )
+        AnalysisSession.objects.filter(pk=session.pk).update(ruleset_id=digest)
+
+
+def restore_raw_rules(apps, schema_editor):
+    from api.compression import decompress_text
+
+    AnalysisSession = apps.get_model('api', 'AnalysisSession')
+    for session in AnalysisSession.objects.select_related('ruleset').iterator():
+        AnalysisSession.objects.filter(pk=session.pk).update(
+            raw_rules=decompress_text(session.ruleset.data, session.ruleset.codec)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RulesetBlob',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('codec', models.CharField(choices=[('zlib', 'zlib'), ('lzma', 'lzma')], default='zlib', max_length=10)),
+                ('size', models.PositiveBigIntegerField(default=0, help_text='Uncompressed size in bytes')),
+                ('data', models.BinaryField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='analysissession',
+            name='ruleset',
+            field=models.ForeignKey(help_text='The original raw firewall rules input', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='sessions', to='api.rulesetblob'),
+        ),
+        migrations.AlterField(
+            model_name='analysissession',
+            name='raw_rules',
+            field=models.TextField(blank=True, default='', help_text='The original raw firewall rules input'),
+        ),
+        migrations.RunPython(move_raw_rules_to_blobs, restore_raw_rules),
+        migrations.RemoveField(
+            model_name='analysissession',
+            name='raw_rules',
+        ),
+        migrations.AlterField(
+            model_name='analysissession',
+            name='ruleset',
+            field=models.ForeignKey(help_text='The original raw firewall rules input', on_delete=django.db.models.deletion.PROTECT, related_name='sessions', to='api.rulesetblob'),
+        ),
+    ]
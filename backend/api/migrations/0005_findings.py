@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_ruleset_blobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConflictPair',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('table', models.CharField(max_length=64)),
+                ('chain', models.CharField(max_length=64)),
+                ('rule1_order', models.IntegerField()),
+                ('rule1_action', models.CharField(max_length=64)),
+                ('rule1_raw', models.TextField()),
+                ('rule2_order', models.IntegerField()),
+                ('rule2_action', models.CharField(max_length=64)),
+                ('rule2_raw', models.TextField()),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conflict_pairs', to='api.analysissession')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['chain', 'rule1_order'], name='conflict_rule1_idx'), models.Index(fields=['chain', 'rule2_order'], name='conflict_rule2_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Finding',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('redundant', 'redundant'), ('shadowed', 'shadowed')], max_length=20)),
+                ('rule_order', models.IntegerField(help_text='Position of the rule in the ruleset')),
+                ('table', models.CharField(max_length=64)),
+                ('chain', models.CharField(max_length=64)),
+                ('action', models.CharField(max_length=64)),
+                ('raw', models.TextField()),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='findings', to='api.analysissession')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['chain', 'rule_order', 'kind'], name='finding_rule_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_findings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysissession',
+            name='complete',
+            field=models.BooleanField(default=True),
+        ),
+    ]
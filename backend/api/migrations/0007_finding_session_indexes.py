@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_session_complete'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='conflictpair',
+            name='conflict_rule1_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='conflictpair',
+            name='conflict_rule2_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='finding',
+            name='finding_rule_idx',
+        ),
+        migrations.AddIndex(
+            model_name='conflictpair',
+            index=models.Index(fields=['session', 'table', 'chain', 'rule1_order'], name='conflict_session_rule1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conflictpair',
+            index=models.Index(fields=['session', 'table', 'chain', 'rule2_order'], name='conflict_session_rule2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='finding',
+            index=models.Index(fields=['session', 'kind', 'table', 'chain', 'rule_order'], name='finding_session_rule_idx'),
+        ),
+    ]
@@ -0,0 +1,251 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Min, OuterRef, Subquery
+
+BATCH_SIZE = 1000
+
+
+def findings_per_ruleset(apps, schema_editor):
+    AnalysisSession = apps.get_model('api', 'AnalysisSession')
+    ConflictPair = apps.get_model('api', 'ConflictPair')
+    Finding = apps.get_model('api', 'Finding')
+    RulesetBlob = apps.get_model('api', 'RulesetBlob')
+    RulesetRule = apps.get_model('api', 'RulesetRule')
+
+    session_ruleset = Subquery(
+        AnalysisSession.objects.filter(pk=OuterRef('session_id')).values('ruleset_id')[:1]
+    )
+    Finding.objects.update(ruleset_id=session_ruleset)
+    ConflictPair.objects.update(ruleset_id=session_ruleset)
+
+    # Keep one copy of each finding per ruleset
+    for model, key in (
+        (Finding, ('ruleset', 'kind', 'table', 'chain', 'rule_order')),
+        (ConflictPair, ('ruleset', 'table', 'chain', 'rule1_order', 'rule2_order')),
+    ):
+        keep = set(model.objects.values(*key).annotate(keep=Min('id')).values_list('keep', flat=True))
+        model.objects.exclude(id__in=keep).delete()
+
+    rules = {}
+    for ruleset, table, chain, order, action, raw in Finding.objects.values_list(
+        'ruleset_id', 'table', 'chain', 'rule_order', 'action', 'raw'
+    ).iterator():
+        rules.setdefault((ruleset, table, chain, order), (action, raw))
+    for ruleset, table, chain, *pair in ConflictPair.objects.values_list(
+        'ruleset_id', 'table', 'chain',
+        'rule1_order', 'rule1_action', 'rule1_raw',
+        'rule2_order', 'rule2_action', 'rule2_raw',
+    ).iterator():
+        rules.setdefault((ruleset, table, chain, pair[0]), (pair[1], pair[2]))
+        rules.setdefault((ruleset, table, chain, pair[3]), (pair[4], pair[5]))
+    RulesetRule.objects.bulk_create(
+        [
+            RulesetRule(ruleset_id=ruleset, table=table, chain=chain,
+                        order=order, action=action, raw=raw)
+            for (ruleset, table, chain, order), (action, raw) in rules.items()
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+    RulesetBlob.objects.filter(
+        digest__in=AnalysisSession.objects.filter(complete=True).values('ruleset_id')
+    ).update(findings_stored=True)
+
+
+def findings_per_session(apps, schema_editor):
+    AnalysisSession = apps.get_model('api', 'AnalysisSession')
+    ConflictPair = apps.get_model('api', 'ConflictPair')
+    Finding = apps.get_model('api', 'Finding')
+    RulesetRule = apps.get_model('api', 'RulesetRule')
+
+    findings = []
+    pairs = []
+    for session in AnalysisSession.objects.only('id', 'ruleset_id').iterator():
+        rules = {
+            (rule.table, rule.chain, rule.order): rule
+            for rule in RulesetRule.objects.filter(ruleset_id=session.ruleset_id)
+        }
+        for finding in Finding.objects.filter(ruleset_id=session.ruleset_id, session__isnull=True):
+            rule = rules[finding.table, finding.chain, finding.rule_order]
+            findings.append(Finding(
+                session_id=session.id, ruleset_id=finding.ruleset_id, kind=finding.kind,
+                table=finding.table, chain=finding.chain, rule_order=finding.rule_order,
+                action=rule.action, raw=rule.raw,
+            ))
+        for pair in ConflictPair.objects.filter(ruleset_id=session.ruleset_id, session__isnull=True):
+            rule1 = rules[pair.table, pair.chain, pair.rule1_order]
+            rule2 = rules[pair.table, pair.chain, pair.rule2_order]
+            pairs.append(ConflictPair(
+                session_id=session.id, ruleset_id=pair.ruleset_id,
+                table=pair.table, chain=pair.chain,
+                rule1_order=rule1.order, rule1_action=rule1.action, rule1_raw=rule1.raw,
+                rule2_order=rule2.order, rule2_action=rule2.action, rule2_raw=rule2.raw,
+            ))
+
+    Finding.objects.filter(session__isnull=True).delete()
+    ConflictPair.objects.filter(session__isnull=True).delete()
+    Finding.objects.bulk_create(findings, batch_size=BATCH_SIZE)
+    ConflictPair.objects.bulk_create(pairs, batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_finding_session_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RulesetRule',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('table', models.CharField(max_length=64)),
+                ('chain', models.CharField(max_length=64)),
+                ('order', models.IntegerField(help_text='Position of the rule in its chain')),
+                ('action', models.CharField(max_length=64)),
+                ('raw', models.TextField()),
+                ('ruleset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rules', to='api.rulesetblob')),
+            ],
+            options={
+                'ordering': ['id'],
+                'constraints': [models.UniqueConstraint(fields=('ruleset', 'table', 'chain', 'order'), name='ruleset_rule_key')],
+            },
+        ),
+        migrations.AddField(
+            model_name='rulesetblob',
+            name='findings_stored',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='finding',
+            name='ruleset',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='findings', to='api.rulesetblob'),
+        ),
+        migrations.AddField(
+            model_name='conflictpair',
+            name='ruleset',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='conflict_pairs', to='api.rulesetblob'),
+        ),
+        migrations.RemoveIndex(
+            model_name='conflictpair',
+            name='conflict_session_rule1_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='conflictpair',
+            name='conflict_session_rule2_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='finding',
+            name='finding_session_rule_idx',
+        ),
+        # Nullable and with defaults so that reversing can re-add them
+        # before the per-session rows are restored
+        migrations.AlterField(
+            model_name='finding',
+            name='session',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='findings', to='api.analysissession'),
+        ),
+        migrations.AlterField(
+            model_name='finding',
+            name='action',
+            field=models.CharField(default='', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='finding',
+            name='raw',
+            field=models.TextField(default=''),
+        ),
+        migrations.AlterField(
+            model_name='conflictpair',
+            name='session',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='conflict_pairs', to='api.analysissession'),
+        ),
+        migrations.AlterField(
+            model_name='conflictpair',
+            name='rule1_action',
+            field=models.CharField(default='', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='conflictpair',
+            name='rule1_raw',
+            field=models.TextField(default=''),
+        ),
+        migrations.AlterField(
+            model_name='conflictpair',
+            name='rule2_action',
+            field=models.CharField(default='', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='conflictpair',
+            name='rule2_raw',
+            field=models.TextField(default=''),
+        ),
+        migrations.RunPython(findings_per_ruleset, findings_per_session),
+        migrations.RemoveField(
+            model_name='finding',
+            name='session',
+        ),
+        migrations.RemoveField(
+            model_name='finding',
+            name='action',
+        ),
+        migrations.RemoveField(
+            model_name='finding',
+            name='raw',
+        ),
+        migrations.RemoveField(
+            model_name='conflictpair',
+            name='session',
+        ),
+        migrations.RemoveField(
+            model_name='conflictpair',
+            name='rule1_action',
+        ),
+        migrations.RemoveField(
+            model_name='conflictpair',
+            name='rule1_raw',
+        ),
+        migrations.RemoveField(
+            model_name='conflictpair',
+            name='rule2_action',
+        ),
+        migrations.RemoveField(
+            model_name='conflictpair',
+            name='rule2_raw',
+        ),
+        migrations.AlterField(
+            model_name='finding',
+            name='ruleset',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='findings', to='api.rulesetblob'),
+        ),
+        migrations.AlterField(
+            model_name='conflictpair',
+            name='ruleset',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conflict_pairs', to='api.rulesetblob'),
+        ),
+        migrations.AlterField(
+            model_name='finding',
+            name='rule_order',
+            field=models.IntegerField(help_text='Position of the rule in its chain'),
+        ),
+        migrations.AddConstraint(
+            model_name='finding',
+            constraint=models.UniqueConstraint(fields=('ruleset', 'kind', 'table', 'chain', 'rule_order'), name='finding_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='conflictpair',
+            constraint=models.UniqueConstraint(fields=('ruleset', 'table', 'chain', 'rule1_order', 'rule2_order'), name='conflict_pair_key'),
+        ),
+        migrations.AddIndex(
+            model_name='finding',
+            index=models.Index(fields=['kind', 'table', 'chain', 'rule_order', 'ruleset'], name='finding_rule_ruleset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conflictpair',
+            index=models.Index(fields=['table', 'chain', 'rule1_order', 'ruleset'], name='conflict_rule1_ruleset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conflictpair',
+            index=models.Index(fields=['table', 'chain', 'rule2_order', 'ruleset'], name='conflict_rule2_ruleset_idx'),
+        ),
+    ]
@@ -1,13 +1,82 @@
+from django.conf import settings
 from django.db import models
 import uuid
 
+from .compression import LZMA, ZLIB, compress_text, decompress_text, text_digest
+
+
+class RulesetBlob(models.Model):
+    """A submitted ruleset, stored once per distinct text and compressed.
+
+    Sessions reference blobs by their SHA-256 digest, so a ruleset that is
+    submitted many times is only stored once. The text is decompressed
+    only when `text` is read.
+    """
+    digest = models.CharField(max_length=64, primary_key=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    codec = models.CharField(
+        max_length=10,
+        choices=[(ZLIB, 'zlib'), (LZMA, 'lzma')],
+        default=ZLIB
+    )
+    size = models.PositiveBigIntegerField(default=0, help_text="Uncompressed size in bytes")
+    data = models.BinaryField()
+
+    # True once the findings of this ruleset are stored; sessions of the
+    # same ruleset share them instead of storing their own
+    findings_stored = models.BooleanField(default=False)
+
+    @property
+    def text(self):
+        return decompress_text(self.data, self.codec)
+
+    @classmethod
+    def store(cls, text):
+        """Return the blob for `text`, creating it if it is not stored yet."""
+        return cls.store_many([text])[0]
+
+    @classmethod
+    def store_many(cls, texts):
+        """Return the blob for each text, in order, creating missing ones in bulk.
+
+        Costs one query for the digests already stored and one insert for
+        all the others, however many texts (or repeats) there are.
+        """
+        digests = [text_digest(text) for text in texts]
+        blobs = {
+            blob.digest: blob
+            for blob in cls.objects.only('digest', 'findings_stored').filter(digest__in=set(digests))
+        }
+
+        codec = getattr(settings, 'RULESET_COMPRESSION', ZLIB)
+        new_blobs = []
+        for digest, text in zip(digests, texts):
+            if digest not in blobs:
+                blobs[digest] = cls(
+                    digest=digest,
+                    codec=codec,
+                    size=len(text.encode('utf-8')),
+                    data=compress_text(text, codec),
+                )
+                new_blobs.append(blobs[digest])
+        # The same ruleset may be stored concurrently by another request.
+        cls.objects.bulk_create(new_blobs, ignore_conflicts=True)
+        return [blobs[digest] for digest in digests]
+
+    def __str__(self):
+        return f"Ruleset {self.digest[:12]} ({self.size} bytes)"
+
+
 class AnalysisSession(models.Model):
     """Stores the result of a firewall rule analysis session."""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     
     # Input Data
-    raw_rules = models.TextField(help_text="The original raw firewall rules input")
+    ruleset = models.ForeignKey(
+        RulesetBlob, on_delete=models.PROTECT, related_name='sessions',
+        help_text="The original raw firewall rules input"
+    )
     rule_type = models.CharField(
         max_length=20, 
         choices=[('iptables', 'iptables'), ('nftables', 'nftables')],
@@ -21,8 +90,156 @@ class AnalysisSession(models.Model):
     conflict_count = models.IntegerField(default=0)
     optimized_count = models.IntegerField(default=0)
 
+    # False while a streamed analysis is still writing its findings
+    complete = models.BooleanField(default=True)
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # History filtered by rule type, newest first
+            models.Index(fields=['rule_type', '-created_at'], name='session_type_created_idx'),
+        ]
+
+    @property
+    def raw_rules(self):
+        """The submitted ruleset text (decompressed on access)."""
+        return self.ruleset.text
 
     def __str__(self):
         return f"Analysis {self.id} ({self.rule_type}) - {self.created_at}"
+
+
+class AnalysisJob(models.Model):
+    """An analysis submitted through the asynchronous job API."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    status = models.CharField(
+        max_length=20,
+        choices=[(PENDING, 'pending'), (RUNNING, 'running'), (DONE, 'done'), (FAILED, 'failed')],
+        default=PENDING
+    )
+    progress = models.IntegerField(default=0, help_text="Completion in percent")
+    error = models.TextField(blank=True, default='')
+
+    # Full analysis response and the session recorded for it, once done
+    result = models.JSONField(null=True, blank=True)
+    session = models.ForeignKey(
+        AnalysisSession, null=True, blank=True,
+        on_delete=models.SET_NULL, related_name='jobs'
+    )
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Job {self.id} ({self.status})"
+
+
+class RulesetRule(models.Model):
+    """A rule of a stored ruleset that at least one finding refers to.
+
+    Stored once per ruleset; findings and conflict pairs refer to it by
+    its key within the ruleset, `(table, chain, order)`.
+    """
+    id = models.BigAutoField(primary_key=True)
+    ruleset = models.ForeignKey(
+        RulesetBlob, on_delete=models.CASCADE, related_name='rules'
+    )
+    table = models.CharField(max_length=64)
+    chain = models.CharField(max_length=64)
+    order = models.IntegerField(help_text="Position of the rule in its chain")
+    action = models.CharField(max_length=64)
+    raw = models.TextField()
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['ruleset', 'table', 'chain', 'order'], name='ruleset_rule_key'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Rule {self.order} in {self.table} {self.chain}"
+
+
+class Finding(models.Model):
+    """A redundant or shadowed rule of a stored ruleset."""
+    REDUNDANT = 'redundant'
+    SHADOWED = 'shadowed'
+
+    id = models.BigAutoField(primary_key=True)
+    ruleset = models.ForeignKey(
+        RulesetBlob, on_delete=models.CASCADE, related_name='findings'
+    )
+    kind = models.CharField(
+        max_length=20,
+        choices=[(REDUNDANT, 'redundant'), (SHADOWED, 'shadowed')]
+    )
+
+    # Key of the `RulesetRule`
+    table = models.CharField(max_length=64)
+    chain = models.CharField(max_length=64)
+    rule_order = models.IntegerField(help_text="Position of the rule in its chain")
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['ruleset', 'kind', 'table', 'chain', 'rule_order'], name='finding_key'
+            ),
+        ]
+        indexes = [
+            # Rulesets with a given finding, for the history's finding filter
+            models.Index(
+                fields=['kind', 'table', 'chain', 'rule_order', 'ruleset'],
+                name='finding_rule_ruleset_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} rule {self.rule_order} in {self.table} {self.chain}"
+
+
+class ConflictPair(models.Model):
+    """Two conflicting rules of the same chain of a stored ruleset."""
+    id = models.BigAutoField(primary_key=True)
+    ruleset = models.ForeignKey(
+        RulesetBlob, on_delete=models.CASCADE, related_name='conflict_pairs'
+    )
+    table = models.CharField(max_length=64)
+    chain = models.CharField(max_length=64)
+
+    # Orders of the earlier and the later rule of the pair
+    rule1_order = models.IntegerField()
+    rule2_order = models.IntegerField()
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['ruleset', 'table', 'chain', 'rule1_order', 'rule2_order'],
+                name='conflict_pair_key'
+            ),
+        ]
+        indexes = [
+            # Rulesets where a given rule took part in a conflict
+            models.Index(
+                fields=['table', 'chain', 'rule1_order', 'ruleset'],
+                name='conflict_rule1_ruleset_idx'
+            ),
+            models.Index(
+                fields=['table', 'chain', 'rule2_order', 'ruleset'],
+                name='conflict_rule2_ruleset_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Conflict {self.rule1_order}/{self.rule2_order} in {self.table} {self.chain}"
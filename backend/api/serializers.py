@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import AnalysisSession
+from .models import AnalysisJob, AnalysisSession
 
 class AnalysisSessionSerializer(serializers.ModelSerializer):
     class Meta:
@@ -11,3 +11,14 @@ class AnalysisSessionSerializer(serializers.ModelSerializer):
             'optimized_count'
         ]
         read_only_fields = fields
+
+
+class AnalysisJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AnalysisJob
+        fields = [
+            'id', 'status', 'progress',
+            'created_at', 'finished_at', 'error',
+            'session', 'result'
+        ]
+        read_only_fields = fields
@@ -0,0 +1,515 @@
+"""Analysis helpers shared by the API views.
+
+The views only deal with HTTP concerns; caching analysis results and
+recording sessions live here. The analysis itself is in `api.analysis`.
+"""
+
+import hashlib
+import ipaddress
+import json
+import multiprocessing
+import os
+import pickle
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from core.anomalies.analysis import AnalysisResult
+from core.classifier.packet_classifier import Packet, PacketClassifier
+from core.anomalies.conflicts import iter_conflicting_rules
+from core.anomalies.redundancy import iter_redundant_rules
+from core.anomalies.shadowing import iter_shadowed_rules
+from core.models.chain_partition import ChainPartition
+from core.optimizer.metrics import compute_metrics
+from core.optimizer.rule_optimizer import optimize_rules
+
+from .analysis import analyze_text, detect_rule_type, get_parser, serialize_rule
+from .models import AnalysisSession, ConflictPair, Finding, RulesetBlob, RulesetRule
+
+# Bump when the shape of the analysis response changes so that stale
+# cached responses are not served.
+CACHE_VERSION = 1
+
+
+def normalize_rules_text(rules_text):
+    """Return the ruleset text without what the parsers ignore.
+
+    Leading/trailing whitespace, blank lines and `#` comments (such as the
+    timestamp header of iptables-save) do not affect the analysis, so they
+    are dropped before hashing.
+    """
+    lines = (line.strip() for line in rules_text.splitlines())
+    return "\n".join(line for line in lines if line and not line.startswith("#"))
+
+
+def ruleset_digest(rules_text):
+    """Return the SHA-256 hex digest of the normalized ruleset text."""
+    return hashlib.sha256(normalize_rules_text(rules_text).encode("utf-8")).hexdigest()
+
+
+def cached_analysis(rules_text):
+    """Return `(response, cache_hit)` for a ruleset.
+
+    Responses are stored in the 'analysis' cache keyed by the detected
+    rule type and the ruleset digest, so identical submissions are served
+    without re-running the analyzers. Responses above
+    `ANALYSIS_CACHE_MAX_BYTES` are not cached (see `_cacheable`).
+    """
+    cache = caches["analysis"]
+    key = _cache_key(rules_text)
+
+    response = cache.get(key, version=CACHE_VERSION)
+    if response is not None:
+        return response, True
+
+    response = analyze_text(rules_text)
+    if _cacheable(response):
+        cache.set(key, response, version=CACHE_VERSION)
+    return response, False
+
+
+def _cache_key(rules_text):
+    # The parser is picked from the raw text, which normalization does not
+    # see, so texts that normalize alike may still be parsed differently.
+    return f"analysis:{detect_rule_type(rules_text)}:{ruleset_digest(rules_text)}"
+
+
+def _cacheable(response):
+    """Return True if a response is small enough for the analysis cache.
+
+    The cache is bounded by entry count only, and conflict lists grow
+    quadratically with the ruleset, so large responses are left out to
+    keep the cache within `MAX_ENTRIES * ANALYSIS_CACHE_MAX_BYTES`.
+    """
+    limit = getattr(settings, 'ANALYSIS_CACHE_MAX_BYTES', None)
+    if limit is None:
+        return True
+    return len(pickle.dumps(response, pickle.HIGHEST_PROTOCOL)) <= limit
+
+
+_batch_pool = None
+_batch_pool_lock = threading.Lock()
+
+
+def batch_workers():
+    """Number of processes for batch analyses (`ANALYSIS_BATCH_WORKERS`)."""
+    return getattr(settings, 'ANALYSIS_BATCH_WORKERS', None) or min(4, os.cpu_count() or 1)
+
+
+def get_batch_pool():
+    """Return the process-wide batch analysis pool, creating it on first use.
+
+    The pool is shared by all requests, so concurrent batches queue up
+    instead of each starting its own processes. Workers are started with
+    'forkserver' (or 'spawn' where that is unavailable) rather than by
+    forking this multithreaded server process.
+    """
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            method = 'forkserver' if 'forkserver' in methods else 'spawn'
+            _batch_pool = ProcessPoolExecutor(
+                max_workers=batch_workers(),
+                mp_context=multiprocessing.get_context(method),
+            )
+        return _batch_pool
+
+
+def _discard_batch_pool(pool):
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is pool:
+            _batch_pool = None
+    pool.shutdown(wait=False)
+
+
+def cached_analysis_many(texts):
+    """Return `(response, cache_hit)` for each ruleset text, in order.
+
+    Rulesets missing from the cache are analysed concurrently on the
+    shared batch pool (see `get_batch_pool`).
+    """
+    cache = caches["analysis"]
+    keys = [_cache_key(text) for text in texts]
+    found = cache.get_many(set(keys), version=CACHE_VERSION)
+
+    # Analyse each distinct uncached ruleset once.
+    pending = {}
+    for text, key in zip(texts, keys):
+        if key not in found:
+            pending.setdefault(key, text)
+    missing = list(pending)
+    missing_texts = list(pending.values())
+
+    if len(missing_texts) > 1 and batch_workers() > 1:
+        pool = get_batch_pool()
+        try:
+            computed = list(pool.map(analyze_text, missing_texts))
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool for the next batch.
+            _discard_batch_pool(pool)
+            computed = [analyze_text(text) for text in missing_texts]
+    else:
+        computed = [analyze_text(text) for text in missing_texts]
+
+    new_entries = dict(zip(missing, computed))
+    cache.set_many(
+        {key: response for key, response in new_entries.items() if _cacheable(response)},
+        version=CACHE_VERSION,
+    )
+
+    results = []
+    for key in keys:
+        if key in found:
+            results.append((found[key], True))
+        else:
+            results.append((new_entries[key], False))
+    return results
+
+
+def session_counts(metrics):
+    """Map analysis metrics onto the count fields of `AnalysisSession`."""
+    return {
+        "total_rules": metrics['total_rules'],
+        "redundant_count": metrics['redundant_rules'],
+        "shadowed_count": metrics['shadowed_rules'],
+        "conflict_count": metrics['conflicting_pairs'],
+        "optimized_count": metrics['optimized_rule_count'],
+    }
+
+
+def build_session(rules_text, response, ruleset=None):
+    """Return an unsaved `AnalysisSession` for an analysis response.
+
+    The ruleset text itself is stored (once per distinct text) as a
+    compressed `RulesetBlob` that the session references; pass `ruleset`
+    if it is already stored.
+    """
+    return AnalysisSession(
+        ruleset=ruleset or RulesetBlob.store(rules_text),
+        rule_type=detect_rule_type(rules_text),
+        **session_counts(response["metrics"])
+    )
+
+
+def _rule_key(rule):
+    return rule["table"], rule["chain"], rule["order"]
+
+
+def _ruleset_rule(ruleset, rule):
+    return RulesetRule(
+        ruleset=ruleset, table=rule["table"], chain=rule["chain"],
+        order=rule["order"], action=rule["action"], raw=rule["raw"],
+    )
+
+
+def _finding(ruleset, kind, rule):
+    return Finding(
+        ruleset=ruleset, kind=kind,
+        table=rule["table"], chain=rule["chain"], rule_order=rule["order"],
+    )
+
+
+def _conflict_pair(ruleset, rule1, rule2):
+    return ConflictPair(
+        ruleset=ruleset, table=rule1["table"], chain=rule1["chain"],
+        rule1_order=rule1["order"], rule2_order=rule2["order"],
+    )
+
+
+def build_findings(ruleset, response):
+    """Return unsaved `(rules, findings, conflict_pairs)` rows for an analysis response.
+
+    `rules` holds each rule the findings refer to once.
+    """
+    rules = {}
+    findings = []
+    for kind, listed in ((Finding.REDUNDANT, response["redundant_rules"]),
+                         (Finding.SHADOWED, response["shadowed_rules"])):
+        for rule in listed:
+            rules.setdefault(_rule_key(rule), _ruleset_rule(ruleset, rule))
+            findings.append(_finding(ruleset, kind, rule))
+    pairs = []
+    for pair in response["conflicts"]:
+        for rule in (pair["rule1"], pair["rule2"]):
+            rules.setdefault(_rule_key(rule), _ruleset_rule(ruleset, rule))
+        pairs.append(_conflict_pair(ruleset, pair["rule1"], pair["rule2"]))
+    return list(rules.values()), findings, pairs
+
+
+def save_findings(rules, findings, pairs):
+    """Insert finding rows in batches of `FINDINGS_BATCH_SIZE`.
+
+    Rows already stored for the ruleset (e.g. by a concurrent request for
+    the same ruleset) are skipped.
+    """
+    batch_size = getattr(settings, 'FINDINGS_BATCH_SIZE', 1000)
+    RulesetRule.objects.bulk_create(rules, batch_size=batch_size, ignore_conflicts=True)
+    Finding.objects.bulk_create(findings, batch_size=batch_size, ignore_conflicts=True)
+    ConflictPair.objects.bulk_create(pairs, batch_size=batch_size, ignore_conflicts=True)
+
+
+def store_findings(analyses):
+    """Store the findings of `(ruleset, response)` pairs, once per ruleset.
+
+    A ruleset's analysis is deterministic, so rulesets whose findings are
+    already stored (`findings_stored`) are skipped; sessions of the same
+    ruleset all read the one stored copy.
+    """
+    stored = {}
+    rows = ([], [], [])
+    for ruleset, response in analyses:
+        if ruleset.findings_stored or ruleset.digest in stored:
+            continue
+        stored[ruleset.digest] = ruleset
+        for batch, built in zip(rows, build_findings(ruleset, response)):
+            batch.extend(built)
+    if stored:
+        save_findings(*rows)
+        RulesetBlob.objects.filter(digest__in=stored).update(findings_stored=True)
+        for ruleset in stored.values():
+            ruleset.findings_stored = True
+
+
+def record_session(rules_text, response):
+    """Store an `AnalysisSession` and its findings and return the session."""
+    session = build_session(rules_text, response)
+    with transaction.atomic():
+        session.save()
+        store_findings([(session.ruleset, response)])
+    return session
+
+
+def session_findings(session):
+    """Return the stored findings of a session in the analysis response format."""
+    rules = {
+        (table, chain, order): _stored_rule(order, table, chain, action, raw)
+        for table, chain, order, action, raw in RulesetRule.objects.filter(
+            ruleset_id=session.ruleset_id
+        ).values_list("table", "chain", "order", "action", "raw")
+    }
+
+    findings = {Finding.REDUNDANT: [], Finding.SHADOWED: []}
+    for kind, table, chain, order in Finding.objects.filter(
+        ruleset_id=session.ruleset_id
+    ).values_list("kind", "table", "chain", "rule_order"):
+        findings[kind].append(rules[table, chain, order])
+
+    conflicts = [
+        {"rule1": rules[table, chain, order1], "rule2": rules[table, chain, order2]}
+        for table, chain, order1, order2 in ConflictPair.objects.filter(
+            ruleset_id=session.ruleset_id
+        ).values_list("table", "chain", "rule1_order", "rule2_order")
+    ]
+    return {
+        "redundant_rules": findings[Finding.REDUNDANT],
+        "shadowed_rules": findings[Finding.SHADOWED],
+        "conflicts": conflicts,
+    }
+
+
+def _stored_rule(order, table, chain, action, raw):
+    return {"order": order, "table": table, "chain": chain, "action": action, "raw": raw}
+
+
+def aggregate_metrics(metrics_list):
+    """Sum per-ruleset metrics into fleet-wide totals."""
+    totals = {
+        "rulesets": len(metrics_list),
+        "total_rules": 0,
+        "redundant_rules": 0,
+        "shadowed_rules": 0,
+        "conflicting_pairs": 0,
+        "optimized_rule_count": 0,
+    }
+    for metrics in metrics_list:
+        for name in ("total_rules", "redundant_rules", "shadowed_rules",
+                     "conflicting_pairs", "optimized_rule_count"):
+            totals[name] += metrics[name]
+
+    total = totals["total_rules"]
+    totals["reduction_ratio"] = (
+        (total - totals["optimized_rule_count"]) / total if total else 0
+    )
+    return totals
+
+
+PACKET_FIELDS = ("src", "dst", "protocol", "src_port", "dst_port", "in_iface", "out_iface")
+
+
+def packet_from_dict(data):
+    """Build a `Packet` from request data; raises ValueError if malformed."""
+    if not isinstance(data, dict):
+        raise ValueError("Expected an object")
+    fields = {name: data.get(name) for name in PACKET_FIELDS}
+    if fields["protocol"] is not None:
+        # Rule protocols are parsed in lower case.
+        fields["protocol"] = str(fields["protocol"]).lower()
+    for name in ("src", "dst"):
+        if fields[name] is not None:
+            fields[name] = str(ipaddress.ip_address(fields[name]))
+    for name in ("src_port", "dst_port"):
+        if fields[name] is not None:
+            fields[name] = int(fields[name])
+            if not 0 <= fields[name] <= 65535:
+                raise ValueError(f"{name} out of range")
+    return Packet(**fields)
+
+
+def chain_table(rule_type, rules, chain, table):
+    """Return the table whose `chain` is meant when `table` may be omitted.
+
+    iptables rules default to the `filter` table. nftables tables have no
+    default, so the table is only inferred if just one has the chain;
+    raises ValueError otherwise.
+    """
+    if table is not None:
+        return table
+    if rule_type == "iptables":
+        return "filter"
+    tables = sorted({rule.table for rule in rules if rule.chain == chain})
+    if len(tables) != 1:
+        found = ", ".join(tables) if tables else "none"
+        raise ValueError(f"Specify the table of chain {chain} (found in: {found})")
+    return tables[0]
+
+
+def classify_packets(rules_text, chain, table, packets):
+    """Return `(table, results)` for the first rule each packet hits in one chain.
+
+    Each result is `{"order", "action"}` of the matching rule, or None if
+    no rule of the chain matches (the chain policy applies). Only rules of
+    one table are used (see `chain_table`), since every table has its own
+    chains and rule order.
+    """
+    rule_type = detect_rule_type(rules_text)
+    rules = get_parser(rule_type).parse(rules_text)
+    table = chain_table(rule_type, rules, chain, table)
+    classifier = PacketClassifier([
+        rule for rule in rules if rule.chain == chain and rule.table == table
+    ])
+    return table, [
+        None if rule is None else {"order": rule.order, "action": rule.action}
+        for rule in classifier.classify_many(packets)
+    ]
+
+
+def _ndjson(record):
+    return json.dumps(record, default=str) + "\n"
+
+
+def stream_analysis(rules_text):
+    """Yield the analysis of a ruleset as newline-delimited JSON records.
+
+    Records are `start` (rule count), then one record per `redundant`,
+    `shadowed`, `conflict` and `optimized` finding, and finally `metrics`
+    with the session id. Conflict pairs are written as the detector finds
+    them and are only counted, never collected, so memory stays linear in
+    the number of rules. A cached response is replayed in the same format.
+    """
+    cached = caches["analysis"].get(_cache_key(rules_text), version=CACHE_VERSION)
+    if cached is not None:
+        yield _ndjson({"type": "start", "total_rules": cached["metrics"]["total_rules"]})
+        for rule in cached["redundant_rules"]:
+            yield _ndjson({"type": "redundant", "rule": rule})
+        for rule in cached["shadowed_rules"]:
+            yield _ndjson({"type": "shadowed", "rule": rule})
+        for pair in cached["conflicts"]:
+            yield _ndjson(dict(pair, type="conflict"))
+        for rule in cached["optimized_rules"]:
+            yield _ndjson({"type": "optimized", "rule": rule})
+        session = record_session(rules_text, cached)
+        yield _ndjson({"type": "metrics", "metrics": cached["metrics"],
+                       "cached": True, "session_id": session.id})
+        return
+
+    rule_type = detect_rule_type(rules_text)
+    rules = get_parser(rule_type).parse(rules_text)
+    yield _ndjson({"type": "start", "total_rules": len(rules)})
+
+    # The session is created first so conflict pairs can be written in
+    # batches while they are streamed; its counts are filled in at the end.
+    # Until then it is marked incomplete and left out of the history.
+    ruleset = RulesetBlob.store(rules_text)
+    session = AnalysisSession.objects.create(
+        ruleset=ruleset,
+        rule_type=rule_type,
+        total_rules=len(rules),
+        complete=False,
+    )
+    # Findings are stored once per ruleset; if they already are, this
+    # session reads those and nothing is written.
+    write = not ruleset.findings_stored
+    batch_size = getattr(settings, 'FINDINGS_BATCH_SIZE', 1000)
+    # One partition for all three detectors, so each chain is compiled once.
+    partition = ChainPartition(rules)
+    try:
+        stored_rules = {}
+        redundant = []
+        findings = []
+        for rule in iter_redundant_rules(partition):
+            redundant.append(rule)
+            record = serialize_rule(rule)
+            if write:
+                stored_rules.setdefault(_rule_key(record), _ruleset_rule(ruleset, record))
+                findings.append(_finding(ruleset, Finding.REDUNDANT, record))
+            yield _ndjson({"type": "redundant", "rule": record})
+
+        shadowed = []
+        for rule in iter_shadowed_rules(partition):
+            shadowed.append(rule)
+            record = serialize_rule(rule)
+            if write:
+                stored_rules.setdefault(_rule_key(record), _ruleset_rule(ruleset, record))
+                findings.append(_finding(ruleset, Finding.SHADOWED, record))
+            yield _ndjson({"type": "shadowed", "rule": record})
+        save_findings(list(stored_rules.values()), findings, [])
+
+        # Only rule keys are kept from here on; the rows themselves are
+        # written with each batch of pairs.
+        seen = set(stored_rules)
+        conflict_count = 0
+        new_rules = []
+        pairs = []
+        for r1, r2 in iter_conflicting_rules(partition):
+            conflict_count += 1
+            rule1, rule2 = serialize_rule(r1), serialize_rule(r2)
+            if write:
+                for record in (rule1, rule2):
+                    key = _rule_key(record)
+                    if key not in seen:
+                        seen.add(key)
+                        new_rules.append(_ruleset_rule(ruleset, record))
+                pairs.append(_conflict_pair(ruleset, rule1, rule2))
+                if len(pairs) >= batch_size:
+                    save_findings(new_rules, [], pairs)
+                    new_rules, pairs = [], []
+            yield _ndjson({"type": "conflict", "rule1": rule1, "rule2": rule2})
+        save_findings(new_rules, [], pairs)
+
+        # Conflicts were streamed rather than kept, so the metrics get the
+        # count directly instead of the length of a pair list.
+        analysis = AnalysisResult(rules=rules, redundant=redundant, shadowed=shadowed)
+        for rule in optimize_rules(rules, analysis):
+            yield _ndjson({"type": "optimized", "rule": serialize_rule(rule)})
+
+        metrics = compute_metrics(rules, analysis)
+        metrics["conflicting_pairs"] = conflict_count
+        with transaction.atomic():
+            if write:
+                RulesetBlob.objects.filter(pk=ruleset.pk).update(findings_stored=True)
+            AnalysisSession.objects.filter(pk=session.pk).update(
+                complete=True, **session_counts(metrics)
+            )
+    except BaseException:
+        # Client went away (or analysis failed): drop the partial session.
+        session.delete()
+        raise
+
+    yield _ndjson({"type": "metrics", "metrics": metrics,
+                   "cached": False, "session_id": session.id})
@@ -1,3 +1,518 @@
-from django.test import TestCase
+import json
+import time
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection, models
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from . import services
+from .models import AnalysisJob, AnalysisSession, ConflictPair, Finding, RulesetBlob, RulesetRule
+from .views import HistoryPagination
+
+IPTABLES_RULES = """*filter
+:INPUT DROP [0:0]
+-A INPUT -p tcp --dport 22 -j ACCEPT
+-A INPUT -p tcp --dport 22 -j ACCEPT
+-A INPUT -s 10.0.0.0/8 -j DROP
+-A INPUT -s 10.1.0.0/16 -p tcp -j ACCEPT
+-A INPUT -j DROP
+COMMIT
+"""
+
+NFTABLES_RULES = """table inet filter {
+    chain input {
+        type filter hook input priority 0; policy drop;
+        tcp dport 22 accept
+        tcp dport 22 accept
+        drop
+    }
+}
+"""
+
+
+class AnalysisTestCase(APITestCase):
+    def setUp(self):
+        caches["analysis"].clear()
+
+    def analyze(self, rules, **params):
+        return self.client.post("/api/analyze/", {"rules": rules}, format="json", **params)
+
+
+class AnalyzeCacheTests(AnalysisTestCase):
+    def test_second_identical_submission_is_served_from_cache(self):
+        first = self.analyze(IPTABLES_RULES)
+        second = self.analyze(IPTABLES_RULES)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertFalse(first.data["cached"])
+        self.assertTrue(second.data["cached"])
+        self.assertEqual(first.data["metrics"], second.data["metrics"])
+        self.assertNotEqual(first.data["session_id"], second.data["session_id"])
+        self.assertEqual(AnalysisSession.objects.count(), 2)
+
+    def test_comments_and_blank_lines_share_the_cache_entry(self):
+        self.analyze(IPTABLES_RULES)
+        response = self.analyze("# Generated by iptables-save\n\n" + IPTABLES_RULES + "\n")
+
+        self.assertTrue(response.data["cached"])
+
+    def test_rule_type_is_part_of_the_cache_key(self):
+        # The comment makes the raw text look like nftables, though the
+        # normalized text is the same as the plain iptables ruleset.
+        self.analyze(IPTABLES_RULES)
+        response = self.analyze("# table {\n" + IPTABLES_RULES)
+
+        self.assertFalse(response.data["cached"])
+        self.assertEqual(response.data["metrics"]["total_rules"], 0)
+
+    def test_missing_rules_are_rejected(self):
+        self.assertEqual(self.analyze("").status_code, 400)
+
+    @override_settings(ANALYSIS_CACHE_MAX_BYTES=512)
+    def test_large_responses_are_not_cached(self):
+        small = "*filter\n-A INPUT -j DROP\nCOMMIT\n"
+        batch = [small.replace("DROP", "ACCEPT"), IPTABLES_RULES]
+        self.analyze(small)
+        self.analyze(IPTABLES_RULES)
+        services.cached_analysis_many(batch)
+
+        self.assertTrue(self.analyze(small).data["cached"])
+        self.assertFalse(self.analyze(IPTABLES_RULES).data["cached"])
+        self.assertEqual([hit for _, hit in services.cached_analysis_many(batch)], [True, False])
+
+
+class BatchAnalyzeTests(AnalysisTestCase):
+    def batch(self, rulesets):
+        return self.client.post("/api/analyze/batch/", {"rulesets": rulesets}, format="json")
+
+    @override_settings(ANALYSIS_BATCH_WORKERS=2)
+    def test_results_keep_request_order(self):
+        self.analyze(NFTABLES_RULES)
+        response = self.batch([
+            {"name": "edge", "rules": IPTABLES_RULES},
+            {"name": "core", "rules": NFTABLES_RULES},
+            {"rules": IPTABLES_RULES.replace("22", "443")},
+            {"name": "edge-again", "rules": IPTABLES_RULES},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        results = response.data["results"]
+        self.assertEqual([r["name"] for r in results], ["edge", "core", "2", "edge-again"])
+        self.assertEqual([r["cached"] for r in results], [False, True, False, False])
+        self.assertEqual([r["metrics"]["total_rules"] for r in results], [5, 3, 5, 5])
+        self.assertEqual(response.data["aggregate"]["rulesets"], 4)
+        self.assertEqual(response.data["aggregate"]["total_rules"], 18)
+        self.assertEqual(AnalysisSession.objects.count(), 5)
+        # The uncached rulesets went through the shared pool.
+        self.assertIsNotNone(services._batch_pool)
+
+    def test_batch_pool_is_shared_between_requests(self):
+        self.assertIs(services.get_batch_pool(), services.get_batch_pool())
+
+    def test_ruleset_without_rules_is_rejected(self):
+        response = self.batch([{"name": "a", "rules": IPTABLES_RULES}, {"name": "b"}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(AnalysisSession.objects.count(), 0)
+
+
+class RulesetBlobTests(AnalysisTestCase):
+    def test_text_round_trips_through_each_codec(self):
+        for codec in ("zlib", "lzma"):
+            with self.subTest(codec=codec), override_settings(RULESET_COMPRESSION=codec):
+                text = IPTABLES_RULES.replace("22", codec)
+                blob = RulesetBlob.store(text)
+
+                stored = RulesetBlob.objects.get(digest=blob.digest)
+                self.assertEqual(stored.codec, codec)
+                self.assertEqual(stored.text, text)
+                self.assertEqual(stored.size, len(text.encode("utf-8")))
+
+    def test_identical_texts_are_stored_once(self):
+        blobs = RulesetBlob.store_many([IPTABLES_RULES, NFTABLES_RULES, IPTABLES_RULES])
+        again = RulesetBlob.store(IPTABLES_RULES)
+
+        self.assertEqual(RulesetBlob.objects.count(), 2)
+        self.assertEqual(blobs[0].digest, blobs[2].digest)
+        self.assertEqual(again.digest, blobs[0].digest)
+
+    def test_size_holds_multi_gigabyte_rulesets(self):
+        size = 5 * 2 ** 30
+        RulesetBlob.objects.create(digest="0" * 64, size=size, data=b"")
+
+        self.assertEqual(RulesetBlob.objects.get(digest="0" * 64).size, size)
+        self.assertIsInstance(RulesetBlob._meta.get_field("size"), models.PositiveBigIntegerField)
+
+    def test_store_many_costs_two_queries(self):
+        RulesetBlob.store(IPTABLES_RULES)
+        texts = [IPTABLES_RULES, NFTABLES_RULES] + [f"# {i}\n{IPTABLES_RULES}" for i in range(5)]
+
+        with self.assertNumQueries(2):
+            RulesetBlob.store_many(texts)
+        self.assertEqual(RulesetBlob.objects.count(), 7)
+
+    def test_session_rules_endpoint_returns_the_stored_text(self):
+        session_id = self.analyze(IPTABLES_RULES).data["session_id"]
+        self.analyze(IPTABLES_RULES)
+
+        response = self.client.get(f"/api/history/{session_id}/rules/")
+
+        self.assertEqual(response.content.decode("utf-8"), IPTABLES_RULES)
+        self.assertEqual(RulesetBlob.objects.count(), 1)
+
+
+class StreamAnalysisTests(AnalysisTestCase):
+    def stream(self, rules):
+        response = self.analyze(rules, HTTP_ACCEPT="application/x-ndjson")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        return [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+    def test_records_follow_the_documented_sequence(self):
+        records = self.stream(IPTABLES_RULES)
+
+        types = [record["type"] for record in records]
+        self.assertEqual(types[0], "start")
+        self.assertEqual(types[-1], "metrics")
+        self.assertEqual(types[1:-1], sorted(types[1:-1], key=["redundant", "shadowed", "conflict", "optimized"].index))
+        self.assertEqual(records[0]["total_rules"], 5)
+        self.assertEqual(types.count("redundant"), records[-1]["metrics"]["redundant_rules"])
+        self.assertEqual(types.count("conflict"), records[-1]["metrics"]["conflicting_pairs"])
+        self.assertFalse(records[-1]["cached"])
+
+        session = AnalysisSession.objects.get(pk=records[-1]["session_id"])
+        self.assertTrue(session.complete)
+        self.assertEqual(session.redundant_count, records[-1]["metrics"]["redundant_rules"])
+
+    def test_cached_response_is_replayed_in_the_same_format(self):
+        fresh = self.analyze(IPTABLES_RULES).data
+        records = self.stream(IPTABLES_RULES)
+
+        self.assertTrue(records[-1]["cached"])
+        self.assertEqual(records[-1]["metrics"], fresh["metrics"])
+        self.assertEqual([r["rule"] for r in records if r["type"] == "optimized"], fresh["optimized_rules"])
+
+    def test_unfinished_stream_is_hidden_and_removed(self):
+        stream = services.stream_analysis(IPTABLES_RULES)
+        next(stream)
+        next(stream)
+
+        session = AnalysisSession.objects.get()
+        self.assertFalse(session.complete)
+        self.assertEqual(self.client.get("/api/history/").data["results"], [])
+        self.assertEqual(self.client.get(f"/api/history/{session.id}/findings/").status_code, 404)
+
+        # The client went away.
+        stream.close()
+        self.assertFalse(AnalysisSession.objects.exists())
+
+
+class FindingFilterTests(AnalysisTestCase):
+    NAT_AND_FILTER = """*nat
+-A INPUT -p tcp --dport 22 -j ACCEPT
+-A INPUT -p tcp --dport 22 -j ACCEPT
+COMMIT
+*filter
+-A INPUT -p udp --dport 53 -j ACCEPT
+-A INPUT -p udp -j ACCEPT
+-A INPUT -p udp --dport 53 -j ACCEPT
+COMMIT
+"""
+
+    def history(self, **params):
+        return self.client.get("/api/history/", params).data["results"]
+
+    def test_findings_are_filtered_by_table_chain_and_rule(self):
+        with_findings = str(self.analyze(self.NAT_AND_FILTER).data["session_id"])
+        self.analyze("*filter\n-A INPUT -j DROP\nCOMMIT\n")
+
+        def ids(**params):
+            return [session["id"] for session in self.history(**params)]
+
+        self.assertEqual(ids(finding="redundant"), [with_findings])
+        self.assertEqual(ids(finding="redundant", table="nat", chain="INPUT", rule_order=2), [with_findings])
+        self.assertEqual(ids(finding="redundant", table="filter", chain="INPUT", rule_order=2), [])
+        self.assertEqual(ids(finding="redundant", table="filter", chain="INPUT", rule_order=3), [with_findings])
+        self.assertEqual(ids(finding="redundant", table="mangle"), [])
+        self.assertEqual(ids(finding="conflict"), [])
+
+    def test_stored_findings_keep_their_table(self):
+        session_id = self.analyze(self.NAT_AND_FILTER).data["session_id"]
+
+        findings = self.client.get(f"/api/history/{session_id}/findings/").data
+
+        self.assertEqual(
+            [(rule["table"], rule["order"]) for rule in findings["redundant_rules"]],
+            [("nat", 2), ("filter", 3)],
+        )
+
+    def test_sessions_of_one_ruleset_share_its_findings(self):
+        first = self.analyze(IPTABLES_RULES).data
+        rows = (Finding.objects.count(), ConflictPair.objects.count(), RulesetRule.objects.count())
+        self.assertGreater(rows[1], 0)
+
+        self.assertTrue(self.analyze(IPTABLES_RULES).data["cached"])
+        caches["analysis"].clear()
+        self.client.post("/api/analyze/batch/", {"rulesets": [{"rules": IPTABLES_RULES}]}, format="json")
+        stream = self.analyze(IPTABLES_RULES, HTTP_ACCEPT="application/x-ndjson")
+        b"".join(stream.streaming_content)
+
+        self.assertEqual(AnalysisSession.objects.filter(complete=True).count(), 4)
+        self.assertEqual(
+            (Finding.objects.count(), ConflictPair.objects.count(), RulesetRule.objects.count()), rows
+        )
+        self.assertEqual(len(self.history(finding="conflict", table="filter", chain="INPUT", rule_order=3)), 4)
+        for session in AnalysisSession.objects.all():
+            findings = self.client.get(f"/api/history/{session.id}/findings/").data
+            for name in ("redundant_rules", "shadowed_rules", "conflicts"):
+                self.assertEqual(findings[name], first[name])
+
+    def test_invalid_filters_are_rejected(self):
+        self.assertEqual(self.client.get("/api/history/", {"finding": "odd"}).status_code, 400)
+        self.assertEqual(
+            self.client.get("/api/history/", {"finding": "shadowed", "rule_order": "x"}).status_code, 400
+        )
+
+
+class ClassifyPacketsTests(APITestCase):
+    RULES = """*raw
+-A INPUT -p tcp -j DROP
+COMMIT
+*filter
+-A INPUT -s 10.0.0.0/8 -p tcp --dport 22 -j ACCEPT
+-A INPUT -p udp -j DROP
+COMMIT
+"""
+
+    NFT_RULES = """table ip nat {
+    chain input {
+        tcp dport 22 drop
+    }
+}
+table inet filter {
+    chain input {
+        tcp dport 22 accept
+    }
+    chain forward {
+        drop
+    }
+}
+"""
+
+    def classify(self, rules, packets, **data):
+        return self.client.post(
+            "/api/classify/", dict(data, rules=rules, packets=packets), format="json"
+        )
+
+    def test_iptables_chain_defaults_to_the_filter_table(self):
+        response = self.classify(self.RULES, [
+            {"src": "10.1.2.3", "protocol": "tcp", "dst_port": 22},
+            {"src": "192.0.2.1", "protocol": "UDP", "dst_port": 53},
+            {"src": "192.0.2.1", "protocol": "icmp"},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["table"], "filter")
+        self.assertEqual(response.data["results"], [
+            {"order": 1, "action": "ACCEPT"},
+            {"order": 2, "action": "DROP"},
+            None,
+        ])
+
+    def test_other_tables_are_classified_separately(self):
+        response = self.classify(self.RULES, [{"protocol": "tcp", "dst_port": 22}], table="raw")
+
+        self.assertEqual(response.data["results"], [{"order": 1, "action": "DROP"}])
+
+    def test_nftables_table_is_required_when_ambiguous(self):
+        packets = [{"protocol": "tcp", "dst_port": 22}]
+
+        self.assertEqual(self.classify(self.NFT_RULES, packets, chain="input").status_code, 400)
+        response = self.classify(self.NFT_RULES, packets, chain="input", table="inet filter")
+        self.assertEqual(response.data["results"], [{"order": 1, "action": "ACCEPT"}])
+        response = self.classify(self.NFT_RULES, packets, chain="forward")
+        self.assertEqual(response.data["table"], "inet filter")
+        self.assertEqual(response.data["results"], [{"order": 1, "action": "DROP"}])
+
+    def test_invalid_packets_are_rejected(self):
+        for packet in ({"src": "not-an-address"}, {"dst_port": 70000}, "tcp"):
+            with self.subTest(packet=packet):
+                self.assertEqual(self.classify(self.RULES, [packet]).status_code, 400)
+
+
+class AnalysisJobTests(APITransactionTestCase):
+    def setUp(self):
+        caches["analysis"].clear()
+
+    def wait_for(self, job_id):
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            job = self.client.get(f"/api/jobs/{job_id}/").data
+            if job["status"] in (AnalysisJob.DONE, AnalysisJob.FAILED):
+                return job
+            time.sleep(0.02)
+        self.fail(f"Job {job_id} did not finish")
+
+    def test_job_runs_to_completion(self):
+        response = self.client.post("/api/jobs/", {"rules": IPTABLES_RULES}, format="json")
+
+        self.assertEqual(response.status_code, 202)
+        self.assertIn(response.data["status"], (AnalysisJob.PENDING, AnalysisJob.RUNNING))
+        job = self.wait_for(response.data["job_id"])
+
+        self.assertEqual(job["status"], AnalysisJob.DONE)
+        self.assertEqual(job["progress"], 100)
+        self.assertIsNotNone(job["finished_at"])
+        self.assertEqual(job["result"]["metrics"]["total_rules"], 5)
+        self.assertEqual(job["result"]["session_id"], str(job["session"]))
+        self.assertTrue(AnalysisSession.objects.filter(pk=job["session"]).exists())
+
+    def test_failed_job_records_the_error(self):
+        with mock.patch("api.jobs.cached_analysis", side_effect=RuntimeError("parser exploded")):
+            job_id = self.client.post("/api/jobs/", {"rules": IPTABLES_RULES}, format="json").data["job_id"]
+            job = self.wait_for(job_id)
+
+        self.assertEqual(job["status"], AnalysisJob.FAILED)
+        self.assertEqual(job["error"], "parser exploded")
+        self.assertIsNone(job["session"])
+
+    def test_missing_rules_are_rejected(self):
+        self.assertEqual(self.client.post("/api/jobs/", {}, format="json").status_code, 400)
+        self.assertFalse(AnalysisJob.objects.exists())
+
+
+class HistoryTests(AnalysisTestCase):
+    def setUp(self):
+        super().setUp()
+        # Oldest first, a day apart
+        self.ids = []
+        start = timezone.make_aware(datetime(2026, 1, 1))
+        for day in range(5):
+            rules = IPTABLES_RULES.replace("22", str(day)) if day % 2 else NFTABLES_RULES + f"# {day}\n"
+            session_id = self.analyze(rules).data["session_id"]
+            AnalysisSession.objects.filter(pk=session_id).update(created_at=start + timedelta(days=day))
+            self.ids.append(str(session_id))
+
+    def ids_of(self, response):
+        return [session["id"] for session in response.data["results"]]
+
+    def test_cursor_pages_walk_the_history_newest_first(self):
+        first = self.client.get("/api/history/", {"page_size": 2})
+        second = self.client.get(first.data["next"])
+        third = self.client.get(second.data["next"])
+
+        self.assertEqual(self.ids_of(first), self.ids[::-1][:2])
+        self.assertEqual(self.ids_of(second), self.ids[::-1][2:4])
+        self.assertEqual(self.ids_of(third), self.ids[::-1][4:])
+        self.assertIsNone(third.data["next"])
+        self.assertEqual(self.ids_of(self.client.get(third.data["previous"])), self.ids[::-1][2:4])
+        self.assertNotIn("raw_rules", first.data["results"][0])
+
+    def test_page_size_is_capped(self):
+        response = self.client.get("/api/history/", {"page_size": 10000})
+
+        self.assertEqual(len(response.data["results"]), 5)
+        self.assertEqual(HistoryPagination.max_page_size, 500)
+
+    def test_rule_type_and_date_filters(self):
+        def ids(**params):
+            return self.ids_of(self.client.get("/api/history/", params))
+
+        self.assertEqual(ids(rule_type="iptables"), [self.ids[3], self.ids[1]])
+        self.assertEqual(ids(created_after="2026-01-03"), self.ids[:1:-1])
+        self.assertEqual(ids(created_before="2026-01-02T00:00:00Z"), [self.ids[0]])
+        self.assertEqual(ids(created_after="2026-01-02", created_before="2026-01-04"), [self.ids[2], self.ids[1]])
+        self.assertEqual(self.client.get("/api/history/", {"created_after": "soon"}).status_code, 400)
+
+
+class MigrationStateTests(APITestCase):
+    def test_models_have_no_unmigrated_changes(self):
+        call_command("makemigrations", "api", "--check", "--dry-run", stdout=StringIO())
+
+
+class RulesetBlobMigrationTests(TransactionTestCase):
+    before = [("api", "0003_history_indexes")]
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate(self.before)
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_raw_rules_move_to_shared_blobs(self):
+        old_apps = self.executor.loader.project_state(self.before).apps
+        OldSession = old_apps.get_model("api", "AnalysisSession")
+        OldSession.objects.create(raw_rules=IPTABLES_RULES)
+        OldSession.objects.create(raw_rules=IPTABLES_RULES)
+        OldSession.objects.create(raw_rules=NFTABLES_RULES)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+        self.assertEqual(RulesetBlob.objects.count(), 2)
+        self.assertEqual(
+            sorted(session.raw_rules for session in AnalysisSession.objects.select_related("ruleset")),
+            sorted([IPTABLES_RULES, IPTABLES_RULES, NFTABLES_RULES]),
+        )
+        self.assertEqual(AnalysisSession.objects.filter(complete=True).count(), 3)
+
+
+class FindingsMigrationTests(TransactionTestCase):
+    before = [("api", "0007_finding_session_indexes")]
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate(self.before)
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.migrate(target)
+        return executor.loader.project_state(target).apps
+
+    def test_findings_move_from_sessions_to_rulesets(self):
+        old_apps = self.executor.loader.project_state(self.before).apps
+        blob = old_apps.get_model("api", "RulesetBlob").objects.create(digest="a" * 64, data=b"")
+        OldSession = old_apps.get_model("api", "AnalysisSession")
+        sessions = [OldSession.objects.create(ruleset=blob) for _ in range(2)]
+        for session in sessions:
+            old_apps.get_model("api", "Finding").objects.create(
+                session=session, kind="redundant", rule_order=2, table="filter",
+                chain="INPUT", action="ACCEPT", raw="-A INPUT -j ACCEPT",
+            )
+            old_apps.get_model("api", "ConflictPair").objects.create(
+                session=session, table="filter", chain="INPUT",
+                rule1_order=1, rule1_action="DROP", rule1_raw="-A INPUT -s 10.0.0.0/8 -j DROP",
+                rule2_order=2, rule2_action="ACCEPT", rule2_raw="-A INPUT -j ACCEPT",
+            )
+
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+        self.assertTrue(RulesetBlob.objects.get().findings_stored)
+        self.assertEqual(Finding.objects.count(), 1)
+        self.assertEqual(ConflictPair.objects.count(), 1)
+        self.assertEqual(
+            sorted(RulesetRule.objects.values_list("order", "action")), [(1, "DROP"), (2, "ACCEPT")]
+        )
+        expected = services.session_findings(AnalysisSession.objects.first())
+        self.assertEqual(expected["redundant_rules"][0]["raw"], "-A INPUT -j ACCEPT")
+
+        old_apps = self.migrate(self.before)
+
+        OldFinding = old_apps.get_model("api", "Finding")
+        self.assertEqual(
+            sorted(OldFinding.objects.values_list("session_id", "raw")),
+            sorted((session.id, "-A INPUT -j ACCEPT") for session in sessions),
+        )
+        self.assertEqual(old_apps.get_model("api", "ConflictPair").objects.count(), 2)
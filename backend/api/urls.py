@@ -1,7 +1,22 @@
 from django.urls import path
-from .views import AnalyzeRulesView, AnalysisHistoryView
+from .views import (
+    AnalyzeRulesView,
+    BatchAnalyzeView,
+    ClassifyPacketsView,
+    AnalysisHistoryView,
+    AnalysisSessionRulesView,
+    AnalysisSessionFindingsView,
+    AnalysisJobCreateView,
+    AnalysisJobDetailView,
+)
 
 urlpatterns = [
     path("analyze/", AnalyzeRulesView.as_view()),
+    path("analyze/batch/", BatchAnalyzeView.as_view()),
+    path("classify/", ClassifyPacketsView.as_view()),
     path("history/", AnalysisHistoryView.as_view()),
+    path("history/<uuid:pk>/rules/", AnalysisSessionRulesView.as_view()),
+    path("history/<uuid:pk>/findings/", AnalysisSessionFindingsView.as_view()),
+    path("jobs/", AnalysisJobCreateView.as_view()),
+    path("jobs/<uuid:pk>/", AnalysisJobDetailView.as_view()),
 ]
@@ -1,21 +1,110 @@
+from datetime import datetime, time
+
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.settings import api_settings
+
+from .models import AnalysisJob, AnalysisSession, ConflictPair, Finding, RulesetBlob
+from .serializers import AnalysisJobSerializer, AnalysisSessionSerializer
+from .renderers import NDJSONRenderer
+from .services import (
+    aggregate_metrics,
+    build_session,
+    cached_analysis,
+    cached_analysis_many,
+    classify_packets,
+    packet_from_dict,
+    record_session,
+    session_findings,
+    store_findings,
+    stream_analysis,
+)
+from .jobs import submit_job
+from rest_framework.generics import ListAPIView, RetrieveAPIView
+
+
+class HistoryPagination(CursorPagination):
+    ordering = '-created_at'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+def parse_date_param(name, value):
+    """Parse an ISO date or datetime query parameter into an aware datetime."""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValidationError({name: "Expected an ISO date or datetime"})
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def finding_filter(params):
+    """Return a filter for sessions with a given finding, or None.
+
+    `?finding=redundant|shadowed|conflict` selects sessions with that kind
+    of finding, optionally narrowed to a `table`, a `chain` and a
+    `rule_order`. Chain names repeat across tables (`nat` and `filter`
+    both have INPUT), so `rule_order` is only meaningful with both.
+
+    Findings are stored per ruleset, so this selects the rulesets with the
+    finding through the finding indexes, then their sessions.
+    """
+    kind = params.get('finding')
+    if not kind:
+        return None
+
+    table = params.get('table')
+    chain = params.get('chain')
+    rule_order = params.get('rule_order')
+    if rule_order is not None:
+        try:
+            rule_order = int(rule_order)
+        except ValueError:
+            raise ValidationError({'rule_order': "Expected an integer"})
 
-from core.parsers.iptables_parser import IptablesParser
-from core.parsers.nftables_parser import NftablesParser
-from core.anomalies.redundancy import detect_redundant_rules
-from core.anomalies.shadowing import detect_shadowed_rules
-from core.anomalies.conflicts import detect_conflicting_rules
-from core.optimizer.rule_optimizer import optimize_rules
-from core.optimizer.rule_optimizer import optimize_rules
-from core.optimizer.metrics import compute_metrics
-from .models import AnalysisSession
-from .serializers import AnalysisSessionSerializer
-from rest_framework.generics import ListAPIView
+    if kind in (Finding.REDUNDANT, Finding.SHADOWED):
+        matches = Finding.objects.filter(kind=kind)
+        if rule_order is not None:
+            matches = matches.filter(rule_order=rule_order)
+    elif kind == 'conflict':
+        matches = ConflictPair.objects.all()
+        if rule_order is not None:
+            matches = matches.filter(Q(rule1_order=rule_order) | Q(rule2_order=rule_order))
+    else:
+        raise ValidationError({'finding': "Expected redundant, shadowed or conflict"})
+
+    if table:
+        matches = matches.filter(table=table)
+    if chain:
+        matches = matches.filter(chain=chain)
+    return Q(ruleset__in=matches.values('ruleset'))
+
+
+def wants_stream(request):
+    """Streaming is opt-in via `?stream=1` or an NDJSON `Accept` header."""
+    return (
+        request.query_params.get("stream") in ("1", "true")
+        or request.accepted_renderer.format == NDJSONRenderer.format
+    )
 
 
 class AnalyzeRulesView(APIView):
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [NDJSONRenderer]
+
     def post(self, request):
         rules_text = request.data.get("rules")
 
@@ -25,54 +114,18 @@ class AnalyzeRulesView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Auto-detect parser
-        if "table" in rules_text and "{" in rules_text:
-            parser = NftablesParser()
-        else:
-            parser = IptablesParser()
-
-        rules = parser.parse(rules_text)
-
-        def serialize_rule(rule):
-            return {
-                "order": rule.order,
-                "table": rule.table,
-                "chain": rule.chain,
-                "action": rule.action,
-                "raw": rule.raw,
-            }
-
-        response = {
-            "metrics": compute_metrics(rules),
-            "redundant_rules": [
-                serialize_rule(r) for r in detect_redundant_rules(rules)
-            ],
-            "shadowed_rules": [
-                serialize_rule(r) for r in detect_shadowed_rules(rules)
-            ],
-            "conflicts": [
-                {
-                    "rule1": serialize_rule(r1),
-                    "rule2": serialize_rule(r2)
-                }
-                for r1, r2 in detect_conflicting_rules(rules)
-            ],
-            "optimized_rules": [
-                serialize_rule(r) for r in optimize_rules(rules)
-            ]
-        }
-
-        # Save session to DB
-        metrics = response["metrics"]
-        session = AnalysisSession.objects.create(
-            raw_rules=rules_text,
-            rule_type='nftables' if isinstance(parser, NftablesParser) else 'iptables',
-            total_rules=metrics['total_rules'],
-            redundant_count=metrics['redundant_rules'],
-            shadowed_count=metrics['shadowed_rules'],
-            conflict_count=metrics['conflicting_pairs'],
-            optimized_count=metrics['optimized_rule_count']
-        )
+        if wants_stream(request):
+            return StreamingHttpResponse(
+                stream_analysis(rules_text),
+                content_type=NDJSONRenderer.media_type
+            )
+
+        # Identical rulesets are served from the analysis cache.
+        result, cache_hit = cached_analysis(rules_text)
+        response = dict(result, cached=cache_hit)
+
+        # Save session to DB (also for cached results)
+        session = record_session(rules_text, response)
         
         # Add session ID to response
         response["session_id"] = session.id
@@ -80,7 +133,180 @@ class AnalyzeRulesView(APIView):
         return Response(response, status=status.HTTP_200_OK)
 
 
+class BatchAnalyzeView(APIView):
+    """Analyse many named rulesets in one request.
+
+    Expects `{"rulesets": [{"name": ..., "rules": ...}, ...]}` and returns
+    the result for each ruleset plus aggregate metrics for all of them.
+    """
+
+    def post(self, request):
+        rulesets = request.data.get("rulesets")
+
+        if not isinstance(rulesets, list) or not rulesets:
+            return Response(
+                {"error": "No rulesets provided"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        names = []
+        texts = []
+        for index, item in enumerate(rulesets):
+            rules_text = item.get("rules") if isinstance(item, dict) else None
+            if not rules_text or not isinstance(rules_text, str):
+                return Response(
+                    {"error": f"Ruleset {index} has no firewall rules"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            names.append(str(item.get("name") or index))
+            texts.append(rules_text)
+
+        analysed = cached_analysis_many(texts)
+
+        # Save all sessions, then the findings of rulesets without stored
+        # findings yet, in bulk
+        with transaction.atomic():
+            blobs = RulesetBlob.store_many(texts)
+            sessions = AnalysisSession.objects.bulk_create([
+                build_session(text, result, blob)
+                for text, (result, _), blob in zip(texts, analysed, blobs)
+            ])
+            store_findings((blob, result) for blob, (result, _) in zip(blobs, analysed))
+
+        results = [
+            dict(result, name=name, cached=cache_hit, session_id=session.id)
+            for name, (result, cache_hit), session in zip(names, analysed, sessions)
+        ]
+        return Response(
+            {
+                "results": results,
+                "aggregate": aggregate_metrics([r["metrics"] for r in results]),
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+class ClassifyPacketsView(APIView):
+    """Find the first rule each packet hits in one chain.
+
+    Expects `{"rules": ..., "chain": "INPUT", "table": optional,
+    "packets": [{"src", "dst", "protocol", "src_port", "dst_port",
+    "in_iface", "out_iface"}, ...]}`; omitted packet fields are absent
+    from the packet. The table defaults to `filter` for iptables rules;
+    for nftables it may only be omitted if a single table has the chain.
+    """
+
+    def post(self, request):
+        rules_text = request.data.get("rules")
+        packets = request.data.get("packets")
+
+        if not rules_text:
+            return Response(
+                {"error": "No firewall rules provided"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not isinstance(packets, list) or not packets:
+            return Response(
+                {"error": "No packets provided"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        parsed = []
+        for index, item in enumerate(packets):
+            try:
+                parsed.append(packet_from_dict(item))
+            except (TypeError, ValueError) as exc:
+                return Response(
+                    {"error": f"Packet {index} is invalid: {exc}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        chain = request.data.get("chain") or "INPUT"
+        try:
+            table, results = classify_packets(rules_text, chain, request.data.get("table"), parsed)
+        except ValueError as exc:
+            return Response(
+                {"error": str(exc)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(
+            {"chain": chain, "table": table, "results": results},
+            status=status.HTTP_200_OK
+        )
+
+
 class AnalysisHistoryView(ListAPIView):
-    queryset = AnalysisSession.objects.all()
+    """Past analysis sessions, newest first, with cursor pagination.
+
+    Supports `?rule_type=iptables|nftables` and `?created_after=` /
+    `?created_before=` (ISO date or datetime) filters, and finding filters
+    such as `?finding=shadowed&table=filter&chain=INPUT&rule_order=3` (see
+    `finding_filter`). Sessions still being streamed are left out. The
+    ruleset text is stored separately and is never loaded here.
+    """
     serializer_class = AnalysisSessionSerializer
+    pagination_class = HistoryPagination
+
+    def get_queryset(self):
+        queryset = AnalysisSession.objects.filter(complete=True)
+        params = self.request.query_params
+
+        rule_type = params.get('rule_type')
+        if rule_type:
+            queryset = queryset.filter(rule_type=rule_type)
+
+        created_after = params.get('created_after')
+        if created_after:
+            queryset = queryset.filter(created_at__gte=parse_date_param('created_after', created_after))
+
+        created_before = params.get('created_before')
+        if created_before:
+            queryset = queryset.filter(created_at__lt=parse_date_param('created_before', created_before))
+
+        has_finding = finding_filter(params)
+        if has_finding is not None:
+            queryset = queryset.filter(has_finding)
+
+        return queryset
+
+
+class AnalysisSessionRulesView(APIView):
+    """Return the raw ruleset text of one session as plain text."""
+
+    def get(self, request, pk):
+        session = get_object_or_404(
+            AnalysisSession.objects.filter(complete=True).select_related('ruleset'), pk=pk
+        )
+        return HttpResponse(session.raw_rules, content_type='text/plain; charset=utf-8')
+
+
+class AnalysisSessionFindingsView(APIView):
+    """Return the stored findings of one session without re-analysing it."""
+
+    def get(self, request, pk):
+        session = get_object_or_404(AnalysisSession.objects.filter(complete=True).only('id', 'ruleset'), pk=pk)
+        return Response(dict(session_findings(session), session_id=session.id))
+
+
+class AnalysisJobCreateView(APIView):
+    """Queue an analysis and return its job id without waiting for it."""
+
+    def post(self, request):
+        rules_text = request.data.get("rules")
+
+        if not rules_text:
+            return Response(
+                {"error": "No firewall rules provided"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        job = submit_job(rules_text)
+        return Response(
+            {"job_id": job.id, "status": job.status},
+            status=status.HTTP_202_ACCEPTED
+        )
+
 
+class AnalysisJobDetailView(RetrieveAPIView):
+    queryset = AnalysisJob.objects.all()
+    serializer_class = AnalysisJobSerializer
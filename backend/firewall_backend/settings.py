@@ -108,6 +108,55 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+#
+# 'analysis' holds full /api/analyze/ responses keyed by ruleset hash.
+# Switch BACKEND to 'django.core.cache.backends.filebased.FileBasedCache'
+# (with LOCATION set to a directory) to share it between worker processes.
+# MAX_ENTRIES bounds the number of responses, ANALYSIS_CACHE_MAX_BYTES
+# (below) the size of each one.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'analysis': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'analysis-results',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {
+            'MAX_ENTRIES': 256,
+        },
+    },
+}
+
+
+# Analysis responses larger than this many bytes (pickled) are not cached,
+# so the 'analysis' cache holds at most MAX_ENTRIES times this much.
+# None caches every response.
+
+ANALYSIS_CACHE_MAX_BYTES = 1024 * 1024
+
+
+# Number of worker threads running /api/jobs/ analyses in the background.
+
+ANALYSIS_JOB_WORKERS = 2
+
+# Size of the process pool shared by all /api/analyze/batch/ requests for
+# uncached rulesets (None means one per CPU, at most 4).
+
+ANALYSIS_BATCH_WORKERS = None
+
+# Codec for newly stored ruleset text: 'zlib' (fast) or 'lzma' (smaller).
+
+RULESET_COMPRESSION = 'zlib'
+
+# Rows per INSERT when storing the findings of an analysis.
+
+FINDINGS_BATCH_SIZE = 1000
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
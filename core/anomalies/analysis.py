@@ -0,0 +1,122 @@
+"""Single-pass analysis of a rule list.
+
+`AnalysisResult` runs each anomaly detector exactly once over a rule list
+and keeps the results so that metrics, the optimizer and the API can all
+share them instead of re-running the (quadratic) detectors themselves.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional, Set, Tuple, Union
+from core.models.firewall_rule import FirewallRule
+from core.models.chain_partition import ChainPartition
+from core.anomalies.redundancy import detect_redundant_rules
+from core.anomalies.shadowing import detect_shadowed_rules
+from core.anomalies.conflicts import detect_conflicting_rules
+from core.anomalies import vectorized
+
+
+#: Detector implementations by backend name: (redundant, shadowed, conflicts).
+BACKENDS = {
+    "python": (detect_redundant_rules, detect_shadowed_rules, detect_conflicting_rules),
+    "numpy": (
+        vectorized.detect_redundant_rules,
+        vectorized.detect_shadowed_rules,
+        vectorized.detect_conflicting_rules,
+    ),
+}
+
+
+def _analyze_chain(backend: str, bucket: List[FirewallRule]):
+    """Run every detector over one chain, returning positions in `bucket`.
+
+    Used as the process-pool task: rules are pickled into the worker, so
+    results are returned as indices that the parent maps back onto its own
+    rule objects. The detectors share one partition, so the chain is
+    encoded once.
+    """
+    redundant, shadowed, conflicts = BACKENDS[backend]
+    partition = ChainPartition(bucket)
+    return (
+        [partition.position(r) for r in redundant(partition)],
+        [partition.position(r) for r in shadowed(partition)],
+        [(partition.position(a), partition.position(b)) for a, b in conflicts(partition)],
+    )
+
+
+@dataclass
+class AnalysisResult:
+    """The outcome of running every anomaly detector over a rule list.
+
+    Attributes:
+        rules: The analysed rules, in their original order.
+        redundant: Rules that are covered by an earlier rule with the same
+            action (see `detect_redundant_rules`).
+        shadowed: Rules covered by an earlier rule with a different action
+            (see `detect_shadowed_rules`).
+        conflicts: Pairs of overlapping rules with different actions
+            (see `detect_conflicting_rules`).
+    """
+
+    rules: List[FirewallRule]
+    redundant: List[FirewallRule] = field(default_factory=list)
+    shadowed: List[FirewallRule] = field(default_factory=list)
+    conflicts: List[Tuple[FirewallRule, FirewallRule]] = field(default_factory=list)
+
+    @classmethod
+    def from_rules(cls, rules: Union[List[FirewallRule], ChainPartition],
+                   backend: str = "python",
+                   workers: Optional[int] = None) -> "AnalysisResult":
+        """Run each detector once over `rules` and collect the results.
+
+        The rules are partitioned by chain once and the partition, with
+        each chain's compiled form, is shared by all detectors. `backend` selects the detector implementation
+        (see `BACKENDS`); every backend returns identical results.
+
+        With `workers` greater than 1 the chains are analysed in a
+        `ProcessPoolExecutor` of that size. Chains are independent for every
+        detector, so the merged results are the same as a serial run.
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown analysis backend: {backend!r}")
+        partition = ChainPartition.of(rules)
+        if workers is not None and workers > 1 and len(partition.chains) > 1:
+            return cls._from_partition_parallel(partition, backend, workers)
+
+        redundant, shadowed, conflicts = BACKENDS[backend]
+        return cls(
+            rules=partition.rules,
+            redundant=redundant(partition),
+            shadowed=shadowed(partition),
+            conflicts=conflicts(partition),
+        )
+
+    @classmethod
+    def _from_partition_parallel(cls, partition: ChainPartition, backend: str,
+                                 workers: int) -> "AnalysisResult":
+        # Submit the largest chains first so one long chain does not end up
+        # running alone after all the others have finished.
+        buckets = sorted(partition, key=len, reverse=True)
+        redundant: List[FirewallRule] = []
+        shadowed: List[FirewallRule] = []
+        conflicts: List[Tuple[FirewallRule, FirewallRule]] = []
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_analyze_chain, backend, bucket) for bucket in buckets]
+            for bucket, future in zip(buckets, futures):
+                red, sha, con = future.result()
+                redundant.extend(bucket[i] for i in red)
+                shadowed.extend(bucket[i] for i in sha)
+                conflicts.extend((bucket[i], bucket[j]) for i, j in con)
+
+        return cls(
+            rules=partition.rules,
+            redundant=partition.sort_rules(redundant),
+            shadowed=partition.sort_rules(shadowed),
+            conflicts=partition.sort_pairs(conflicts),
+        )
+
+    def removable_ids(self) -> Set[int]:
+        """Return the `id()` of every redundant or shadowed rule."""
+        return {id(r) for r in self.redundant} | {id(r) for r in self.shadowed}
+
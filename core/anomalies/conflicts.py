@@ -5,10 +5,14 @@ ports, protocol, interfaces) but have different actions, and neither
 fully shadows the other.
 """
 
-from typing import List, Tuple, Union
+from bisect import bisect_right
+from typing import Iterator, List, Optional, Set, Tuple, Union
 import ipaddress
 from core.models.firewall_rule import FirewallRule
+from core.models.chain_partition import ChainPartition
+from core.models.compiled_rule import CompiledRule, compile_rules
 from core.anomalies import shadowing
+from core.utils.interval_tree import IntervalIndex, port_range
 
 
 def ip_overlap(net_a: Union[ipaddress.IPv4Network, None],
@@ -65,21 +69,123 @@ def rule_conflicts(rule_a: FirewallRule, rule_b: FirewallRule) -> bool:
     return rules_overlap(rule_a, rule_b)
 
 
-def detect_conflicting_rules(rules: List[FirewallRule]) -> List[Tuple[FirewallRule, FirewallRule]]:
-    """Return a list of all pairs of conflicting rules."""
-    conflicts_list: List[Tuple[FirewallRule, FirewallRule]] = []
+class _PortPrefilter:
+    """Candidate partners for each rule of a chain based on port overlap.
+
+    Rules with a destination port are looked up in an interval tree over
+    destination ports; rules with only a source port use the source port
+    tree. Rules that leave a port unspecified overlap everything on that
+    field, so they are always returned as candidates.
+    """
+
+    def __init__(self, bucket: List[FirewallRule]):
+        self.size = len(bucket)
+        self.trees = {}
+        self.wildcards = {}
+        for field in ("dst_port", "src_port"):
+            ranges = []
+            wildcards = []
+            for position, rule in enumerate(bucket):
+                port = getattr(rule, field)
+                if port is None:
+                    wildcards.append(position)
+                else:
+                    start, end = port_range(port)
+                    ranges.append((start, end, position))
+            self.trees[field] = IntervalIndex(ranges)
+            self.wildcards[field] = wildcards
+
+    def candidates(self, rule: FirewallRule) -> List[int]:
+        """Return sorted positions of every rule whose ports may overlap."""
+        for field in ("dst_port", "src_port"):
+            port = getattr(rule, field)
+            if port is not None:
+                start, end = port_range(port)
+                found = list(self.trees[field].overlapping(start, end))
+                found.extend(self.wildcards[field])
+                found.sort()
+                return found
+        return list(range(self.size))
+
+    def later_candidates(self, position: int, rule: FirewallRule) -> List[int]:
+        """Return sorted positions after `position` whose ports may overlap."""
+        for field in ("dst_port", "src_port"):
+            port = getattr(rule, field)
+            if port is not None:
+                start, end = port_range(port)
+                found = [p for p in self.trees[field].overlapping(start, end) if p > position]
+                wildcards = self.wildcards[field]
+                found.extend(wildcards[bisect_right(wildcards, position):])
+                found.sort()
+                return found
+        return list(range(position + 1, self.size))
+
+
+def iter_conflicts_in_chain(bucket: List[FirewallRule],
+                            only: Optional[Set[int]] = None,
+                            compiled_bucket: Optional[List[CompiledRule]] = None
+                            ) -> Iterator[Tuple[FirewallRule, FirewallRule]]:
+    """Yield conflicting pairs of one chain, earlier rule first.
+
+    Without `only`, pairs are yielded sorted by the positions of both rules.
+    If `only` is given, just the pairs involving at least one of those
+    positions are produced, in no particular order. `compiled_bucket` is
+    the chain's `CompiledRule` form, if the caller already has it.
+    """
+    prefilter = _PortPrefilter(bucket)
+    compiled = compile_rules(bucket) if compiled_bucket is None else compiled_bucket
+
+    if only is None:
+        for i, c1 in enumerate(compiled):
+            for j in prefilter.later_candidates(i, bucket[i]):
+                if c1.conflicts(compiled[j]):
+                    yield (bucket[i], bucket[j])
+        return
+
+    for i in sorted(only):
+        c1 = compiled[i]
+        for j in prefilter.candidates(bucket[i]):
+            # Skip the rule itself and pairs already found from the other side.
+            if j == i or (j in only and j < i):
+                continue
+            if c1.conflicts(compiled[j]):
+                first, second = (i, j) if i < j else (j, i)
+                yield (bucket[first], bucket[second])
 
-    n = len(rules)
-    for i in range(n):
-        for j in range(i + 1, n):
-            r1 = rules[i]
-            r2 = rules[j]
 
-            # Only check rules in the same table/chain
-            if r1.table != r2.table or r1.chain != r2.chain:
-                continue
+def conflicts_in_chain(bucket: List[FirewallRule],
+                       only: Optional[Set[int]] = None,
+                       compiled_bucket: Optional[List[CompiledRule]] = None
+                       ) -> List[Tuple[FirewallRule, FirewallRule]]:
+    """List version of `iter_conflicts_in_chain`."""
+    return list(iter_conflicts_in_chain(bucket, only, compiled_bucket))
+
+
+def iter_conflicting_rules(rules: Union[List[FirewallRule], ChainPartition]
+                           ) -> Iterator[Tuple[FirewallRule, FirewallRule]]:
+    """Yield conflicting pairs as they are found, one chain at a time.
+
+    Unlike `detect_conflicting_rules` the pairs are never held in memory
+    all at once; they come out grouped by chain rather than in flat order.
+    """
+    partition = ChainPartition.of(rules)
+    for key, bucket in partition.items():
+        yield from iter_conflicts_in_chain(bucket, compiled_bucket=partition.compiled(key))
+
+
+def detect_conflicting_rules(rules: Union[List[FirewallRule], ChainPartition]
+                             ) -> List[Tuple[FirewallRule, FirewallRule]]:
+    """Return a list of all pairs of conflicting rules.
+
+    Only rules in the same table/chain are compared, so pairs are built
+    per chain rather than across the whole ruleset. Within a chain, port
+    interval trees prune pairs whose ports cannot overlap before the full
+    check, which compares the integer-encoded `CompiledRule` forms.
+    """
+    partition = ChainPartition.of(rules)
+    conflicts_list: List[Tuple[FirewallRule, FirewallRule]] = []
 
-            if rule_conflicts(r1, r2):
-                conflicts_list.append((r1, r2))
+    for key, bucket in partition.items():
+        conflicts_list.extend(conflicts_in_chain(bucket, compiled_bucket=partition.compiled(key)))
 
-    return conflicts_list
+    return partition.sort_pairs(conflicts_list)
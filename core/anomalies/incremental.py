@@ -0,0 +1,115 @@
+"""Incremental re-analysis of an edited ruleset.
+
+When only a few rules change, most anomaly results stay the same:
+
+- Whether a rule is redundant or shadowed depends only on the rules before
+  it in its chain, so results are reused for the unchanged prefix of each
+  chain and only recomputed from the first changed position on.
+- Whether two rules conflict depends only on the two rules, so pairs of
+  unchanged rules are carried over and only pairs involving an added or
+  modified rule are checked.
+
+Rules are matched between the two versions by `rule_fingerprint`, which
+ignores `order` and `raw`. `reanalyze` returns the same result as running
+`AnalysisResult.from_rules` on the new ruleset.
+"""
+
+from collections import defaultdict
+from typing import Dict, List, Tuple, Union
+from core.models.firewall_rule import FirewallRule
+from core.models.chain_partition import ChainPartition
+from core.anomalies.analysis import AnalysisResult
+from core.anomalies.redundancy import redundant_in_chain
+from core.anomalies.shadowing import shadowed_in_chain
+from core.anomalies.conflicts import conflicts_in_chain
+
+
+def rule_fingerprint(rule: FirewallRule) -> tuple:
+    """Return the fields that decide how a rule takes part in anomalies."""
+    return (
+        rule.table, rule.chain, rule.protocol, rule.src, rule.dst,
+        rule.src_port, rule.dst_port, rule.in_iface, rule.out_iface,
+        rule.action,
+    )
+
+
+def _common_prefix(old: List[tuple], new: List[tuple]) -> int:
+    length = min(len(old), len(new))
+    for i in range(length):
+        if old[i] != new[i]:
+            return i
+    return length
+
+
+def _match_rules(old_bucket: List[FirewallRule], old_prints: List[tuple],
+                 new_prints: List[tuple]) -> Dict[int, int]:
+    """Map `id()` of old rules to positions of identical new rules.
+
+    The k-th occurrence of a fingerprint in the old chain is matched with
+    the k-th occurrence in the new chain; unmatched new rules are the
+    added or modified ones.
+    """
+    new_positions: Dict[tuple, List[int]] = defaultdict(list)
+    for position, fingerprint in enumerate(new_prints):
+        new_positions[fingerprint].append(position)
+
+    matched: Dict[int, int] = {}
+    used: Dict[tuple, int] = defaultdict(int)
+    for rule, fingerprint in zip(old_bucket, old_prints):
+        positions = new_positions.get(fingerprint)
+        k = used[fingerprint]
+        if positions and k < len(positions):
+            matched[id(rule)] = positions[k]
+            used[fingerprint] = k + 1
+    return matched
+
+
+def reanalyze(previous: AnalysisResult,
+              rules: Union[List[FirewallRule], ChainPartition]) -> AnalysisResult:
+    """Return the analysis of `rules`, reusing results from `previous`."""
+    old = ChainPartition.of(previous.rules)
+    new = ChainPartition.of(rules)
+
+    old_redundant = {id(r) for r in previous.redundant}
+    old_shadowed = {id(r) for r in previous.shadowed}
+    old_conflicts: Dict[Tuple[str, str], List[Tuple[FirewallRule, FirewallRule]]] = defaultdict(list)
+    for pair in previous.conflicts:
+        old_conflicts[(pair[0].table, pair[0].chain)].append(pair)
+
+    redundant: List[FirewallRule] = []
+    shadowed: List[FirewallRule] = []
+    conflicts: List[Tuple[FirewallRule, FirewallRule]] = []
+
+    for key, bucket in new.items():
+        old_bucket = old.chains.get(key, [])
+        old_prints = [rule_fingerprint(r) for r in old_bucket]
+        new_prints = [rule_fingerprint(r) for r in bucket]
+
+        # Redundancy and shadowing: reuse the unchanged prefix.
+        prefix = _common_prefix(old_prints, new_prints)
+        for old_rule, new_rule in zip(old_bucket[:prefix], bucket):
+            if id(old_rule) in old_redundant:
+                redundant.append(new_rule)
+            if id(old_rule) in old_shadowed:
+                shadowed.append(new_rule)
+        if prefix < len(bucket):
+            compiled = new.compiled(key)
+            redundant.extend(redundant_in_chain(bucket, start=prefix, compiled_bucket=compiled))
+            shadowed.extend(shadowed_in_chain(bucket, start=prefix, compiled_bucket=compiled))
+
+        # Conflicts: carry over pairs of matched rules, recheck the rest.
+        matched = _match_rules(old_bucket, old_prints, new_prints)
+        for a, b in old_conflicts.get(key, []):
+            i, j = matched.get(id(a)), matched.get(id(b))
+            if i is not None and j is not None:
+                conflicts.append((bucket[min(i, j)], bucket[max(i, j)]))
+        changed = set(range(len(bucket))) - set(matched.values())
+        if changed:
+            conflicts.extend(conflicts_in_chain(bucket, only=changed, compiled_bucket=new.compiled(key)))
+
+    return AnalysisResult(
+        rules=new.rules,
+        redundant=new.sort_rules(redundant),
+        shadowed=new.sort_rules(shadowed),
+        conflicts=new.sort_pairs(conflicts),
+    )
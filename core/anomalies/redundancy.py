@@ -1,9 +1,12 @@
 """Utilities to detect redundant firewall rules with subnet awareness."""
 
-from typing import List, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 from core.models.firewall_rule import FirewallRule
+from core.models.chain_partition import ChainPartition
+from core.models.compiled_rule import CompiledRule, compile_rules
 import ipaddress
 from core.anomalies.shadowing import port_covers
+from core.utils.prefix_trie import NetworkIndex
 
 
 
@@ -39,20 +42,59 @@ def rules_match(new_rule: FirewallRule, existing_rule: FirewallRule) -> bool:
     )
 
 
-def detect_redundant_rules(rules: List[FirewallRule]) -> List[FirewallRule]:
-    """Return the list of rules that are duplicates (redundant) of earlier rules.
+def redundant_in_chain(bucket: List[FirewallRule], start: int = 0,
+                       compiled_bucket: Optional[List[CompiledRule]] = None) -> List[FirewallRule]:
+    """Return redundant rules of one chain, checking only positions >= `start`.
 
-    A rule is treated as redundant if it is fully contained in a previous
-    rule considering network subnets for src/dst.
+    Rules before `start` are indexed without being checked. That is safe
+    because the redundancy relation is transitive: a rule covered by an
+    earlier redundant rule is also covered by the rule that made that one
+    redundant. `compiled_bucket` is the chain's `CompiledRule` form, if
+    the caller already has it.
     """
+    if compiled_bucket is None:
+        compiled_bucket = compile_rules(bucket)
     redundant: List[FirewallRule] = []
-    seen: List[FirewallRule] = []
-
-    for rule in rules:
+    indexes: Dict[tuple, NetworkIndex[CompiledRule]] = {}
+    for position, (rule, compiled) in enumerate(zip(bucket, compiled_bucket)):
+        key = (rule.protocol, rule.in_iface, rule.out_iface, rule.action)
+        index = indexes.get(key)
         # If any previously seen rule fully covers this rule, it's redundant
-        if any(rules_match(rule, r) for r in seen):
+        if position >= start and index is not None and any(
+            seen.makes_redundant(compiled) for seen in index.candidates(rule)
+        ):
             redundant.append(rule)
-        else:
-            seen.append(rule)
+            continue
+        if index is None:
+            index = indexes[key] = NetworkIndex(wildcard_covers=False)
+        index.add(rule, compiled)
 
     return redundant
+
+
+def detect_redundant_rules(rules: Union[List[FirewallRule], ChainPartition]) -> List[FirewallRule]:
+    """Return the list of rules that are duplicates (redundant) of earlier rules.
+
+    A rule is treated as redundant if it is fully contained in a previous
+    rule considering network subnets for src/dst. Only rules of the same
+    table/chain can match, so each chain is scanned on its own.
+
+    Seen rules are indexed by the fields that must be equal (protocol,
+    interfaces, action) and then by src/dst network, so each rule is only
+    compared against seen rules whose networks already contain its own.
+    The final check uses the integer-encoded `CompiledRule` form.
+    """
+    partition = ChainPartition.of(rules)
+    redundant: List[FirewallRule] = []
+
+    for key, bucket in partition.items():
+        redundant.extend(redundant_in_chain(bucket, compiled_bucket=partition.compiled(key)))
+
+    return partition.sort_rules(redundant)
+
+
+def iter_redundant_rules(rules: Union[List[FirewallRule], ChainPartition]) -> Iterator[FirewallRule]:
+    """Yield redundant rules chain by chain as each chain is analysed."""
+    partition = ChainPartition.of(rules)
+    for key, bucket in partition.items():
+        yield from redundant_in_chain(bucket, compiled_bucket=partition.compiled(key))
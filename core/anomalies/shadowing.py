@@ -1,7 +1,10 @@
 """Detect rules that are shadowed by earlier rules, with subnet awareness."""
 
-from typing import List
+from typing import Dict, Iterator, List, Optional, Union
 from core.models.firewall_rule import FirewallRule
+from core.models.chain_partition import ChainPartition
+from core.models.compiled_rule import CompiledRule, compile_rules
+from core.utils.prefix_trie import NetworkIndex
 import ipaddress
 
 
@@ -59,24 +62,78 @@ def rule_covers(rule_a: FirewallRule, rule_b: FirewallRule) -> bool:
     return all(field_covers(getattr(rule_a, f), getattr(rule_b, f)) for f in fields)
 
 
-def detect_shadowed_rules(rules: List[FirewallRule]) -> List[FirewallRule]:
+def _covering_keys(rule: FirewallRule, actions) -> List[tuple]:
+    """Return index keys of earlier rules that may shadow `rule`.
+
+    A key is `(action, protocol, in_iface, out_iface)`. Shadowing needs a
+    different action, and each of the other fields must either be a
+    wildcard or equal to the value in `rule`.
+    """
+    return [
+        (action, protocol, in_iface, out_iface)
+        for action in actions if action != rule.action
+        for protocol in {None, rule.protocol}
+        for in_iface in {None, rule.in_iface}
+        for out_iface in {None, rule.out_iface}
+    ]
+
+
+def shadowed_in_chain(bucket: List[FirewallRule], start: int = 0,
+                      compiled_bucket: Optional[List[CompiledRule]] = None) -> List[FirewallRule]:
+    """Return shadowed rules of one chain, checking only positions >= `start`.
+
+    Rules before `start` are still indexed, so they can shadow later rules.
+    `compiled_bucket` is the chain's `CompiledRule` form, if the caller
+    already has it.
+    """
+    if compiled_bucket is None:
+        compiled_bucket = compile_rules(bucket)
+    shadowed: List[FirewallRule] = []
+    indexes: Dict[tuple, NetworkIndex[CompiledRule]] = {}
+    actions = set()
+    for position, (current, compiled) in enumerate(zip(bucket, compiled_bucket)):
+        if position >= start:
+            for key in _covering_keys(current, actions):
+                index = indexes.get(key)
+                if index is not None and any(
+                    previous.covers(compiled)
+                    for previous in index.candidates(current)
+                ):
+                    shadowed.append(current)
+                    break
+
+        key = (current.action, current.protocol, current.in_iface, current.out_iface)
+        if key not in indexes:
+            indexes[key] = NetworkIndex(wildcard_covers=True)
+        indexes[key].add(current, compiled)
+        actions.add(current.action)
+
+    return shadowed
+
+
+def detect_shadowed_rules(rules: Union[List[FirewallRule], ChainPartition]) -> List[FirewallRule]:
     """Return the list of rules that are shadowed by earlier rules.
 
     For each rule, checks previous rules in the same table/chain that have
     a different action. If any such previous rule covers the current rule,
     the current rule is shadowed.
+
+    Earlier rules are kept in `NetworkIndex` prefix tries, grouped by
+    action, protocol and interfaces, so only rules that already cover the
+    current one on those fields and on src/dst are checked in full, using
+    their integer-encoded `CompiledRule` form.
     """
+    partition = ChainPartition.of(rules)
     shadowed: List[FirewallRule] = []
 
-    for i, current in enumerate(rules):
-        for previous in rules[:i]:
-            if (
-                current.table == previous.table
-                and current.chain == previous.chain
-                and previous.action != current.action
-                and rule_covers(previous, current)
-            ):
-                shadowed.append(current)
-                break
+    for key, bucket in partition.items():
+        shadowed.extend(shadowed_in_chain(bucket, compiled_bucket=partition.compiled(key)))
 
-    return shadowed
+    return partition.sort_rules(shadowed)
+
+
+def iter_shadowed_rules(rules: Union[List[FirewallRule], ChainPartition]) -> Iterator[FirewallRule]:
+    """Yield shadowed rules chain by chain as each chain is analysed."""
+    partition = ChainPartition.of(rules)
+    for key, bucket in partition.items():
+        yield from shadowed_in_chain(bucket, compiled_bucket=partition.compiled(key))
@@ -0,0 +1,237 @@
+"""NumPy backend for the anomaly detectors.
+
+The pure-Python detectors compare rules pair by pair. This module encodes
+each chain as columnar NumPy arrays (address bounds, port bounds and
+interned protocol/interface/action ids) and evaluates the covers, overlap
+and conflict relations for a block of rows against the whole chain at
+once. The public functions mirror the ones in `redundancy`, `shadowing`
+and `conflicts` and return the same rules/pairs in the same order.
+
+NumPy is optional: importing this module works without it, but calling
+any detector raises `ImportError`.
+"""
+
+from typing import Dict, List, Tuple, Union
+from core.models.firewall_rule import FirewallRule
+from core.models.chain_partition import ChainPartition
+from core.models.compiled_rule import SymbolTable, port_bounds
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised only without numpy
+    np = None
+
+
+#: Number of rows compared against the chain per vectorised step. Memory
+#: use is roughly `BLOCK_SIZE * len(chain)` bytes per temporary matrix.
+BLOCK_SIZE = 256
+
+_MASK64 = (1 << 64) - 1
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise ImportError("The 'numpy' backend requires NumPy to be installed")
+
+
+_ADDRESS_COLUMNS = tuple(
+    f"{field}_{bound}_{half}"
+    for field in ("src", "dst") for bound in ("start", "end") for half in ("hi", "lo")
+)
+_INT_COLUMNS = (
+    "src_family", "dst_family",
+    "src_port_lo", "src_port_hi", "dst_port_lo", "dst_port_hi",
+    "protocol", "in_iface", "out_iface", "action",
+)
+
+
+def _split(address: int) -> Tuple[int, int]:
+    return address >> 64, address & _MASK64
+
+
+class ChainArrays:
+    """Columnar encoding of one chain.
+
+    Networks are stored as an address family (0 for a wildcard, 4 or 6)
+    plus 128-bit start/end addresses split into high and low `uint64`
+    halves. Ports use the wildcard-widened bounds of `CompiledRule`, and
+    protocol, interfaces and action are interned ids (0 for a wildcard).
+    """
+
+    COLUMNS = _ADDRESS_COLUMNS + _INT_COLUMNS
+
+    def __init__(self, rules: List[FirewallRule]):
+        _require_numpy()
+        symbols = SymbolTable()
+        columns: Dict[str, list] = {name: [] for name in self.COLUMNS}
+
+        for rule in rules:
+            for field in ("src", "dst"):
+                network = getattr(rule, field)
+                if network is None:
+                    family, start, end = 0, 0, 0
+                else:
+                    family = network.version
+                    start = int(network.network_address)
+                    end = int(network.broadcast_address)
+                columns[field + "_family"].append(family)
+                for name, value in (("start", start), ("end", end)):
+                    high, low = _split(value)
+                    columns[f"{field}_{name}_hi"].append(high)
+                    columns[f"{field}_{name}_lo"].append(low)
+            for field in ("src_port", "dst_port"):
+                lo, hi = port_bounds(getattr(rule, field))
+                columns[field + "_lo"].append(lo)
+                columns[field + "_hi"].append(hi)
+            for field in ("protocol", "in_iface", "out_iface", "action"):
+                columns[field].append(symbols.id(getattr(rule, field)))
+
+        self.size = len(rules)
+        for name in _ADDRESS_COLUMNS:
+            setattr(self, name, np.array(columns[name], dtype=np.uint64))
+        for name in _INT_COLUMNS:
+            setattr(self, name, np.array(columns[name], dtype=np.int32))
+
+    def view(self, start: int, stop: int, axis: int) -> Dict[str, "np.ndarray"]:
+        """Return the columns for rows `start:stop` shaped for broadcasting.
+
+        `axis=0` gives column vectors (one row per rule), `axis=1` gives row
+        vectors, so comparing the two yields a `(rows, cols)` matrix.
+        """
+        shape = (-1, 1) if axis == 0 else (1, -1)
+        return {name: getattr(self, name)[start:stop].reshape(shape) for name in self.COLUMNS}
+
+
+def _le128(a_hi, a_lo, b_hi, b_lo):
+    return (a_hi < b_hi) | ((a_hi == b_hi) & (a_lo <= b_lo))
+
+
+def _network_contains(a, b, field):
+    """`b`'s network lies inside `a`'s; both must be specific networks."""
+    return (
+        (a[field + "_family"] == b[field + "_family"]) &
+        _le128(a[field + "_start_hi"], a[field + "_start_lo"], b[field + "_start_hi"], b[field + "_start_lo"]) &
+        _le128(b[field + "_end_hi"], b[field + "_end_lo"], a[field + "_end_hi"], a[field + "_end_lo"])
+    )
+
+
+def _network_covers(a, b, field):
+    a_wild = a[field + "_family"] == 0
+    b_wild = b[field + "_family"] == 0
+    return a_wild | (~b_wild & _network_contains(a, b, field))
+
+
+def _network_overlaps(a, b, field):
+    return (
+        (a[field + "_family"] == 0) | (b[field + "_family"] == 0) |
+        ((a[field + "_family"] == b[field + "_family"]) &
+         _le128(a[field + "_start_hi"], a[field + "_start_lo"], b[field + "_end_hi"], b[field + "_end_lo"]) &
+         _le128(b[field + "_start_hi"], b[field + "_start_lo"], a[field + "_end_hi"], a[field + "_end_lo"]))
+    )
+
+
+def _ports_cover(a, b):
+    return (
+        (a["src_port_lo"] <= b["src_port_lo"]) & (b["src_port_hi"] <= a["src_port_hi"]) &
+        (a["dst_port_lo"] <= b["dst_port_lo"]) & (b["dst_port_hi"] <= a["dst_port_hi"])
+    )
+
+
+def _covers(a, b):
+    """Matrix of `shadowing.rule_covers(a, b)`."""
+    result = _network_covers(a, b, "src") & _network_covers(a, b, "dst") & _ports_cover(a, b)
+    for field in ("protocol", "in_iface", "out_iface"):
+        result &= (a[field] == 0) | (a[field] == b[field])
+    return result
+
+
+def _overlaps(a, b):
+    """Matrix of `conflicts.rules_overlap(a, b)`."""
+    result = (
+        _network_overlaps(a, b, "src") & _network_overlaps(a, b, "dst") &
+        (a["src_port_lo"] <= b["src_port_hi"]) & (b["src_port_lo"] <= a["src_port_hi"]) &
+        (a["dst_port_lo"] <= b["dst_port_hi"]) & (b["dst_port_lo"] <= a["dst_port_hi"])
+    )
+    for field in ("protocol", "in_iface", "out_iface"):
+        result &= (a[field] == 0) | (b[field] == 0) | (a[field] == b[field])
+    return result
+
+
+def _makes_redundant(a, b):
+    """Matrix of `redundancy.rules_match(b, a)` within one chain."""
+    result = _ports_cover(a, b)
+    for field in ("protocol", "in_iface", "out_iface", "action"):
+        result &= a[field] == b[field]
+    for field in ("src", "dst"):
+        a_wild = a[field + "_family"] == 0
+        b_wild = b[field + "_family"] == 0
+        result &= (a_wild & b_wild) | (~a_wild & ~b_wild & _network_contains(a, b, field))
+    return result
+
+
+def _earlier_matches(arrays: ChainArrays, relation) -> "np.ndarray":
+    """Return a mask of rules `i` with some `j < i` where `relation(j, i)`."""
+    found = np.zeros(arrays.size, dtype=bool)
+    for start in range(0, arrays.size, BLOCK_SIZE):
+        stop = min(start + BLOCK_SIZE, arrays.size)
+        current = arrays.view(start, stop, axis=0)
+        earlier = arrays.view(0, stop, axis=1)
+        matrix = relation(earlier, current)
+        # Keep only strictly earlier rules (column index < row index).
+        matrix &= np.arange(stop)[None, :] < np.arange(start, stop)[:, None]
+        found[start:stop] = matrix.any(axis=1)
+    return found
+
+
+def detect_redundant_rules(rules: Union[List[FirewallRule], ChainPartition]) -> List[FirewallRule]:
+    """NumPy version of `redundancy.detect_redundant_rules`.
+
+    The redundancy relation is transitive, so "covered by an earlier
+    non-redundant rule" is the same as "covered by any earlier rule", which
+    lets every row be decided independently.
+    """
+    partition = ChainPartition.of(rules)
+    redundant: List[FirewallRule] = []
+    for key, bucket in partition.items():
+        arrays = partition.encoded(key, ChainArrays)
+        mask = _earlier_matches(arrays, _makes_redundant)
+        redundant.extend(bucket[i] for i in np.flatnonzero(mask))
+    return partition.sort_rules(redundant)
+
+
+def detect_shadowed_rules(rules: Union[List[FirewallRule], ChainPartition]) -> List[FirewallRule]:
+    """NumPy version of `shadowing.detect_shadowed_rules`."""
+    partition = ChainPartition.of(rules)
+    shadowed: List[FirewallRule] = []
+    for key, bucket in partition.items():
+        arrays = partition.encoded(key, ChainArrays)
+        mask = _earlier_matches(
+            arrays, lambda earlier, current: (earlier["action"] != current["action"]) & _covers(earlier, current)
+        )
+        shadowed.extend(bucket[i] for i in np.flatnonzero(mask))
+    return partition.sort_rules(shadowed)
+
+
+def detect_conflicting_rules(rules: Union[List[FirewallRule], ChainPartition]
+                             ) -> List[Tuple[FirewallRule, FirewallRule]]:
+    """NumPy version of `conflicts.detect_conflicting_rules`."""
+    partition = ChainPartition.of(rules)
+    conflicts_list: List[Tuple[FirewallRule, FirewallRule]] = []
+    for key, bucket in partition.items():
+        arrays = partition.encoded(key, ChainArrays)
+        for start in range(0, arrays.size, BLOCK_SIZE):
+            stop = min(start + BLOCK_SIZE, arrays.size)
+            first = arrays.view(start, stop, axis=0)
+            second = arrays.view(start, arrays.size, axis=1)
+            matrix = (
+                (first["action"] != second["action"]) &
+                ~_covers(first, second) & ~_covers(second, first) &
+                _overlaps(first, second)
+            )
+            # Only pairs (i, j) with i < j; columns start at `start`.
+            matrix &= np.arange(start, arrays.size)[None, :] > np.arange(start, stop)[:, None]
+            rows, cols = np.nonzero(matrix)
+            conflicts_list.extend(
+                (bucket[start + i], bucket[start + j]) for i, j in zip(rows.tolist(), cols.tolist())
+            )
+    return partition.sort_pairs(conflicts_list)
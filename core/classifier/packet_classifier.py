@@ -0,0 +1,349 @@
+"""First-match packet classification over one chain.
+
+`PacketClassifier` compiles the rules of a chain into a HiCuts-style
+decision tree: every internal node cuts one numeric field (source or
+destination address, source or destination port) into a few intervals,
+and every leaf holds the short list of rules that can still match a
+packet in its region, in rule order. Looking up a packet walks down the
+tree with one `bisect` per level and then checks only the rules of one
+leaf.
+
+Compared to textbook HiCuts:
+
+- cut points are chosen from the rule boundaries inside the region
+  (equi-dense cuts) rather than at equal widths, because address ranges
+  span 2**160 values and real rules cluster in a small part of that;
+- protocol is split off first with a dictionary, since it is an exact
+  match or a wildcard, and interfaces are checked in the leaves;
+- protocols are compared by canonical name, so `-p 6` matches a `tcp`
+  packet, and an interface ending in `+` matches every name with that
+  prefix, as in iptables;
+- rules after the first rule that covers a whole region are dropped from
+  that region, since they can never be the first match there.
+
+`linear_classify` is the plain first-match scan the tree must agree with.
+"""
+
+import ipaddress
+from bisect import bisect_right
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple, Union
+from core.models.firewall_rule import FirewallRule
+from core.models.compiled_rule import (
+    ADDRESS_ANY, PORT_ANY, SymbolTable, address_range, canonical_protocol, port_bounds,
+)
+
+
+@dataclass(frozen=True)
+class Packet:
+    """The header fields a rule can match on.
+
+    Addresses are strings (IPv4 or IPv6). A field left as `None` is
+    absent from the packet, for example the ports of an ICMP packet, and
+    only matches rules that do not specify that field.
+    """
+
+    src: Optional[str] = None
+    dst: Optional[str] = None
+    protocol: Optional[str] = None
+    src_port: Optional[int] = None
+    dst_port: Optional[int] = None
+    in_iface: Optional[str] = None
+    out_iface: Optional[str] = None
+
+
+def _network_contains(network, address) -> bool:
+    return address.version == network.version and address in network
+
+
+def _port_contains(port: Union[int, Tuple[int, int]], value: int) -> bool:
+    if isinstance(port, int):
+        return port == value
+    return port[0] <= value <= port[1]
+
+
+def _interface_matches(pattern: str, name: Optional[str]) -> bool:
+    if name is None:
+        return False
+    if pattern.endswith("+"):
+        return name.startswith(pattern[:-1])
+    return name == pattern
+
+
+def rule_matches(rule: FirewallRule, packet: Packet) -> bool:
+    """Return True if `rule` matches `packet`; unspecified rule fields match anything."""
+    if rule.src is not None and (
+            packet.src is None or not _network_contains(rule.src, _address(packet.src))):
+        return False
+    if rule.dst is not None and (
+            packet.dst is None or not _network_contains(rule.dst, _address(packet.dst))):
+        return False
+    if rule.src_port is not None and (
+            packet.src_port is None or not _port_contains(rule.src_port, packet.src_port)):
+        return False
+    if rule.dst_port is not None and (
+            packet.dst_port is None or not _port_contains(rule.dst_port, packet.dst_port)):
+        return False
+    protocol = canonical_protocol(rule.protocol)
+    return (
+        (protocol is None or protocol == canonical_protocol(packet.protocol)) and
+        (rule.in_iface is None or _interface_matches(rule.in_iface, packet.in_iface)) and
+        (rule.out_iface is None or _interface_matches(rule.out_iface, packet.out_iface))
+    )
+
+
+def linear_classify(rules: Sequence[FirewallRule], packet: Packet) -> Optional[FirewallRule]:
+    """Return the first rule matching `packet`, scanning `rules` in order."""
+    for rule in rules:
+        if rule_matches(rule, packet):
+            return rule
+    return None
+
+
+@lru_cache(maxsize=65536)
+def _address(text: str):
+    return ipaddress.ip_address(text)
+
+
+@lru_cache(maxsize=65536)
+def _address_key(text: Optional[str]) -> int:
+    """Encode an address like `CompiledRule` does; a missing one as -1."""
+    if text is None:
+        return -1
+    return address_range(ipaddress.ip_network(_address(text)))[0]
+
+
+def _port_key(port: Optional[int]) -> int:
+    return -1 if port is None else port
+
+
+# Leaf entries are flat tuples: the (lo, hi) range of each numeric field
+# at positions 2 * dim and 2 * dim + 1, the two interface ids, the rule's
+# position in the chain and the rule. A wildcard interface such as `eth+`
+# has an id of its own, which a packet matches through `_interface_ids`.
+_IN, _OUT, _POSITION, _RULE = 8, 9, 10, 11
+_FULL_REGION = (ADDRESS_ANY, ADDRESS_ANY, PORT_ANY, PORT_ANY)
+_V4_SIZE = 1 << 32
+
+
+def _is_large(dim: int, lo: int, hi: int) -> bool:
+    """Return True if a range spans at least half of its field."""
+    if dim < 2:
+        if (lo, hi) == ADDRESS_ANY:
+            return True
+        family_size = _V4_SIZE if lo < _V4_SIZE else 1 << 128
+        return hi - lo + 1 >= family_size // 2
+    return hi - lo + 1 >= 32768
+
+
+class PacketClassifier:
+    """A decision tree answering "which rule does this packet hit first?".
+
+    Build it from the rules of one chain, in order. `binth` is the leaf
+    size below which nodes are not cut further, `max_cuts` the largest
+    number of children per node and `spfac` bounds how many rule copies
+    a cut may create (HiCuts' space factor). `max_depth` caps the tree
+    height for pathological rulesets.
+
+    As in EffiCuts, rules are first separated by which fields they leave
+    (nearly) unrestricted, and each group gets its own tree: a rule that
+    is a wildcard on the field being cut would otherwise be copied into
+    every child. A lookup searches every tree of the packet's protocol
+    and keeps the earliest match.
+    """
+
+    def __init__(self, rules: Iterable[FirewallRule], binth: int = 8,
+                 max_cuts: int = 16, spfac: float = 2.0, max_depth: int = 24):
+        self.rules: List[FirewallRule] = list(rules)
+        self.binth = binth
+        self.max_cuts = max_cuts
+        self.spfac = spfac
+        self.max_depth = max_depth
+        self.node_count = 0
+        self.depth = 0
+
+        self._symbols = SymbolTable()
+        self._wildcards: List[Tuple[str, int]] = []
+        self._interfaces: Dict[str, FrozenSet[int]] = {}
+        entries = []
+        protocols = {0}
+        for position, rule in enumerate(self.rules):
+            src, dst = address_range(rule.src), address_range(rule.dst)
+            sport, dport = port_bounds(rule.src_port), port_bounds(rule.dst_port)
+            entry = (
+                src[0], src[1], dst[0], dst[1],
+                sport[0], sport[1], dport[0], dport[1],
+                self._symbols.id(rule.in_iface), self._symbols.id(rule.out_iface),
+                position, rule,
+            )
+            for name in (rule.in_iface, rule.out_iface):
+                if name is not None and name.endswith("+"):
+                    self._wildcards.append((name[:-1], self._symbols.id(name)))
+            protocol = self._symbols.id(canonical_protocol(rule.protocol))
+            entries.append((protocol, entry))
+            protocols.add(protocol)
+
+        # Trees per protocol hold that protocol's rules and the protocol
+        # wildcards; key 0 (wildcards only) serves every other protocol
+        # and packets without one.
+        self._roots = {}
+        for protocol in protocols:
+            groups = {}
+            for p, entry in entries:
+                if p == 0 or p == protocol:
+                    shape = tuple(_is_large(dim, entry[2 * dim], entry[2 * dim + 1]) for dim in range(4))
+                    groups.setdefault(shape, []).append(entry)
+            self._roots[protocol] = [
+                self._build(group, _FULL_REGION, 0) for group in groups.values()
+            ]
+
+    def classify(self, packet: Packet) -> Optional[FirewallRule]:
+        """Return the first rule matching `packet`, or None."""
+        key = (_address_key(packet.src), _address_key(packet.dst),
+               _port_key(packet.src_port), _port_key(packet.dst_port))
+        in_iface = self._interface_ids(packet.in_iface)
+        out_iface = self._interface_ids(packet.out_iface)
+        protocol = self._symbols.lookup(canonical_protocol(packet.protocol))
+
+        best = None
+        limit = len(self.rules)
+        for tree in self._roots.get(protocol, self._roots[0]):
+            entry = self._lookup(tree, key, in_iface, out_iface, limit)
+            if entry is not None:
+                best = entry
+                limit = entry[_POSITION]
+        return best[_RULE] if best is not None else None
+
+    def classify_many(self, packets: Iterable[Packet]) -> List[Optional[FirewallRule]]:
+        """Classify each packet, in order."""
+        return [self.classify(packet) for packet in packets]
+
+    def _interface_ids(self, name: Optional[str]) -> FrozenSet[int]:
+        """Return the ids of every rule interface that matches `name`."""
+        if name is None:
+            return frozenset()
+        ids = self._interfaces.get(name)
+        if ids is None:
+            ids = {self._symbols.lookup(name)}
+            ids.update(id_ for prefix, id_ in self._wildcards if name.startswith(prefix))
+            ids = self._interfaces[name] = frozenset(ids)
+        return ids
+
+    @staticmethod
+    def _lookup(node, key, in_iface, out_iface, limit):
+        """Return the first leaf entry matching `key` positioned before `limit`."""
+        while node.__class__ is tuple:
+            dim, bounds, children = node
+            node = children[bisect_right(bounds, key[dim])]
+
+        src, dst, sport, dport = key
+        for entry in node:
+            if entry[_POSITION] >= limit:
+                return None
+            if (entry[0] <= src <= entry[1] and entry[2] <= dst <= entry[3] and
+                    entry[4] <= sport <= entry[5] and entry[6] <= dport <= entry[7] and
+                    (entry[_IN] == 0 or entry[_IN] in in_iface) and
+                    (entry[_OUT] == 0 or entry[_OUT] in out_iface)):
+                return entry
+        return None
+
+    def _build(self, entries, region, depth):
+        """Return a leaf (list of entries) or an internal `(dim, bounds, children)` node."""
+        self.node_count += 1
+        self.depth = max(self.depth, depth)
+        entries = _prune(entries, region)
+        if len(entries) <= self.binth or depth >= self.max_depth:
+            return entries
+
+        best = None
+        for dim in range(4):
+            points = _cut_points(entries, region, dim)
+            if not points:
+                continue
+            # HiCuts heuristic: prefer the field whose median cut leaves
+            # the smallest largest child.
+            halves = _split(entries, dim, [points[len(points) // 2]])
+            score = max(len(half) for half in halves)
+            if best is None or score < best[0]:
+                best = (score, dim, points)
+        if best is None:
+            return entries
+        _, dim, points = best
+
+        # Double the number of cuts while the rule copies stay within budget.
+        bounds = _spread(points, 2)
+        children = _split(entries, dim, bounds)
+        cuts = 2
+        while cuts * 2 <= self.max_cuts and cuts < len(points) + 1:
+            wider = _spread(points, cuts * 2)
+            wider_children = _split(entries, dim, wider)
+            if sum(map(len, wider_children)) > self.spfac * len(entries) + cuts * 2:
+                break
+            bounds, children, cuts = wider, wider_children, cuts * 2
+
+        # Merge neighbouring children that hold the same rules.
+        merged_bounds = []
+        merged_children = [children[0]]
+        for bound, child in zip(bounds, children[1:]):
+            previous = merged_children[-1]
+            if len(child) == len(previous) and all(a is b for a, b in zip(child, previous)):
+                continue
+            merged_bounds.append(bound)
+            merged_children.append(child)
+
+        lo, hi = region[dim]
+        edges = [lo] + merged_bounds + [hi + 1]
+        nodes = []
+        for i, child in enumerate(merged_children):
+            child_region = list(region)
+            child_region[dim] = (edges[i], edges[i + 1] - 1)
+            nodes.append(self._build(child, tuple(child_region), depth + 1))
+        return (dim, merged_bounds, nodes)
+
+
+def _prune(entries, region):
+    """Drop entries after the first one that matches the whole region.
+
+    Such an entry has wildcard interfaces and covers the region on every
+    numeric field, so no later entry can be the first match in it.
+    """
+    for index, entry in enumerate(entries):
+        if entry[_IN] == 0 and entry[_OUT] == 0 and all(
+            entry[2 * dim] <= lo and hi <= entry[2 * dim + 1]
+            for dim, (lo, hi) in enumerate(region)
+        ):
+            return entries[:index + 1]
+    return entries
+
+
+def _cut_points(entries, region, dim) -> List[int]:
+    """Return sorted rule boundaries strictly inside the region on `dim`."""
+    lo, hi = region[dim]
+    points = set()
+    for entry in entries:
+        start, end = entry[2 * dim], entry[2 * dim + 1] + 1
+        if lo < start <= hi:
+            points.add(start)
+        if lo < end <= hi:
+            points.add(end)
+    return sorted(points)
+
+
+def _spread(points: List[int], cuts: int) -> List[int]:
+    """Pick `cuts - 1` boundaries evenly spaced through `points`."""
+    if cuts - 1 >= len(points):
+        return list(points)
+    step = len(points) / cuts
+    return sorted({points[int(step * i)] for i in range(1, cuts)})
+
+
+def _split(entries, dim, bounds):
+    """Distribute entries over the intervals delimited by `bounds`, keeping order."""
+    children = [[] for _ in range(len(bounds) + 1)]
+    for entry in entries:
+        first = bisect_right(bounds, entry[2 * dim])
+        last = bisect_right(bounds, entry[2 * dim + 1])
+        for index in range(first, last + 1):
+            children[index].append(entry)
+    return children
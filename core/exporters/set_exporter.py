@@ -0,0 +1,211 @@
+"""Rewrite long runs of similar rules into rules matching a set.
+
+A run of rules that differ only in one address or port still costs the
+kernel one match per rule. `export_sets` replaces each such run (found the
+same way as `rule_merger` finds mergeable runs) with a single rule that
+matches a set, which the kernel looks up by hash or interval tree:
+
+- for iptables, an ipset (`hash:net` for addresses, `bitmap:port` for
+  ports) referenced with `-m set --match-set NAME src|dst`;
+- for nftables, a named set referenced as `@NAME`.
+
+The result can be written as `ipset restore` plus `iptables-restore`
+input, or as an `nft -f` script. Built-in chain policies are not part of
+the parsed rules, so the output leaves them as they are.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+from core.models.firewall_rule import FirewallRule
+from core.models.chain_partition import ChainKey, ChainPartition
+from core.optimizer.rule_merger import (
+    can_combine, format_value, iter_runs, merge_networks, merge_ports,
+)
+
+IPTABLES = "iptables"
+NFTABLES = "nftables"
+
+BUILTIN_CHAINS = frozenset({"INPUT", "OUTPUT", "FORWARD", "PREROUTING", "POSTROUTING"})
+
+#: `-j` targets that are not chains: the standard verdicts and the target
+#: extensions of iptables-extensions(8).
+TARGET_EXTENSIONS = frozenset({
+    "ACCEPT", "DROP", "QUEUE", "RETURN",
+    "AUDIT", "CHECKSUM", "CLASSIFY", "CLUSTERIP", "CONNMARK", "CONNSECMARK",
+    "CT", "DNAT", "DNPT", "DSCP", "ECN", "HL", "HMARK", "IDLETIMER", "LED",
+    "LOG", "MARK", "MASQUERADE", "MIRROR", "NETMAP", "NFLOG", "NFQUEUE",
+    "NOTRACK", "RATEEST", "REDIRECT", "REJECT", "SAME", "SECMARK", "SET",
+    "SNAT", "SNPT", "SYNPROXY", "TCPMSS", "TCPOPTSTRIP", "TEE", "TOS",
+    "TPROXY", "TRACE", "TTL", "ULOG",
+})
+
+# ipset limits set names to 31 characters.
+_MAX_NAME = 31
+
+
+@dataclass
+class NamedSet:
+    """A set of addresses or ports that replaces a run of rules.
+
+    `family` is 4 or 6 for address sets and None for port sets;
+    `elements` are networks or ports/port ranges, without overlaps.
+    """
+
+    name: str
+    table: str
+    field: str
+    family: Optional[int]
+    elements: list
+
+    def is_address_set(self) -> bool:
+        return self.family is not None
+
+
+@dataclass
+class SetExport:
+    """Rules of each chain, rewritten to use `sets`, in their original order."""
+
+    syntax: str
+    chains: Dict[ChainKey, List[str]] = field(default_factory=dict)
+    sets: List[NamedSet] = field(default_factory=list)
+
+    @property
+    def rule_count(self) -> int:
+        return sum(len(lines) for lines in self.chains.values())
+
+    def ipset_restore(self) -> str:
+        """Return input for `ipset restore` creating and filling every set."""
+        self._require(IPTABLES)
+        lines = []
+        for named in self.sets:
+            if named.is_address_set():
+                family = "inet" if named.family == 4 else "inet6"
+                lines.append(f"create {named.name} hash:net family {family} -exist")
+            else:
+                lines.append(f"create {named.name} bitmap:port range 0-65535 -exist")
+            lines.append(f"flush {named.name}")
+            lines.extend(f"add {named.name} {_element(value)}" for value in named.elements)
+        return "\n".join(lines) + "\n"
+
+    def iptables_restore(self) -> str:
+        """Return input for `iptables-restore` with the rewritten rules."""
+        self._require(IPTABLES)
+        return iptables_restore(self.chains)
+
+    def nft_script(self) -> str:
+        """Return an `nft -f` script defining the sets and replacing each chain's rules."""
+        self._require(NFTABLES)
+        lines = []
+        for named in self.sets:
+            kind = {4: "ipv4_addr", 6: "ipv6_addr", None: "inet_service"}[named.family]
+            lines.append(f"add set {named.table} {named.name} {{ type {kind}; flags interval; }}")
+            lines.append(f"flush set {named.table} {named.name}")
+            elements = ", ".join(_element(value) for value in named.elements)
+            lines.append(f"add element {named.table} {named.name} {{ {elements} }}")
+        for (table, chain), rules in self.chains.items():
+            lines.append(f"flush chain {table} {chain}")
+            lines.extend(f"add rule {table} {chain} {rule}" for rule in rules)
+        return "\n".join(lines) + "\n"
+
+    def _require(self, syntax: str) -> None:
+        if self.syntax != syntax:
+            raise ValueError(f"Cannot write {syntax} output for {self.syntax} rules")
+
+
+def jump_targets(lines: Iterable[str]) -> List[str]:
+    """Return the user-defined chains that `-j`/`-g` options of `lines` refer to.
+
+    Chains are listed once, in order of first use.
+    """
+    targets: Dict[str, None] = {}
+    for line in lines:
+        tokens = line.split()
+        for option, target in zip(tokens, tokens[1:]):
+            if (option in ("-j", "--jump", "-g", "--goto")
+                    and target not in TARGET_EXTENSIONS and target not in BUILTIN_CHAINS):
+                targets[target] = None
+    return list(targets)
+
+
+def iptables_restore(chains: Dict[ChainKey, List[str]]) -> str:
+    """Return `iptables-restore` input for the given `-A ...` lines of each chain.
+
+    User-defined chains are declared before any rule, including chains
+    that have no rules but are jumped to; built-in chains keep their
+    current policy.
+    """
+    tables: Dict[str, List[ChainKey]] = {}
+    for key in chains:
+        tables.setdefault(key[0], []).append(key)
+
+    lines = []
+    for table, keys in tables.items():
+        declared = [chain for _, chain in keys if chain not in BUILTIN_CHAINS]
+        targets = jump_targets(line for key in keys for line in chains[key])
+        declared += [chain for chain in targets if chain not in declared]
+        lines.append(f"*{table}")
+        lines.extend(f":{chain} - [0:0]" for chain in declared)
+        for key in keys:
+            lines.extend(chains[key])
+        lines.append("COMMIT")
+    return "\n".join(lines) + "\n"
+
+
+def _element(value) -> str:
+    # Both ipset and nft write port ranges as start-end.
+    return format_value(value, "dport")
+
+
+def _set_name(prefix: str, chain: str, field_name: str, number: int) -> str:
+    suffix = f"_{field_name}_{number}"
+    base = re.sub(r"[^A-Za-z0-9_]", "_", f"{prefix}_{chain}")
+    return base[:_MAX_NAME - len(suffix)] + suffix
+
+
+def _syntax(rules: List[FirewallRule]) -> str:
+    if rules and not rules[0].raw.startswith("-A"):
+        return NFTABLES
+    return IPTABLES
+
+
+def export_sets(rules: List[FirewallRule], min_size: int = 4, prefix: str = "fw") -> SetExport:
+    """Replace runs of at least `min_size` similar rules with set matches.
+
+    Only runs whose rules can be combined without changing what any packet
+    does are replaced (see `rule_merger.can_combine`). Address runs must
+    also be of a single address family.
+    """
+    partition = ChainPartition.of(rules)
+    result = SetExport(syntax=_syntax(partition.rules))
+
+    for (table, chain), bucket in partition.items():
+        lines: List[str] = []
+        for run, field_name, template in iter_runs(bucket):
+            values = [getattr(rule, field_name) for rule in run] if field_name else []
+            address = field_name in ("src", "dst")
+            families = {value.version for value in values} if address else {None}
+            if (field_name is None or len(run) < min_size or len(families) != 1
+                    or not can_combine(run, field_name)):
+                lines.extend(rule.raw for rule in run)
+                continue
+
+            name = _set_name(prefix, chain, field_name, len(result.sets) + 1)
+            result.sets.append(NamedSet(
+                name=name,
+                table=table,
+                field=field_name,
+                family=families.pop(),
+                elements=merge_networks(values) if address else merge_ports(values),
+            ))
+
+            _, head, tail = template
+            if result.syntax == IPTABLES:
+                direction = "src" if field_name in ("src", "src_port") else "dst"
+                match = head[:-1] + ("-m", "set", "--match-set", name, direction)
+            else:
+                match = head + (f"@{name}",)
+            lines.append(" ".join(match + tail))
+        result.chains[(table, chain)] = lines
+
+    return result
@@ -0,0 +1,199 @@
+"""Rewrite nftables dispatch runs as verdict maps.
+
+Chains such as::
+
+    tcp dport 22 accept
+    tcp dport 80 accept
+    tcp dport 23 drop
+    iifname "lan0" jump from_lan
+    iifname "wan0" jump from_wan
+
+make the kernel test every rule in turn. `export_vmaps` replaces each run
+of adjacent rules that test the same key (the same text before the value)
+and end in a plain verdict with one rule using an anonymous verdict map,
+which nftables looks up in a single step::
+
+    tcp dport vmap { 22 : accept, 80 : accept, 23 : drop }
+
+A run only extends while its values do not overlap, so every packet
+matches at most one rule of the run. That makes the map equivalent to the
+rules even for `jump`, where evaluation would otherwise carry on with
+the next rule of the run. Negated matches, anonymous sets, interface
+wildcards and rules with statements between the value and the verdict
+(`counter`, `log`, ...) are left as they are.
+
+Like `set_exporter`, the `nft -f` script flushes and refills each chain
+from the parsed rules, so lines the parser does not keep (rules without
+a verdict) are not carried over.
+"""
+
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from core.models.firewall_rule import FirewallRule
+from core.models.chain_partition import ChainKey, ChainPartition
+from core.models.compiled_rule import address_range, port_bounds
+
+#: Verdicts allowed as verdict-map values; `jump` and `goto` take a chain.
+VERDICTS = frozenset({"accept", "drop", "return", "continue"})
+CHAIN_VERDICTS = frozenset({"jump", "goto"})
+
+#: Key expressions a run may dispatch on, and the rule field holding the value.
+DISPATCH_KEYS = {
+    ("tcp", "dport"): "dst_port",
+    ("udp", "dport"): "dst_port",
+    ("tcp", "sport"): "src_port",
+    ("udp", "sport"): "src_port",
+    ("ip", "saddr"): "src",
+    ("ip", "daddr"): "dst",
+    ("ip6", "saddr"): "src",
+    ("ip6", "daddr"): "dst",
+    ("iifname",): "in_iface",
+    ("oifname",): "out_iface",
+}
+
+Dispatch = Tuple[Tuple[str, ...], Tuple[str, ...], str, str]
+
+
+@dataclass
+class VerdictMap:
+    """One verdict map: the chain it replaces rules in and its `value : verdict` elements."""
+
+    table: str
+    chain: str
+    key: str
+    elements: List[Tuple[str, str]]
+
+
+@dataclass
+class VmapExport:
+    """Rules of each chain with dispatch runs replaced by `maps`, in order."""
+
+    chains: Dict[ChainKey, List[str]] = field(default_factory=dict)
+    maps: List[VerdictMap] = field(default_factory=list)
+    replaced: int = 0
+
+    @property
+    def rule_count(self) -> int:
+        return sum(len(lines) for lines in self.chains.values())
+
+    def nft_script(self) -> str:
+        """Return an `nft -f` script replacing each chain's rules."""
+        lines = []
+        for (table, chain), rules in self.chains.items():
+            lines.append(f"flush chain {table} {chain}")
+            lines.extend(f"add rule {table} {chain} {rule}" for rule in rules)
+        return "\n".join(lines) + "\n"
+
+
+def dispatch_of(rule: FirewallRule) -> Optional[Dispatch]:
+    """Split a rule into `(head, key, value, verdict)`, or return None.
+
+    The rule must read `<head> <key> <value> <verdict>`, with a key from
+    `DISPATCH_KEYS` whose value the parser understood.
+    """
+    tokens = rule.raw.split()
+    if len(tokens) >= 2 and tokens[-2] in CHAIN_VERDICTS:
+        verdict = tokens[-2:]
+    elif tokens and tokens[-1] in VERDICTS:
+        verdict = tokens[-1:]
+    else:
+        return None
+
+    end = len(tokens) - len(verdict) - 1
+    if end < 1 or "!=" in tokens or "!" in tokens:
+        return None
+    value = tokens[end]
+    if any(char in value for char in "{},*@$"):
+        return None
+    for width in (2, 1):
+        key = tuple(tokens[end - width:end])
+        if end >= width and key in DISPATCH_KEYS:
+            if getattr(rule, DISPATCH_KEYS[key]) is None:
+                return None
+            if key[0].endswith("ifname") and not value.startswith('"'):
+                value = f'"{value}"'
+            return tuple(tokens[:end - width]), key, value, " ".join(verdict)
+    return None
+
+
+def _value_range(rule: FirewallRule, field_name: str):
+    value = getattr(rule, field_name)
+    if field_name in ("src", "dst"):
+        return address_range(value)
+    return port_bounds(value)
+
+
+class _Disjoint:
+    """Values of a run so far; `add` refuses a value overlapping one of them."""
+
+    def __init__(self):
+        self.names = set()
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+
+    def add(self, rule: FirewallRule, field_name: str) -> bool:
+        if field_name.endswith("iface"):
+            name = getattr(rule, field_name)
+            if name in self.names:
+                return False
+            self.names.add(name)
+            return True
+        lo, hi = _value_range(rule, field_name)
+        index = bisect_right(self.starts, hi)
+        if index and self.ends[index - 1] >= lo:
+            return False
+        self.starts.insert(index, lo)
+        self.ends.insert(index, hi)
+        return True
+
+
+def _runs(bucket: List[FirewallRule]):
+    """Yield `(rules, dispatches)` for maximal disjoint runs sharing head and key."""
+    i = 0
+    while i < len(bucket):
+        first = dispatch_of(bucket[i])
+        if first is None:
+            yield [bucket[i]], None
+            i += 1
+            continue
+        field_name = DISPATCH_KEYS[first[1]]
+        seen = _Disjoint()
+        seen.add(bucket[i], field_name)
+        dispatches = [first]
+        end = i + 1
+        while end < len(bucket):
+            current = dispatch_of(bucket[end])
+            if (current is None or current[:2] != first[:2] or
+                    not seen.add(bucket[end], field_name)):
+                break
+            dispatches.append(current)
+            end += 1
+        yield bucket[i:end], dispatches
+        i = end
+
+
+def export_vmaps(rules: List[FirewallRule], min_size: int = 3) -> VmapExport:
+    """Replace dispatch runs of at least `min_size` rules with verdict maps.
+
+    Raises ValueError for rules that are not nftables rules.
+    """
+    partition = ChainPartition.of(rules)
+    if partition.rules and partition.rules[0].raw.startswith("-A"):
+        raise ValueError("Verdict maps can only be generated from nftables rules")
+
+    result = VmapExport()
+    for (table, chain), bucket in partition.items():
+        lines: List[str] = []
+        for run, dispatches in _runs(bucket):
+            if dispatches is None or len(run) < min_size:
+                lines.extend(rule.raw for rule in run)
+                continue
+            head, key = dispatches[0][:2]
+            elements = [(value, verdict) for _, _, value, verdict in dispatches]
+            result.maps.append(VerdictMap(table=table, chain=chain, key=" ".join(key), elements=elements))
+            result.replaced += len(run)
+            body = ", ".join(f"{value} : {verdict}" for value, verdict in elements)
+            lines.append(" ".join(head + key + ("vmap", f"{{ {body} }}")))
+        result.chains[(table, chain)] = lines
+    return result
@@ -0,0 +1,83 @@
+"""Chain-partitioned view over a flat rule list.
+
+Every anomaly detector only ever compares rules that live in the same
+`(table, chain)`. `ChainPartition` groups a rule list into per-chain
+buckets once, so the detectors can do their pairwise work inside each
+bucket instead of across the whole ruleset, while still being able to
+report results in the original (flat) rule order.
+
+Encoded forms of a chain (`CompiledRule` lists, NumPy arrays) are built
+once per partition with `encoded` and shared by every detector that runs
+over it.
+"""
+
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple, TypeVar, Union
+from core.models.firewall_rule import FirewallRule
+from core.models.compiled_rule import CompiledRule, compile_rules
+
+
+ChainKey = Tuple[str, str]
+T = TypeVar("T")
+
+
+class ChainPartition:
+    """Rules grouped into `(table, chain)` buckets.
+
+    Buckets keep the relative order of their rules, and are themselves
+    ordered by the first appearance of the chain in the input. The flat
+    position of every rule is remembered so callers can restore the
+    original ordering of per-chain results with `sort_rules` and
+    `sort_pairs`.
+    """
+
+    def __init__(self, rules: Iterable[FirewallRule]):
+        self.rules: List[FirewallRule] = list(rules)
+        self.chains: Dict[ChainKey, List[FirewallRule]] = {}
+        self._positions: Dict[int, int] = {}
+        self._encoded: Dict[Tuple[Callable, ChainKey], Any] = {}
+
+        for position, rule in enumerate(self.rules):
+            self.chains.setdefault((rule.table, rule.chain), []).append(rule)
+            self._positions[id(rule)] = position
+
+    @classmethod
+    def of(cls, rules: Union[Iterable[FirewallRule], "ChainPartition"]) -> "ChainPartition":
+        """Return `rules` unchanged if already partitioned, else partition it."""
+        if isinstance(rules, cls):
+            return rules
+        return cls(rules)
+
+    def __iter__(self) -> Iterator[List[FirewallRule]]:
+        """Iterate over the per-chain rule buckets."""
+        return iter(self.chains.values())
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def items(self) -> Iterable[Tuple[ChainKey, List[FirewallRule]]]:
+        """Return `((table, chain), bucket)` pairs."""
+        return self.chains.items()
+
+    def encoded(self, key: ChainKey, encode: Callable[[List[FirewallRule]], T]) -> T:
+        """Return `encode(bucket)` for one chain, computed once per partition."""
+        found = self._encoded.get((encode, key))
+        if found is None:
+            found = self._encoded[(encode, key)] = encode(self.chains[key])
+        return found
+
+    def compiled(self, key: ChainKey) -> List[CompiledRule]:
+        """Return the `CompiledRule` form of one chain, in bucket order."""
+        return self.encoded(key, compile_rules)
+
+    def position(self, rule: FirewallRule) -> int:
+        """Return the index of `rule` in the original flat list."""
+        return self._positions[id(rule)]
+
+    def sort_rules(self, rules: Iterable[FirewallRule]) -> List[FirewallRule]:
+        """Return `rules` sorted by their original flat position."""
+        return sorted(rules, key=self.position)
+
+    def sort_pairs(self, pairs: Iterable[Tuple[FirewallRule, FirewallRule]]
+                   ) -> List[Tuple[FirewallRule, FirewallRule]]:
+        """Return rule pairs sorted by the flat positions of both members."""
+        return sorted(pairs, key=lambda p: (self.position(p[0]), self.position(p[1])))
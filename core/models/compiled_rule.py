@@ -0,0 +1,218 @@
+"""Compact, integer-encoded form of `FirewallRule`.
+
+`FirewallRule` keeps `ipaddress` network objects and ports that may be an
+int, a `(start, end)` tuple or `None`, so every coverage check has to
+dispatch on types and call into `ipaddress`. `CompiledRule` stores the
+same match criteria as plain integers:
+
+- networks as an inclusive `(lo, hi)` address range, with IPv6 addresses
+  shifted above the IPv4 space so the two families never overlap;
+- ports as an inclusive `(lo, hi)` range;
+- protocol, interfaces and action as small interned integer ids.
+
+Wildcards (`None`) are encoded as a range one wider than any real value
+(or id 0 for symbols). That keeps the existing semantics: a wildcard
+covers and overlaps everything, while a specific value, even
+`0.0.0.0/0` or `0:65535`, never covers a wildcard.
+"""
+
+import threading
+from typing import Dict, List, Optional
+from core.models.firewall_rule import FirewallRule
+
+
+_V6_OFFSET = 1 << 32
+ADDRESS_ANY = (-1, _V6_OFFSET + (1 << 128))
+PORT_ANY = (-1, 65536)
+
+#: Canonical protocol names, by every spelling iptables accepts.
+PROTOCOL_NAMES = {
+    "tcp": "tcp", "6": "tcp",
+    "udp": "udp", "17": "udp",
+    "icmp": "icmp", "1": "icmp",
+    "icmpv6": "icmpv6", "ipv6-icmp": "icmpv6", "58": "icmpv6",
+    "sctp": "sctp", "132": "sctp",
+    "gre": "gre", "47": "gre",
+    "esp": "esp", "50": "esp",
+    "ah": "ah", "51": "ah",
+}
+
+
+def canonical_protocol(name: Optional[str]) -> Optional[str]:
+    """Return one spelling per protocol; `None` for "any" (`all`, `0`)."""
+    if name is None:
+        return None
+    name = name.lower()
+    if name in ("all", "0"):
+        return None
+    return PROTOCOL_NAMES.get(name, name)
+
+
+def interfaces_overlap(a: Optional[str], b: Optional[str]) -> bool:
+    """Return True if two interface matches can match the same interface.
+
+    A trailing `+` matches every name with that prefix, as in iptables.
+    """
+    if a is None or b is None:
+        return True
+    if a.endswith("+"):
+        a = a[:-1]
+        if b.endswith("+"):
+            b = b[:-1]
+            return a.startswith(b) or b.startswith(a)
+        return b.startswith(a)
+    if b.endswith("+"):
+        return a.startswith(b[:-1])
+    return a == b
+
+
+class SymbolTable:
+    """Intern strings as small positive ints; `None` is always 0.
+
+    `id` may be called from several threads sharing one table.
+    """
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def id(self, value: Optional[str]) -> int:
+        if value is None:
+            return 0
+        found = self._ids.get(value)
+        if found is None:
+            with self._lock:
+                found = self._ids.get(value)
+                if found is None:
+                    found = self._ids[value] = len(self._ids) + 1
+        return found
+
+    def lookup(self, value: Optional[str]) -> int:
+        """Like `id`, but return -1 for unseen strings instead of adding them."""
+        if value is None:
+            return 0
+        return self._ids.get(value, -1)
+
+
+def address_range(network) -> tuple:
+    """Return the inclusive integer range covered by a network (or `None`)."""
+    if network is None:
+        return ADDRESS_ANY
+    lo = int(network.network_address)
+    hi = int(network.broadcast_address)
+    if network.version == 6:
+        lo += _V6_OFFSET
+        hi += _V6_OFFSET
+    return (lo, hi)
+
+
+def port_bounds(port) -> tuple:
+    """Return the inclusive range of a port, port tuple or `None`."""
+    if port is None:
+        return PORT_ANY
+    if isinstance(port, int):
+        return (port, port)
+    return (port[0], port[1])
+
+
+class CompiledRule:
+    """Slotted, integer-only view of a `FirewallRule`.
+
+    No reference to the original rule is kept, only its `position` in the
+    list it was compiled from, which analyzers use to report it. Symbol
+    ids are only comparable between rules compiled with the same
+    `symbols` table.
+    """
+
+    __slots__ = (
+        "position",
+        "src_lo", "src_hi", "dst_lo", "dst_hi",
+        "sport_lo", "sport_hi", "dport_lo", "dport_hi",
+        "protocol", "in_iface", "out_iface", "action",
+    )
+
+    def __init__(self, rule: FirewallRule, symbols: SymbolTable, position: int = 0):
+        self.position = position
+        self.src_lo, self.src_hi = address_range(rule.src)
+        self.dst_lo, self.dst_hi = address_range(rule.dst)
+        self.sport_lo, self.sport_hi = port_bounds(rule.src_port)
+        self.dport_lo, self.dport_hi = port_bounds(rule.dst_port)
+        self.protocol = symbols.id(rule.protocol)
+        self.in_iface = symbols.id(rule.in_iface)
+        self.out_iface = symbols.id(rule.out_iface)
+        self.action = symbols.id(rule.action)
+
+    def __repr__(self) -> str:
+        return f"CompiledRule(#{self.position})"
+
+    def covers(self, other: "CompiledRule") -> bool:
+        """Same as `shadowing.rule_covers` on the original rules."""
+        return (
+            self.src_lo <= other.src_lo and other.src_hi <= self.src_hi and
+            self.dst_lo <= other.dst_lo and other.dst_hi <= self.dst_hi and
+            self.sport_lo <= other.sport_lo and other.sport_hi <= self.sport_hi and
+            self.dport_lo <= other.dport_lo and other.dport_hi <= self.dport_hi and
+            (self.protocol == 0 or self.protocol == other.protocol) and
+            (self.in_iface == 0 or self.in_iface == other.in_iface) and
+            (self.out_iface == 0 or self.out_iface == other.out_iface)
+        )
+
+    def overlaps(self, other: "CompiledRule") -> bool:
+        """Same as `conflicts.rules_overlap` on the original rules."""
+        return (
+            self.src_lo <= other.src_hi and other.src_lo <= self.src_hi and
+            self.dst_lo <= other.dst_hi and other.dst_lo <= self.dst_hi and
+            self.sport_lo <= other.sport_hi and other.sport_lo <= self.sport_hi and
+            self.dport_lo <= other.dport_hi and other.dport_lo <= self.dport_hi and
+            (self.protocol == 0 or other.protocol == 0 or self.protocol == other.protocol) and
+            (self.in_iface == 0 or other.in_iface == 0 or self.in_iface == other.in_iface) and
+            (self.out_iface == 0 or other.out_iface == 0 or self.out_iface == other.out_iface)
+        )
+
+    def conflicts(self, other: "CompiledRule") -> bool:
+        """Same as `conflicts.rule_conflicts` on the original rules."""
+        if self.action == other.action:
+            return False
+        if self.covers(other) or other.covers(self):
+            return False
+        return self.overlaps(other)
+
+    def makes_redundant(self, other: "CompiledRule") -> bool:
+        """Same as `redundancy.rules_match(other, self)` on the original rules.
+
+        Table and chain are not compared; callers only pass rules of the
+        same chain. Unlike `covers`, a wildcard network only matches
+        another wildcard network.
+        """
+        return (
+            self.action == other.action and
+            self.protocol == other.protocol and
+            self.in_iface == other.in_iface and
+            self.out_iface == other.out_iface and
+            ((self.src_lo, self.src_hi) == ADDRESS_ANY) == ((other.src_lo, other.src_hi) == ADDRESS_ANY) and
+            ((self.dst_lo, self.dst_hi) == ADDRESS_ANY) == ((other.dst_lo, other.dst_hi) == ADDRESS_ANY) and
+            self.src_lo <= other.src_lo and other.src_hi <= self.src_hi and
+            self.dst_lo <= other.dst_lo and other.dst_hi <= self.dst_hi and
+            self.sport_lo <= other.sport_lo and other.sport_hi <= self.sport_hi and
+            self.dport_lo <= other.dport_lo and other.dport_hi <= self.dport_hi
+        )
+
+
+def compile_rule(rule: FirewallRule, symbols: SymbolTable, position: int = 0) -> CompiledRule:
+    """Convert a `FirewallRule` into its `CompiledRule` form."""
+    return CompiledRule(rule, symbols, position)
+
+
+def compile_rules(rules: List[FirewallRule], symbols: Optional[SymbolTable] = None) -> List[CompiledRule]:
+    """Convert a list of rules, sharing one symbol table.
+
+    Each compiled rule's `position` is its index in `rules`. Without
+    `symbols`, a new table is used for just these rules, so it is freed
+    with them instead of growing for the life of the process.
+    """
+    if symbols is None:
+        symbols = SymbolTable()
+    return [CompiledRule(rule, symbols, position) for position, rule in enumerate(rules)]
@@ -28,6 +28,9 @@ class FirewallRule:
         action: The target/action of the rule (e.g., 'ACCEPT', 'DROP').
         raw: The original rule text as parsed, useful for display/debugging.
         order: The position of the rule in the original rule list (0-based).
+        packet_count: Packets matched so far, from `iptables-save -c`
+            counters, or None if the dump has no counters.
+        byte_count: Bytes matched so far, or None without counters.
     """
 
     # Table and chain identify the rule's context and are required.
@@ -48,3 +51,7 @@ class FirewallRule:
     action: str
     raw: str
     order: int
+
+    # Hit counters, when the dump includes them.
+    packet_count: Optional[int] = None
+    byte_count: Optional[int] = None
@@ -0,0 +1,295 @@
+"""Split long chains into a tree of sub-chains.
+
+Every packet walks a chain top to bottom until a rule matches, so a
+5,000-rule INPUT chain costs up to 5,000 rule evaluations per packet.
+`split_chains` restructures long chains into a jump tree: the chain
+starts with a few `-g` (goto) rules that send packets to sub-chains by
+input interface, protocol or destination prefix, and each sub-chain holds
+only the rules that can match packets with that value, in their original
+order. Sub-chains are split again on the remaining fields while that
+lowers the estimated cost.
+
+First-match semantics are kept for every packet:
+
+- a rule is copied into every sub-chain whose packets it might match.
+  Rules that leave the field unrestricted, negate options, or use values
+  the split cannot reason about (interface wildcards such as `eth+`,
+  unknown protocols) go into every sub-chain and the chain's tail;
+- every copy keeps its own matches, so extra copies never match more;
+- `-g` does not return to the splitting chain. A packet that reaches the
+  end of a sub-chain continues where it would have after the original
+  chain (the caller, or the built-in chain's policy), and `RETURN` in a
+  sub-chain behaves as it did in the original chain.
+
+Only chains of the `filter` table are split, since rules there cannot
+rewrite the fields the tree dispatches on.
+
+Costs are estimated as the number of rules evaluated per packet that
+hits a rule. Hits are weighted by `packet_count` when every rule of the
+chain has counters, and are otherwise assumed uniform over rules; a rule
+copied into several sub-chains gets an equal share of its hits in each.
+The worst case is the longest path through the tree.
+"""
+
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from core.models.firewall_rule import FirewallRule
+from core.models.chain_partition import ChainKey, ChainPartition
+from core.models.compiled_rule import PROTOCOL_NAMES
+from core.exporters.set_exporter import iptables_restore, jump_targets
+
+IN_IFACE = "in_iface"
+PROTOCOL = "protocol"
+DST = "dst"
+
+#: Option used in the goto rule for each field a chain can be split on.
+SPLIT_OPTIONS = {IN_IFACE: "-i", PROTOCOL: "-p", DST: "-d"}
+
+# IPv4 prefix lengths tried for destination splits, coarsest first.
+_DST_PREFIXES = (8, 16, 24)
+
+# iptables limits chain names to 28 characters.
+_MAX_NAME = 28
+
+Branch = Tuple[str, object, "SplitNode"]
+
+
+@dataclass
+class SplitNode:
+    """One chain of the tree: goto rules to `branches`, then `rules`.
+
+    Each branch is `(field, value, child)`; packets whose `field` equals
+    `value` (or, for `dst`, lies in the `value` network) go to `child`.
+    """
+
+    rules: List[FirewallRule]
+    branches: List[Branch] = field(default_factory=list)
+
+
+@dataclass
+class SplitCost:
+    """Estimated rules evaluated per packet, before and after splitting a chain."""
+
+    before_average: float
+    before_worst: int
+    after_average: float
+    after_worst: int
+
+
+@dataclass
+class SplitResult:
+    """The `-A` lines of every chain, including new sub-chains, and the costs of split chains."""
+
+    chains: Dict[ChainKey, List[str]] = field(default_factory=dict)
+    costs: Dict[ChainKey, SplitCost] = field(default_factory=dict)
+
+    def iptables_restore(self) -> str:
+        """Return input for `iptables-restore` with the split chains."""
+        return iptables_restore(self.chains)
+
+
+def _key_value(rule: FirewallRule, key: str):
+    """Return the value of `key` that `rule` is confined to, or None if it may match any."""
+    if "!" in rule.raw.split():
+        return None
+    if key == IN_IFACE:
+        name = rule.in_iface
+        return name if name is not None and not name.endswith("+") else None
+    if key == PROTOCOL:
+        return PROTOCOL_NAMES.get(rule.protocol) if rule.protocol is not None else None
+    return rule.dst
+
+
+def _weight_function(bucket: List[FirewallRule]) -> Callable[[FirewallRule], int]:
+    if all(rule.packet_count is not None for rule in bucket) and any(rule.packet_count for rule in bucket):
+        return lambda rule: rule.packet_count
+    return lambda rule: 1
+
+
+def tree_cost(root: SplitNode, weight: Callable[[FirewallRule], int]) -> Tuple[float, int]:
+    """Return the (average, worst-case) rules evaluated per packet for a tree."""
+    copies: Counter = Counter()
+    weights: Dict[int, int] = {}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        for rule in node.rules:
+            copies[id(rule)] += 1
+            weights[id(rule)] = weight(rule)
+        stack.extend(child for _, _, child in node.branches)
+
+    weighted = 0.0
+    worst = 0
+    stack = [(root, 0)]
+    while stack:
+        node, offset = stack.pop()
+        gotos = len(node.branches)
+        for position, (_, _, child) in enumerate(node.branches, 1):
+            stack.append((child, offset + position))
+        for position, rule in enumerate(node.rules, offset + gotos + 1):
+            weighted += weights[id(rule)] / copies[id(rule)] * position
+        worst = max(worst, offset + gotos + len(node.rules))
+
+    total = sum(weights.values())
+    return (weighted / total if total else 0.0), worst
+
+
+# How a rule is placed when splitting: in one branch, or in the tail and
+# every branch it may overlap.
+_ONE, _ANY, _WIDE = "one", "any", "wide"
+
+
+def _placements(bucket: List[FirewallRule], key: str, length: int):
+    for rule in bucket:
+        value = _key_value(rule, key)
+        if value is None:
+            yield _ANY, None
+        elif key != DST:
+            yield _ONE, value
+        elif value.version == 4 and value.prefixlen >= length:
+            yield _ONE, value.supernet(new_prefix=length)
+        else:
+            yield _WIDE, value
+
+
+def _split(bucket, key, length, min_branch, max_branches, weight) -> Optional[SplitNode]:
+    """Split a chain once on `key`, or return None if no value has enough rules.
+
+    Values with at least `min_branch` rules of their own become branches,
+    at most `max_branches` of them, hottest first.
+    """
+    placements = list(_placements(bucket, key, length))
+    counts = Counter(value for kind, value in placements if kind is _ONE)
+    hits: Counter = Counter()
+    for rule, (kind, value) in zip(bucket, placements):
+        if kind is _ONE and counts[value] >= min_branch:
+            hits[value] += weight(rule)
+    branches = {value: [] for value, _ in hits.most_common(max_branches)}
+    if not branches:
+        return None
+
+    tail = []
+    for rule, (kind, value) in zip(bucket, placements):
+        if kind is _ONE:
+            branches.get(value, tail).append(rule)
+            continue
+        for branch, rules in branches.items():
+            if kind is _ANY or (branch.version == value.version and branch.subnet_of(value)):
+                rules.append(rule)
+        tail.append(rule)
+    return SplitNode(
+        rules=tail,
+        branches=[(key, value, SplitNode(rules=rules)) for value, rules in branches.items()],
+    )
+
+
+def _candidates(used: Set[str], dst_length: int):
+    for key in (IN_IFACE, PROTOCOL):
+        if key not in used:
+            yield key, 0
+    for length in _DST_PREFIXES:
+        if length > dst_length:
+            yield DST, length
+
+
+def _build(bucket, used, dst_length, options, weight) -> SplitNode:
+    min_rules, min_branch, max_branches = options
+    best = SplitNode(rules=list(bucket))
+    if len(bucket) < min_rules:
+        return best
+    best_cost = tree_cost(best, weight)[0]
+    chosen = None
+    for key, length in _candidates(used, dst_length):
+        node = _split(bucket, key, length, min_branch, max_branches, weight)
+        if node is None:
+            continue
+        cost = tree_cost(node, weight)[0]
+        if cost < best_cost:
+            best, best_cost, chosen = node, cost, (key, length)
+    if chosen is None:
+        return best
+
+    key, length = chosen
+    if key == DST:
+        dst_length = length
+    else:
+        used = used | {key}
+    best.branches = [
+        (k, value, _build(child.rules, used, dst_length, options, weight))
+        for k, value, child in best.branches
+    ]
+    # Packets that took none of the branches can still be split on
+    # another field; those gotos follow the first ones.
+    rest = _build(best.rules, used, dst_length, options, weight)
+    best.branches.extend(rest.branches)
+    best.rules = rest.rules
+    return best
+
+
+def split_chain(bucket: List[FirewallRule], min_rules: int = 64,
+                min_branch: int = 4, max_branches: int = 16) -> SplitNode:
+    """Return the jump tree for one chain's rules, in order.
+
+    Chains (and sub-chains) shorter than `min_rules` are not split, and a
+    split is only made where it lowers the estimated average cost.
+    """
+    return _build(bucket, set(), 0, (min_rules, min_branch, max_branches), _weight_function(bucket))
+
+
+def _retarget(rule: FirewallRule, chain: str) -> str:
+    """Return `rule` appended to `chain`; a bare counting rule has no options."""
+    options = rule.raw.split(None, 2)[2:]
+    return " ".join(["-A", chain] + options)
+
+
+def _emit(node: SplitNode, table: str, chain: str, taken: Set[str],
+          out: Dict[ChainKey, List[str]]) -> None:
+    lines: List[str] = []
+    out[(table, chain)] = lines
+    for key, value, child in node.branches:
+        name = _sub_chain_name(chain, taken)
+        lines.append(f"-A {chain} {SPLIT_OPTIONS[key]} {value} -g {name}")
+        _emit(child, table, name, taken, out)
+    lines.extend(_retarget(rule, chain) for rule in node.rules)
+
+
+def _sub_chain_name(chain: str, taken: Set[str]) -> str:
+    number = 1
+    while True:
+        suffix = f"_{number}"
+        name = chain[:_MAX_NAME - len(suffix)] + suffix
+        if name not in taken:
+            taken.add(name)
+            return name
+        number += 1
+
+
+def split_chains(rules: List[FirewallRule], min_rules: int = 64,
+                 min_branch: int = 4, max_branches: int = 16) -> SplitResult:
+    """Split every long `filter` chain into a jump tree (see `split_chain`).
+
+    Other chains are passed through unchanged. Raises ValueError for rules
+    that are not iptables rules.
+    """
+    partition = ChainPartition.of(rules)
+    if partition.rules and not partition.rules[0].raw.startswith("-A"):
+        raise ValueError("Chains can only be split for iptables rules")
+
+    # New sub-chains must not reuse the name of a chain with rules or of
+    # an empty chain that some rule jumps to.
+    taken = {chain for (_, chain), _ in partition.items()}
+    taken.update(jump_targets(rule.raw for rule in partition.rules))
+    result = SplitResult()
+    for (table, chain), bucket in partition.items():
+        if table != "filter":
+            result.chains[(table, chain)] = [rule.raw for rule in bucket]
+            continue
+        root = split_chain(bucket, min_rules, min_branch, max_branches)
+        _emit(root, table, chain, taken, result.chains)
+        if root.branches:
+            weight = _weight_function(bucket)
+            before = tree_cost(SplitNode(rules=list(bucket)), weight)
+            after = tree_cost(root, weight)
+            result.costs[(table, chain)] = SplitCost(before[0], before[1], after[0], after[1])
+    return result
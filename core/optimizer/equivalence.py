@@ -0,0 +1,646 @@
+"""Check that two rulesets give every packet the same verdict.
+
+`verify_equivalence(original, optimized)` compares, chain by chain, the
+verdict of the first rule each ruleset applies to every possible packet,
+and returns a counterexample packet if they ever differ. It is meant to
+gate `optimize_rules` output before it is deployed.
+
+The match space is decomposed into disjoint regions one field at a time
+(protocol, input and output interface, then source address, destination
+address, source port and destination port). On address and port fields
+the boundaries of the rules still in play are sorted and swept, so each
+elementary interval gets exactly the rules covering it without
+enumerating values; protocols and interfaces are split into one
+representative value per distinct name (plus one matching no rule).
+Four shortcuts keep this fast on large chains:
+
+- rules covered by a single earlier rule are dropped first, since they
+  are never the first match anywhere (this is what `optimize_rules`
+  removes);
+- rules after the first one covering the rest of a region are dropped,
+  since they can never be the first match there;
+- a region is settled as soon as every rule left in it covers all of it;
+- rules present in both rulesets in the same relative order are matched
+  up first, and regions touched by none of the remaining rules are
+  skipped, since both rulesets then walk the same rules there.
+
+Only verdicts count: rules without a target or with a non-terminating
+one (`LOG`, `MARK`, ...) are ignored, while jumps to user chains are
+compared by target name. Negated matches (`! -s`, `saddr !=`) are
+honoured; values the verifier cannot interpret raise `ValueError` rather
+than being treated as wildcards.
+
+Matches the parser does not extract (`-m state`, `-m multiport`,
+`ct state`, ...) make a rule one that *may* match the packets of its
+region: it never covers another rule, and where it could be the first
+match both outcomes are compared. Such matches are treated as a condition
+on the packet that is either met or not, and rules with the same
+unmodelled text share the condition; any other combination is assumed
+possible.
+"""
+
+import ipaddress
+import string
+from itertools import product
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+from core.models.firewall_rule import FirewallRule
+from core.models.chain_partition import ChainPartition
+from core.models.compiled_rule import PROTOCOL_NAMES, address_range, port_bounds
+from core.classifier.packet_classifier import Packet
+from core.utils.intern_cache import parse_network, parse_port
+from core.utils.prefix_trie import NetworkIndex
+
+#: Targets after which evaluation continues, so they never decide a verdict.
+NON_TERMINATING = frozenset({
+    "LOG", "NFLOG", "ULOG", "TRACE", "AUDIT", "MARK", "CONNMARK",
+    "CLASSIFY", "DSCP", "TOS", "TTL", "HL", "NOTRACK", "CT",
+})
+
+# Fields in the order regions are split on; the first three are names.
+_FIELDS = ("protocol", "in_iface", "out_iface", "src", "dst", "src_port", "dst_port")
+_SYMBOL_DIMS = 3
+_DIMS = len(_FIELDS)
+
+# Options that may be negated with a preceding `!` (iptables) or a
+# following `!=` (nftables); every other match is unmodelled.
+_IPTABLES_OPTIONS = {
+    "-p": "protocol", "-i": "in_iface", "-o": "out_iface", "-s": "src", "-d": "dst",
+    "--sport": "src_port", "--dport": "dst_port",
+}
+_NFT_KEYWORDS = {
+    "protocol": "protocol", "iifname": "in_iface", "oifname": "out_iface",
+    "saddr": "src", "daddr": "dst", "sport": "src_port", "dport": "dst_port",
+}
+
+# Tokens that only select how an option is parsed (`-m tcp`) or that do
+# not match at all (comments, counters, logging), and those that end the
+# matches of a rule.
+_IPTABLES_PLAIN_MODULES = frozenset({"tcp", "udp", "comment"})
+_IPTABLES_TARGETS = frozenset({"-j", "--jump", "-g", "--goto"})
+_NFT_PREFIXES = {"tcp": ("dport", "sport"), "udp": ("dport", "sport"),
+                 "ip": ("saddr", "daddr", "protocol"), "ip6": ("saddr", "daddr")}
+_NFT_PROTOCOLS = frozenset({"tcp", "udp", "icmp"})
+_NFT_LOG_OPTIONS = frozenset({"prefix", "level", "flags", "group", "snaplen", "queue-threshold"})
+_NFT_VERDICTS = frozenset({"accept", "drop", "reject", "return", "jump", "goto", "queue", "continue"})
+
+_V6_OFFSET = 1 << 32
+_ADDRESS_DOMAINS = {4: (0, _V6_OFFSET - 1), 6: (_V6_OFFSET, _V6_OFFSET + (1 << 128) - 1)}
+# -1 stands for a packet without that port (ICMP, ...).
+_PORT_DOMAIN = (-1, 65535)
+_OTHER_PROTOCOLS = ("gre", "esp", "ah", "sctp", "ipip", "253")
+
+
+@dataclass
+class Counterexample:
+    """A packet the two rulesets treat differently, and the rules deciding it.
+
+    `original` and `optimized` are the first rules with a verdict that
+    match `packet`, or None if it falls through to the chain policy.
+    `unmodelled` maps the text of matches the verifier does not model
+    (such as `-m state --state NEW`) to whether `packet` is taken to
+    meet them.
+    """
+
+    table: str
+    chain: str
+    packet: Packet
+    original: Optional[FirewallRule]
+    optimized: Optional[FirewallRule]
+    unmodelled: Dict[str, bool] = field(default_factory=dict)
+
+
+@dataclass
+class EquivalenceResult:
+    """Outcome of `verify_equivalence`; `regions` counts the regions compared."""
+
+    counterexample: Optional[Counterexample] = None
+    chains: int = 0
+    regions: int = 0
+
+    @property
+    def equivalent(self) -> bool:
+        return self.counterexample is None
+
+
+class _Match:
+    """A rule's matches for one address family, as names and integer intervals."""
+
+    __slots__ = ("rule", "action", "symbols", "ranges", "condition", "full", "full_from",
+                 "key", "suspect", "src", "dst", "indexable")
+
+    def __init__(self, rule, symbols, ranges, condition, domains, networks, indexable):
+        self.rule = rule
+        # Plain (non-negated) networks, for `NetworkIndex`.
+        self.src, self.dst = networks
+        self.indexable = indexable
+        self.action = rule.action
+        self.symbols = symbols
+        self.ranges = ranges
+        # Text of the unmodelled matches, or None if everything is modelled.
+        self.condition = condition
+        self.full = [symbol is None for symbol in symbols] + [
+            intervals == [domain] for intervals, domain in zip(ranges, domains)
+        ]
+        # Regions from this field on are covered entirely, though only
+        # where `condition` holds.
+        self.full_from = _DIMS
+        while self.full_from and self.full[self.full_from - 1]:
+            self.full_from -= 1
+        self.key = (symbols, tuple(map(tuple, ranges)), condition, self.action)
+        self.suspect = True
+
+    def settles(self, dim: int) -> bool:
+        """Return True if this rule is the first match wherever it is reached from `dim` on."""
+        return self.condition is None and self.full_from <= dim
+
+
+def _skip_quoted(tokens: List[str], i: int) -> int:
+    """Return the index after the (possibly quoted, multi-token) value at `i`."""
+    start = i
+    if i < len(tokens) and tokens[i].startswith('"'):
+        while i + 1 < len(tokens) and not (tokens[i].endswith('"') and (i > start or len(tokens[i]) > 1)):
+            i += 1
+    return i + 1
+
+
+def _iptables_unmodelled(tokens: List[str]) -> List[str]:
+    unmodelled = []
+    i = 2
+    while i < len(tokens) and tokens[i] not in _IPTABLES_TARGETS:
+        token = tokens[i]
+        following = tokens[i + 1] if i + 1 < len(tokens) else None
+        if token in _IPTABLES_OPTIONS:
+            i += 2
+        elif token == "!" and following in _IPTABLES_OPTIONS:
+            i += 1
+        elif token == "-m" and following in _IPTABLES_PLAIN_MODULES:
+            i += 2
+        elif token == "--comment":
+            i = _skip_quoted(tokens, i + 1)
+        else:
+            unmodelled.append(token)
+            i += 1
+    return unmodelled
+
+
+def _nft_unmodelled(tokens: List[str]) -> List[str]:
+    unmodelled = []
+    i = 0
+    while i < len(tokens) and tokens[i] not in _NFT_VERDICTS:
+        token = tokens[i]
+        following = tokens[i + 1] if i + 1 < len(tokens) else None
+        if following in _NFT_PREFIXES.get(token, ()) or token in _NFT_PROTOCOLS:
+            i += 1
+        elif token in _NFT_KEYWORDS:
+            i += 3 if following == "!=" else 2
+        elif token == "counter":
+            i += 5 if following == "packets" else 1
+        elif token == "comment":
+            i = _skip_quoted(tokens, i + 1)
+        elif token == "log":
+            i += 1
+            while i < len(tokens) and tokens[i] in _NFT_LOG_OPTIONS:
+                i = _skip_quoted(tokens, i + 1)
+        else:
+            unmodelled.append(token)
+            i += 1
+    return unmodelled
+
+
+def _match_values(rule: FirewallRule) -> Tuple[Dict[str, object], set, Optional[str]]:
+    """Return the rule's value for each field, the set of negated fields
+    and the text of its unmodelled matches (None if there are none)."""
+    values = {name: getattr(rule, name) for name in _FIELDS}
+    negated = set()
+    tokens = rule.raw.split()
+    options = _IPTABLES_OPTIONS if rule.raw.startswith("-A") else _NFT_KEYWORDS
+    for i, token in enumerate(tokens):
+        following = tokens[i + 1] if i + 1 < len(tokens) else None
+        if token == "!" and following in _IPTABLES_OPTIONS:
+            negated.add(_IPTABLES_OPTIONS[following])
+        elif token == "!=" and i and tokens[i - 1] in _NFT_KEYWORDS and following:
+            name = _NFT_KEYWORDS[tokens[i - 1]]
+            values[name] = _parse_value(name, following, rule)
+            negated.add(name)
+        elif token in options and following not in (None, "!="):
+            if following == "!":
+                raise ValueError(f"Cannot verify old-style negation in rule: {rule.raw}")
+            if values[options[token]] is None:
+                raise ValueError(f"Cannot verify unparsed {options[token]} in rule: {rule.raw}")
+    if rule.raw.startswith("-A"):
+        unmodelled = _iptables_unmodelled(tokens)
+    else:
+        unmodelled = _nft_unmodelled(tokens)
+    return values, negated, " ".join(unmodelled) or None
+
+
+def _parse_value(name: str, text: str, rule: FirewallRule):
+    try:
+        if name in ("src", "dst"):
+            return parse_network(text)
+        if name in ("src_port", "dst_port"):
+            value = parse_port(text, "-")
+            if value is None:
+                raise ValueError(text)
+            return value
+    except ValueError:
+        raise ValueError(f"Cannot verify unparsed {name} in rule: {rule.raw}") from None
+    return text
+
+
+def _symbol(name: str, value, negate: bool):
+    """Return `(kind, text, negate)` for a name match, or None for a wildcard."""
+    if value is None:
+        return None
+    if name == "protocol":
+        text = value.lower()
+        if text in ("all", "0"):
+            # Negated, it matches nothing: every name starts with "".
+            return ("+", "", True) if negate else None
+        return ("=", PROTOCOL_NAMES.get(text, text), negate)
+    if value.endswith("+"):
+        if value == "+" and not negate:
+            return None
+        return ("+", value[:-1], negate)
+    return ("=", value.strip('"'), negate)
+
+
+def _symbol_matches(symbol, name: str) -> bool:
+    if symbol is None:
+        return True
+    kind, text, negate = symbol
+    found = name.startswith(text) if kind == "+" else name == text
+    return found != negate
+
+
+def _complement(lo: int, hi: int, domain: Tuple[int, int]) -> List[Tuple[int, int]]:
+    out = []
+    if domain[0] < lo:
+        out.append((domain[0], min(lo - 1, domain[1])))
+    if hi < domain[1]:
+        out.append((max(hi + 1, domain[0]), domain[1]))
+    return out
+
+
+def _compile(rule: FirewallRule, family: int) -> Optional[_Match]:
+    """Return the rule's matches within one address family, or None if it matches none."""
+    values, negated, condition = _match_values(rule)
+    symbols = tuple(
+        _symbol(name, values[name], name in negated) for name in _FIELDS[:_SYMBOL_DIMS]
+    )
+    domains = (_ADDRESS_DOMAINS[family], _ADDRESS_DOMAINS[family], _PORT_DOMAIN, _PORT_DOMAIN)
+    ranges = []
+    for name, domain in zip(_FIELDS[_SYMBOL_DIMS:], domains):
+        value = values[name]
+        if value is None:
+            ranges.append([domain])
+            continue
+        if name in ("src", "dst"):
+            if value.version != family:
+                return None
+            lo, hi = address_range(value)
+        else:
+            lo, hi = port_bounds(value)
+            # A port match, even negated, needs a packet with ports.
+            domain = (0, domain[1])
+        intervals = _complement(lo, hi, domain) if name in negated else [(lo, hi)]
+        if not intervals:
+            return None
+        ranges.append(intervals)
+    networks = tuple(None if name in negated else values[name] for name in ("src", "dst"))
+    indexable = not negated & {"src", "dst"}
+    return _Match(rule, symbols, tuple(ranges), condition, domains, networks, indexable)
+
+
+def _symbol_covers(outer, inner) -> bool:
+    if outer is None or outer == inner:
+        return True
+    if inner is None or outer[2] or inner[2]:
+        return False
+    return outer[0] == "+" and inner[1].startswith(outer[1])
+
+
+def _covers(outer: _Match, inner: _Match) -> bool:
+    """Return True if every packet matching `inner` also matches `outer`."""
+    return all(
+        _symbol_covers(a, b) for a, b in zip(outer.symbols, inner.symbols)
+    ) and all(
+        any(olo <= lo and hi <= ohi for olo, ohi in outer_ranges)
+        for outer_ranges, inner_ranges in zip(outer.ranges, inner.ranges)
+        for lo, hi in inner_ranges
+    )
+
+
+def _live(matches: List[_Match]) -> List[_Match]:
+    """Drop rules covered by a single earlier rule; they are never the first match.
+
+    Earlier rules are indexed by their exact name matches and then by
+    network (like `redundancy.redundant_in_chain`), so only rules that
+    can cover each one are compared. Rules with unmodelled matches may
+    let packets through, so they never cover another rule.
+    """
+    indexes: Dict[tuple, NetworkIndex] = {}
+    unindexed: List[_Match] = []
+    live = []
+    for match in matches:
+        options = [(None,) if symbol is None else (None, symbol) for symbol in match.symbols]
+        candidates = [
+            candidate
+            for key in product(*options) if key in indexes
+            for candidate in indexes[key].candidates(match)
+        ]
+        if any(_covers(earlier, match) for earlier in candidates + unindexed):
+            continue
+        live.append(match)
+        if match.condition is not None:
+            continue
+        if match.indexable:
+            indexes.setdefault(match.symbols, NetworkIndex()).add(match, match)
+        else:
+            unindexed.append(match)
+    return live
+
+
+def _mark_suspects(a: List[_Match], b: List[_Match]) -> None:
+    """Clear `suspect` on rules found in both lists in the same relative order.
+
+    Rules are paired by identical matches and verdict; of the pairs, the
+    longest run increasing in both lists (a longest increasing
+    subsequence) is kept.
+    """
+    positions: Dict[tuple, deque] = defaultdict(deque)
+    for j, match in enumerate(b):
+        positions[match.key].append(j)
+    pairs = []
+    for i, match in enumerate(a):
+        queue = positions.get(match.key)
+        if queue:
+            pairs.append((i, queue.popleft()))
+
+    tails: List[int] = []
+    tail_pairs: List[int] = []
+    previous = [-1] * len(pairs)
+    for index, (_, j) in enumerate(pairs):
+        slot = bisect_left(tails, j)
+        if slot == len(tails):
+            tails.append(j)
+            tail_pairs.append(index)
+        else:
+            tails[slot] = j
+            tail_pairs[slot] = index
+        previous[index] = tail_pairs[slot - 1] if slot else -1
+    index = tail_pairs[-1] if tail_pairs else -1
+    while index >= 0:
+        i, j = pairs[index]
+        a[i].suspect = b[j].suspect = False
+        index = previous[index]
+
+
+def _names(matches: Sequence[_Match], dim: int):
+    """Return the representative name of each name match, and one matching none."""
+    symbols = [m.symbols[dim] for m in matches if m.symbols[dim] is not None]
+    literals = {symbol[1] for symbol in symbols if symbol[0] == "="}
+    stems = {symbol[1] for symbol in symbols if symbol[0] == "+"}
+
+    def free(prefix: str, preferred: Sequence[str]) -> str:
+        """Return a name starting with `prefix` that no literal or longer stem matches."""
+        longer = [stem for stem in stems if len(stem) > len(prefix) and stem.startswith(prefix)]
+        for candidate in preferred:
+            if candidate not in literals and not any(candidate.startswith(stem) for stem in longer):
+                return candidate
+        blocked = {stem[len(prefix)] for stem in longer}
+        char = next(c for c in string.ascii_lowercase + string.digits if c not in blocked)
+        return next(
+            name for name in (prefix + char + "0" * count for count in range(len(literals) + 1))
+            if name not in literals
+        )
+
+    preferred = _OTHER_PROTOCOLS if dim == 0 else ("if0",)
+    names = {("=", text): text for text in literals}
+    for stem in stems:
+        names[("+", stem)] = free(stem, (stem + "0",) if stem else preferred)
+    other = free("", preferred)
+    return names, other
+
+
+class _ChainCheck:
+    """First-match comparison of one chain's rules within one address family."""
+
+    def __init__(self, a: List[_Match], b: List[_Match], family: int):
+        self.a = a
+        self.b = b
+        self.domains = (_ADDRESS_DOMAINS[family], _ADDRESS_DOMAINS[family], _PORT_DOMAIN, _PORT_DOMAIN)
+        self.names = [_names(a + b, dim) for dim in range(_SYMBOL_DIMS)]
+        self.memo: Dict[tuple, Optional[list]] = {}
+        self.regions = 0
+        # `(original, optimized, unmodelled)` for the counterexample found.
+        self.deciding: Optional[tuple] = None
+
+    def counterexample(self) -> Optional[list]:
+        """Return one value per field of a packet the lists disagree on, or None."""
+        return self._solve(0, tuple(range(len(self.a))), tuple(range(len(self.b))))
+
+    @staticmethod
+    def _truncate(matches: List[_Match], ids: tuple, dim: int) -> tuple:
+        for position, index in enumerate(ids):
+            if matches[index].settles(dim):
+                return ids[:position + 1]
+        return ids
+
+    def _solve(self, dim: int, a_ids: tuple, b_ids: tuple) -> Optional[list]:
+        a_ids = self._truncate(self.a, a_ids, dim)
+        b_ids = self._truncate(self.b, b_ids, dim)
+        if not any(self.a[i].suspect for i in a_ids) and not any(self.b[j].suspect for j in b_ids):
+            return None
+        key = (dim, a_ids, b_ids)
+        if key not in self.memo:
+            self.memo[key] = self._split(dim, a_ids, b_ids)
+        return self.memo[key]
+
+    def _split(self, dim: int, a_ids: tuple, b_ids: tuple) -> Optional[list]:
+        if (all(self.a[i].full_from <= dim for i in a_ids) and
+                all(self.b[j].full_from <= dim for j in b_ids)):
+            # Every rule left covers the whole region, so only unmodelled
+            # matches can still tell packets in it apart.
+            self.regions += 1
+            self.deciding = _disagreement([self.a[i] for i in a_ids], [self.b[j] for j in b_ids], {})
+            if self.deciding is None:
+                return None
+            return [self._any_value(d) for d in range(dim, _DIMS)]
+
+        children = self._symbol_children if dim < _SYMBOL_DIMS else self._interval_children
+        for value, child_a, child_b in children(dim, a_ids, b_ids):
+            witness = self._solve(dim + 1, child_a, child_b)
+            if witness is not None:
+                return [value] + witness
+        return None
+
+    def _any_value(self, dim: int):
+        if dim < _SYMBOL_DIMS:
+            return self.names[dim][1]
+        return self.domains[dim - _SYMBOL_DIMS][0]
+
+    def _symbol_children(self, dim, a_ids, b_ids):
+        names, other = self.names[dim]
+        values = {other}
+        for matches, ids in ((self.a, a_ids), (self.b, b_ids)):
+            for index in ids:
+                symbol = matches[index].symbols[dim]
+                if symbol is not None:
+                    values.add(names[symbol[:2]])
+        seen = set()
+        for value in sorted(values):
+            child_a = tuple(i for i in a_ids if _symbol_matches(self.a[i].symbols[dim], value))
+            child_b = tuple(j for j in b_ids if _symbol_matches(self.b[j].symbols[dim], value))
+            if (child_a, child_b) not in seen:
+                seen.add((child_a, child_b))
+                yield value, child_a, child_b
+
+    def _interval_children(self, dim, a_ids, b_ids):
+        """Sweep the sorted range boundaries of the rules in play on one numeric field."""
+        field = dim - _SYMBOL_DIMS
+        low, high = self.domains[field]
+        points = {low}
+        for matches, ids in ((self.a, a_ids), (self.b, b_ids)):
+            for index in ids:
+                if not matches[index].full[dim]:
+                    for lo, hi in matches[index].ranges[field]:
+                        points.add(lo)
+                        points.add(hi + 1)
+        points = sorted(point for point in points if point <= high)
+
+        # Rules covering the whole field are in every interval; the others
+        # are added to the intervals their ranges span.
+        everywhere = []
+        buckets = []
+        for matches, ids in ((self.a, a_ids), (self.b, b_ids)):
+            full = tuple(i for i in ids if matches[i].full[dim])
+            spans = defaultdict(list)
+            for index in ids:
+                if not matches[index].full[dim]:
+                    for lo, hi in matches[index].ranges[field]:
+                        for interval in range(bisect_left(points, lo), bisect_right(points, hi)):
+                            spans[interval].append(index)
+            everywhere.append(full)
+            buckets.append(spans)
+
+        suspect_everywhere = (any(self.a[i].suspect for i in everywhere[0]) or
+                              any(self.b[j].suspect for j in everywhere[1]))
+        seen = set()
+        for interval, start in enumerate(points):
+            only_a = tuple(buckets[0].get(interval, ()))
+            only_b = tuple(buckets[1].get(interval, ()))
+            if (only_a, only_b) in seen:
+                continue
+            seen.add((only_a, only_b))
+            if not suspect_everywhere and not any(self.a[i].suspect for i in only_a) and \
+                    not any(self.b[j].suspect for j in only_b):
+                continue
+            yield (start,
+                   tuple(sorted(only_a + everywhere[0])),
+                   tuple(sorted(only_b + everywhere[1])))
+
+
+def _first(matches: List[_Match], assumed: Dict[str, bool]):
+    """Return `(match, None)` for the first rule that applies under `assumed`,
+    or `(None, condition)` if an undecided condition comes first."""
+    for match in matches:
+        if match.condition is None or assumed.get(match.condition):
+            return match, None
+        if match.condition not in assumed:
+            return None, match.condition
+    return None, None
+
+
+def _disagreement(a: List[_Match], b: List[_Match], assumed: Dict[str, bool]) -> Optional[tuple]:
+    """Compare two rule lists that all match one region, up to their conditions.
+
+    Returns `(original, optimized, unmodelled)` for an assignment of the
+    conditions under which the first rules differ in verdict, or None.
+    """
+    first_a, condition = _first(a, assumed)
+    if condition is None:
+        first_b, condition = _first(b, assumed)
+    if condition is not None:
+        for met in (True, False):
+            found = _disagreement(a, b, {**assumed, condition: met})
+            if found is not None:
+                return found
+        return None
+    if (first_a and first_a.action) == (first_b and first_b.action):
+        return None
+    return (first_a and first_a.rule), (first_b and first_b.rule), assumed
+
+
+def _packet(values: list, family: int) -> Packet:
+    def address(value):
+        if family == 4:
+            return str(ipaddress.IPv4Address(value))
+        return str(ipaddress.IPv6Address(value - _V6_OFFSET))
+
+    protocol, in_iface, out_iface, src, dst, src_port, dst_port = values
+    return Packet(
+        src=address(src), dst=address(dst), protocol=protocol,
+        src_port=None if src_port < 0 else src_port,
+        dst_port=None if dst_port < 0 else dst_port,
+        in_iface=in_iface, out_iface=out_iface,
+    )
+
+
+def _families(table: str, rules: List[FirewallRule]) -> Tuple[int, ...]:
+    """Return the address families a chain's packets can have.
+
+    nftables tables name their family (`ip`, `ip6`, `inet`, ...).
+    `iptables-save` and `ip6tables-save` each dump a single family, told
+    apart by the addresses in the rules (IPv4 if there are none).
+    """
+    family = table.split()[0] if " " in table else None
+    if family == "ip":
+        return (4,)
+    if family == "ip6":
+        return (6,)
+    if family is not None:
+        return (4, 6)
+    versions = {
+        network.version for rule in rules for network in (rule.src, rule.dst) if network is not None
+    }
+    return tuple(sorted(versions)) or (4,)
+
+
+def _deciding(rules: List[FirewallRule]) -> List[FirewallRule]:
+    return [rule for rule in rules if rule.action and rule.action not in NON_TERMINATING]
+
+
+def verify_equivalence(original: List[FirewallRule],
+                       optimized: List[FirewallRule]) -> EquivalenceResult:
+    """Check that both rulesets give every packet the same verdict in every chain.
+
+    Returns the first counterexample found, if any. A chain missing from
+    one ruleset is treated as empty there, so its packets get the policy.
+    """
+    before = dict(ChainPartition.of(original).items())
+    after = dict(ChainPartition.of(optimized).items())
+    result = EquivalenceResult()
+
+    for key in list(before) + [key for key in after if key not in before]:
+        result.chains += 1
+        rules_a = _deciding(before.get(key, []))
+        rules_b = _deciding(after.get(key, []))
+        for family in _families(key[0], rules_a + rules_b):
+            a = _live([m for m in (_compile(rule, family) for rule in rules_a) if m is not None])
+            b = _live([m for m in (_compile(rule, family) for rule in rules_b) if m is not None])
+            _mark_suspects(a, b)
+            check = _ChainCheck(a, b, family)
+            values = check.counterexample()
+            result.regions += check.regions
+            if values is not None:
+                original, optimized, unmodelled = check.deciding
+                result.counterexample = Counterexample(
+                    table=key[0], chain=key[1], packet=_packet(values, family),
+                    original=original, optimized=optimized, unmodelled=unmodelled,
+                )
+                return result
+    return result
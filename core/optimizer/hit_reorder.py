@@ -0,0 +1,178 @@
+"""Reorder rules so that frequently hit rules are evaluated first.
+
+The kernel walks a chain top to bottom until a rule matches, so a hot rule
+deep in a long chain costs every one of its packets a walk past all the
+rules above it. Given per-rule hit counters (from `iptables-save -c`),
+`reorder_by_hits` moves hot rules up as far as it can without changing
+what any packet ends up doing.
+
+Two rules of a chain may trade places only if no packet can match both,
+or if both end evaluation with the same verdict. Every other pair keeps
+its original relative order. Within those constraints rules are emitted
+greedily, hottest available rule first (a priority topological sort,
+where a rule also inherits the hits of the rules it holds back).
+
+Overlap is judged on the fields the parser understands, with protocols
+compared by canonical name (`-p 6` is `tcp`) and `eth+` interface
+wildcards overlapping every interface they name. Options it does
+not parse (`-m state`, `-m multiport`, ...) only narrow what a rule
+matches, so treating them as wildcards errs on the safe side. Negated
+options (`! -s ...`) would not, so such rules are treated as overlapping
+everything.
+"""
+
+import heapq
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from core.models.firewall_rule import FirewallRule
+from core.models.chain_partition import ChainKey, ChainPartition
+from core.models.compiled_rule import (
+    SymbolTable, canonical_protocol, compile_rule, compile_rules, interfaces_overlap,
+)
+
+#: Verdicts after which evaluation stops with an outcome that does not
+#: depend on the rule, so overlapping rules with the same one may swap.
+SWAPPABLE_VERDICTS = frozenset({"ACCEPT", "DROP", "RETURN"})
+
+
+@dataclass
+class ReorderResult:
+    """Reordered rules and the expected evaluation cost before and after.
+
+    Costs are the average number of rules evaluated per packet that hits
+    a rule, weighted by `packet_count`. Packets that fall through to the
+    chain policy walk the whole chain either way and are not included.
+    `after` is an upper bound: a moved rule may now catch packets first
+    that used to be matched further down by a rule with the same verdict.
+    """
+
+    rules: List[FirewallRule]
+    before: float = 0.0
+    after: float = 0.0
+    moved: int = 0
+    chains: Dict[ChainKey, Tuple[float, float]] = field(default_factory=dict)
+
+    @property
+    def reduction(self) -> float:
+        """Fraction of rule evaluations saved (0 when there are no hits)."""
+        return (self.before - self.after) / self.before if self.before else 0.0
+
+
+def _normalized(rule: FirewallRule) -> FirewallRule:
+    """Return `rule` with a canonical protocol and no interfaces.
+
+    Compiled rules compare interfaces by name, which misses wildcards, so
+    interfaces are checked by `_interfaces_overlap` instead.
+    """
+    return FirewallRule(
+        table=rule.table, chain=rule.chain, protocol=canonical_protocol(rule.protocol),
+        src=rule.src, dst=rule.dst, src_port=rule.src_port, dst_port=rule.dst_port,
+        in_iface=None, out_iface=None,
+        action=rule.action, raw=rule.raw, order=rule.order,
+    )
+
+
+def _interfaces_overlap(rule_a: FirewallRule, rule_b: FirewallRule) -> bool:
+    return (interfaces_overlap(rule_a.in_iface, rule_b.in_iface) and
+            interfaces_overlap(rule_a.out_iface, rule_b.out_iface))
+
+
+def _has_negation(rule: FirewallRule) -> bool:
+    return "!" in rule.raw.split()
+
+
+def must_keep_order(rule_a: FirewallRule, rule_b: FirewallRule) -> bool:
+    """Return True if swapping two rules of a chain could change semantics."""
+    if rule_a.action == rule_b.action and rule_a.action in SWAPPABLE_VERDICTS:
+        return False
+    if _has_negation(rule_a) or _has_negation(rule_b):
+        return True
+    if not _interfaces_overlap(rule_a, rule_b):
+        return False
+    compiled_a, compiled_b = compile_rules([_normalized(rule_a), _normalized(rule_b)])
+    return compiled_a.overlaps(compiled_b)
+
+
+def _hits(rule: FirewallRule) -> int:
+    return rule.packet_count or 0
+
+
+def _cost(bucket: List[FirewallRule]) -> Tuple[int, int]:
+    """Return (sum of hits * 1-based position, sum of hits) for a chain."""
+    weighted = sum(_hits(rule) * position for position, rule in enumerate(bucket, 1))
+    return weighted, sum(_hits(rule) for rule in bucket)
+
+
+def reorder_chain(bucket: List[FirewallRule]) -> List[FirewallRule]:
+    """Return one chain's rules reordered by hits, keeping its semantics."""
+    symbols = SymbolTable()
+    compiled = [
+        None if _has_negation(rule) else compile_rule(_normalized(rule), symbols)
+        for rule in bucket
+    ]
+    blockers: List[List[int]] = [[] for _ in bucket]
+    waiting = [0] * len(bucket)
+    for j, later in enumerate(bucket):
+        for i in range(j):
+            earlier = bucket[i]
+            if earlier.action == later.action and earlier.action in SWAPPABLE_VERDICTS:
+                continue
+            if compiled[i] is None or compiled[j] is None or (
+                    _interfaces_overlap(earlier, later) and compiled[i].overlaps(compiled[j])):
+                blockers[i].append(j)
+                waiting[j] += 1
+
+    # A rule's priority is the most hits of itself or any rule it holds
+    # back, so a cold rule in front of a hot one is pulled up with it.
+    priority = [_hits(rule) for rule in bucket]
+    for i in range(len(bucket) - 1, -1, -1):
+        for j in blockers[i]:
+            if priority[j] > priority[i]:
+                priority[i] = priority[j]
+
+    ready = [(-priority[i], i) for i in range(len(bucket)) if waiting[i] == 0]
+    heapq.heapify(ready)
+    ordered: List[FirewallRule] = []
+    while ready:
+        _, i = heapq.heappop(ready)
+        ordered.append(bucket[i])
+        for j in blockers[i]:
+            waiting[j] -= 1
+            if waiting[j] == 0:
+                heapq.heappush(ready, (-priority[j], j))
+    return ordered
+
+
+def reorder_by_hits(rules: List[FirewallRule],
+                    min_hits: Optional[int] = None) -> ReorderResult:
+    """Move frequently hit rules earlier in their chains.
+
+    Rules are reordered only within their own chain, and only where
+    `must_keep_order` allows. Chains are returned in their original
+    order, one after the other. With `min_hits`, chains whose rules have
+    fewer hits in total are left untouched.
+    """
+    partition = ChainPartition.of(rules)
+    result = ReorderResult(rules=[])
+    total_before = total_after = total_hits = 0
+
+    for key, bucket in partition.items():
+        weighted_before, hits = _cost(bucket)
+        if hits == 0 or (min_hits is not None and hits < min_hits):
+            ordered = list(bucket)
+        else:
+            ordered = reorder_chain(bucket)
+        weighted_after, _ = _cost(ordered)
+
+        result.rules.extend(ordered)
+        result.moved += sum(1 for a, b in zip(bucket, ordered) if a is not b)
+        if hits:
+            result.chains[key] = (weighted_before / hits, weighted_after / hits)
+        total_before += weighted_before
+        total_after += weighted_after
+        total_hits += hits
+
+    if total_hits:
+        result.before = total_before / total_hits
+        result.after = total_after / total_hits
+    return result
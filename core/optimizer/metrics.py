@@ -6,16 +6,18 @@ are intentionally straightforward and designed for reporting and
 regression tests rather than as a comprehensive scoring function.
 """
 
-from typing import Dict, List
+from typing import Dict, List, Optional
 from core.models.firewall_rule import FirewallRule
-from core.anomalies.redundancy import detect_redundant_rules
-from core.anomalies.shadowing import detect_shadowed_rules
-from core.anomalies.conflicts import detect_conflicting_rules
+from core.anomalies.analysis import AnalysisResult
 
 
-def compute_metrics(rules: List[FirewallRule]) -> Dict:
+def compute_metrics(rules: List[FirewallRule],
+                    analysis: Optional[AnalysisResult] = None) -> Dict:
     """Compute a set of metrics describing the given rule list.
 
+    If `analysis` is given it must have been built from `rules`; its
+    detector results are reused instead of running the analyzers again.
+
     Returns a dictionary containing:
       - total_rules: total number of rules provided
       - redundant_rules: number of exact duplicates found (later duplicates)
@@ -27,10 +29,13 @@ def compute_metrics(rules: List[FirewallRule]) -> Dict:
         redundancy/shadowing (value between 0 and 1). Zero is returned if
         the input list is empty to avoid a division-by-zero error.
     """
-    # Detect specific anomaly types using helper analyzers.
-    redundant = detect_redundant_rules(rules)
-    shadowed = detect_shadowed_rules(rules)
-    conflicts = detect_conflicting_rules(rules)
+    # Detect specific anomaly types using helper analyzers, unless the
+    # caller already has the results from a single analysis pass.
+    if analysis is None:
+        analysis = AnalysisResult.from_rules(rules)
+    redundant = analysis.redundant
+    shadowed = analysis.shadowed
+    conflicts = analysis.conflicts
 
     # A simple optimistic estimate of rules remaining after optimization:
     # treat all redundant and shadowed rules as removable. Note that this
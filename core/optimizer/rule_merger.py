@@ -0,0 +1,217 @@
+"""Merge runs of adjacent rules that differ only in one address or port.
+
+Generated rulesets often contain runs such as::
+
+    -A INPUT -s 10.0.0.0/24 -j ACCEPT
+    -A INPUT -s 10.0.1.0/24 -j ACCEPT
+
+which match exactly the same packets as a single `-s 10.0.0.0/23` rule.
+`merge_rules` collapses such runs: addresses into the minimal set of CIDR
+blocks covering the same addresses (`ipaddress.collapse_addresses`) and
+ports into the union of their ranges, joining ranges that touch.
+
+Rules are only merged when their raw text is identical apart from the one
+value being merged, so options the parser does not understand (`-m state`,
+comments, log prefixes, ...) are never lost, and the merged rule's `raw`
+is that same text with the merged value. Only consecutive rules of a
+chain are merged, so no other rule can be evaluated in between. Runs whose
+members overlap are merged only for verdicts where matching twice is the
+same as matching once (see `hit_reorder.SWAPPABLE_VERDICTS`); rules with
+negated options are never merged.
+"""
+
+import dataclasses
+import ipaddress
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+from core.models.firewall_rule import FirewallRule
+from core.models.chain_partition import ChainKey, ChainPartition
+from core.optimizer.hit_reorder import SWAPPABLE_VERDICTS
+from core.utils.interval_tree import port_range
+
+#: Option keywords in front of each mergeable field (iptables, nftables).
+MERGE_OPTIONS = {
+    "src": ("-s", "saddr"),
+    "dst": ("-d", "daddr"),
+    "src_port": ("--sport", "sport"),
+    "dst_port": ("--dport", "dport"),
+}
+
+_ADDRESS_FIELDS = ("src", "dst")
+
+Template = Tuple[str, Tuple[str, ...], Tuple[str, ...]]
+
+
+@dataclass
+class MergeResult:
+    """Merged rules and the rule count of each chain before and after."""
+
+    rules: List[FirewallRule]
+    chains: Dict[ChainKey, Tuple[int, int]] = field(default_factory=dict)
+
+    @property
+    def before(self) -> int:
+        return sum(before for before, _ in self.chains.values())
+
+    @property
+    def after(self) -> int:
+        return sum(after for _, after in self.chains.values())
+
+
+def rule_template(rule: FirewallRule, field_name: str) -> Optional[Template]:
+    """Return the rule text around the value of `field_name`, or None.
+
+    Two rules with the same template differ at most in that value.
+    """
+    if getattr(rule, field_name) is None:
+        return None
+    tokens = rule.raw.split()
+    if "!" in tokens:
+        return None
+    options = MERGE_OPTIONS[field_name]
+    positions = [i for i, token in enumerate(tokens[:-1]) if token in options]
+    if len(positions) != 1:
+        return None
+    value = positions[0] + 1
+    return (tokens[positions[0]], tuple(tokens[:value]), tuple(tokens[value + 1:]))
+
+
+def merge_networks(networks) -> list:
+    """Return the fewest networks covering the same addresses, IPv4 first."""
+    by_version: Dict[int, list] = {}
+    for network in networks:
+        by_version.setdefault(network.version, []).append(network)
+    merged = []
+    for version in sorted(by_version):
+        merged.extend(ipaddress.collapse_addresses(by_version[version]))
+    return merged
+
+
+def merge_ports(ports) -> list:
+    """Return the union of ports/port ranges as sorted, non-touching values."""
+    merged: List[List[int]] = []
+    for start, end in sorted(port_range(port) for port in ports):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [start if start == end else (start, end) for start, end in merged]
+
+
+def can_combine(run: List[FirewallRule], field_name: str) -> bool:
+    """Return True if matching any value of the run is the same as the run.
+
+    That holds when the run's values do not overlap, or when its verdict
+    makes matching twice the same as matching once.
+    """
+    return run[0].action in SWAPPABLE_VERDICTS or _disjoint(
+        [getattr(rule, field_name) for rule in run], field_name
+    )
+
+
+def _disjoint(values, field_name: str) -> bool:
+    if field_name in _ADDRESS_FIELDS:
+        ranges = sorted((int(v.network_address), int(v.broadcast_address), v.version) for v in values)
+        return all(
+            a[2] != b[2] or a[1] < b[0] for a, b in zip(ranges, ranges[1:])
+        )
+    ranges = sorted(port_range(v) for v in values)
+    return all(a[1] < b[0] for a, b in zip(ranges, ranges[1:]))
+
+
+def format_value(value, option: str) -> str:
+    """Format a merged address or port the way `option`'s syntax writes it."""
+    if isinstance(value, tuple):
+        separator = ":" if option.startswith("-") else "-"
+        return f"{value[0]}{separator}{value[1]}"
+    return str(value)
+
+
+def _merge_run(run: List[FirewallRule], field_name: str, template: Template) -> List[FirewallRule]:
+    """Return the merged replacement for a run, or the run itself."""
+    values = [getattr(rule, field_name) for rule in run]
+    if not can_combine(run, field_name):
+        return run
+    if field_name in _ADDRESS_FIELDS:
+        merged = merge_networks(values)
+    else:
+        merged = merge_ports(values)
+    if len(merged) >= len(run):
+        return run
+
+    option, head, tail = template
+    first = run[0]
+    counted = all(rule.packet_count is not None for rule in run) and len(merged) == 1
+    replacements = []
+    for value in merged:
+        fields = {f.name: getattr(first, f.name) for f in dataclasses.fields(FirewallRule)}
+        fields[field_name] = value
+        fields["raw"] = " ".join(head + (format_value(value, option),) + tail)
+        fields["packet_count"] = sum(r.packet_count for r in run) if counted else None
+        fields["byte_count"] = sum(r.byte_count or 0 for r in run) if counted else None
+        replacements.append(FirewallRule(**fields))
+    return replacements
+
+
+def iter_runs(bucket: List[FirewallRule]) -> Iterator[Tuple[List[FirewallRule], Optional[str], Optional[Template]]]:
+    """Split a chain into runs of rules sharing a template on one field.
+
+    Yields `(run, field_name, template)`, picking the longest run starting
+    at each position; rules that start no run of two or more are yielded
+    alone with `field_name` and `template` set to None.
+    """
+    i = 0
+    while i < len(bucket):
+        best = None
+        for field_name in MERGE_OPTIONS:
+            template = rule_template(bucket[i], field_name)
+            if template is None:
+                continue
+            end = i + 1
+            while end < len(bucket) and rule_template(bucket[end], field_name) == template:
+                end += 1
+            if end - i > 1 and (best is None or end > best[0]):
+                best = (end, field_name, template)
+
+        if best is None:
+            yield [bucket[i]], None, None
+            i += 1
+        else:
+            end, field_name, template = best
+            yield bucket[i:end], field_name, template
+            i = end
+
+
+def _merge_pass(bucket: List[FirewallRule]) -> List[FirewallRule]:
+    """Merge the longest run starting at each position, left to right."""
+    out: List[FirewallRule] = []
+    for run, field_name, template in iter_runs(bucket):
+        if field_name is None:
+            out.extend(run)
+        else:
+            out.extend(_merge_run(run, field_name, template))
+    return out
+
+
+def merge_chain(bucket: List[FirewallRule]) -> List[FirewallRule]:
+    """Merge one chain until no run can be merged any further.
+
+    Repeating lets a grid of rules collapse on one field after another,
+    for example sources first and then destinations.
+    """
+    while True:
+        merged = _merge_pass(bucket)
+        if len(merged) == len(bucket):
+            return merged
+        bucket = merged
+
+
+def merge_rules(rules: List[FirewallRule]) -> MergeResult:
+    """Merge mergeable runs in every chain and report the rule counts."""
+    partition = ChainPartition.of(rules)
+    result = MergeResult(rules=[])
+    for key, bucket in partition.items():
+        merged = merge_chain(bucket)
+        result.rules.extend(merged)
+        result.chains[key] = (len(bucket), len(merged))
+    return result
@@ -4,16 +4,24 @@ This module provides a lightweight optimizer that removes rules flagged as
 redundant or shadowed by the analyzer modules. The optimizer preserves the
 original rule order and performs a conservative filter: it only removes
 rules that are exact duplicates or are shadowed by earlier rules. It does
-not attempt to resolve conflicts or reorder rules.
+not attempt to resolve conflicts. Merging adjacent rules and reordering
+by hit counters are opt-in (see `core.optimizer.rule_merger` and
+`core.optimizer.hit_reorder`).
 """
 
-from typing import List
+from typing import List, Optional
 from core.models.firewall_rule import FirewallRule
+from core.anomalies.analysis import AnalysisResult
 from core.anomalies.redundancy import detect_redundant_rules
 from core.anomalies.shadowing import detect_shadowed_rules
+from core.optimizer.hit_reorder import reorder_by_hits
+from core.optimizer.rule_merger import merge_rules
 
 
-def optimize_rules(rules: List[FirewallRule]) -> List[FirewallRule]:
+def optimize_rules(rules: List[FirewallRule],
+                   analysis: Optional[AnalysisResult] = None,
+                   merge: bool = False,
+                   reorder: bool = False) -> List[FirewallRule]:
     """Return a new list with redundant and shadowed rules removed.
 
     The function asks the analyzers for redundant and shadowed rules and
@@ -22,20 +30,41 @@ def optimize_rules(rules: List[FirewallRule]) -> List[FirewallRule]:
     original input; comparing identities avoids depending on equality
     implementations and ensures the correct instances are filtered out.
 
+    If `analysis` is given (built from `rules`), its redundant and shadowed
+    results are reused rather than recomputed.
+
+    With `merge=True` runs of adjacent rules that differ only in one
+    address or port are collapsed into fewer rules (see `merge_rules`,
+    which also reports the per-chain rule counts).
+
+    With `reorder=True` the remaining rules are also moved so that rules
+    with high `packet_count` come first, wherever that cannot change
+    semantics (see `reorder_by_hits`, which also reports the saving).
+
     Note: This optimizer is intentionally simple and conservative. It does
-    not attempt to fix conflicts or perform rule merging/reordering.
+    not attempt to fix conflicts.
     """
     # Build a set of identities for rules to remove for O(1) membership
     # tests while preserving the original order in the final list.
-    redundant = {id(r) for r in detect_redundant_rules(rules)}
-    shadowed = {id(r) for r in detect_shadowed_rules(rules)}
+    # Conflict detection is not needed here, so without a shared analysis
+    # only the two detectors we use are run.
+    if analysis is None:
+        analysis = AnalysisResult(
+            rules=list(rules),
+            redundant=detect_redundant_rules(rules),
+            shadowed=detect_shadowed_rules(rules),
+        )
+    removable = analysis.removable_ids()
 
     # Keep only rules that are not marked as redundant or shadowed. Using
     # `id(rule)` here ensures we are filtering the exact instances
     # identified by the analyzers.
-    optimized = [
-        rule for rule in rules
-        if id(rule) not in redundant and id(rule) not in shadowed
-    ]
+    optimized = [rule for rule in rules if id(rule) not in removable]
+
+    # Merging needs rules to be adjacent, so it runs before reordering.
+    if merge:
+        optimized = merge_rules(optimized).rules
+    if reorder:
+        optimized = reorder_by_hits(optimized).rules
 
     return optimized
@@ -0,0 +1,170 @@
+"""
+Memory-mapped, bytes-level parser for large iptables-save dumps.
+
+`FastIptablesParser` produces the same rules as `IptablesParser`, but it
+`mmap`s the dump instead of reading it into one string, scans it line by
+line as `bytes`, ignores everything except table headers and `-A` lines,
+and handles tokens through a dispatch table instead of an if/elif ladder.
+
+The original line text is not copied: each rule keeps only an offset
+range into the map and decodes `raw` on first access. The map stays open
+for as long as any rule parsed from it is alive.
+"""
+
+import mmap
+import os
+from typing import Iterator, List, Optional, Union
+from core.models.firewall_rule import FirewallRule
+from core.parsers.iptables_parser import IptablesParser
+from core.utils.intern_cache import intern_name
+
+
+class MappedFirewallRule(FirewallRule):
+    """A `FirewallRule` whose `raw` text is read lazily from a memory map.
+
+    It behaves like a normal `FirewallRule` (same fields, `==`, `repr`);
+    only `raw` is computed on access. Pickling turns it into a plain
+    `FirewallRule`, since memory maps cannot be sent between processes.
+    """
+
+    def __init__(self, source: mmap.mmap, start: int, end: int, fields: dict):
+        self.__dict__.update(fields)
+        self._source = source
+        self._span = (start, end)
+
+    @property
+    def raw(self) -> str:
+        start, end = self._span
+        return self._source[start:end].decode("utf-8", errors="replace")
+
+    def __eq__(self, other):
+        if not isinstance(other, FirewallRule):
+            return NotImplemented
+        return _field_values(self) == _field_values(other)
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return (FirewallRule, _field_values(self))
+
+
+def _field_values(rule: FirewallRule) -> tuple:
+    return (
+        rule.table, rule.chain, rule.protocol, rule.src, rule.dst,
+        rule.src_port, rule.dst_port, rule.in_iface, rule.out_iface,
+        rule.action, rule.raw, rule.order,
+        rule.packet_count, rule.byte_count,
+    )
+
+
+def _text(value: bytes) -> str:
+    # Decoded like `raw`: one byte that is not UTF-8 (in a comment or an
+    # interface name) must not abort a parse the text parser would finish.
+    return value.decode("utf-8", errors="replace")
+
+
+# Token dispatch table: option -> (field name, converter for its value).
+_DISPATCH = {
+    b"-p": ("protocol", lambda v: _text(v).lower()),
+    b"-s": ("src", lambda v: IptablesParser._parse_ip(_text(v))),
+    b"-d": ("dst", lambda v: IptablesParser._parse_ip(_text(v))),
+    b"--sport": ("src_port", lambda v: IptablesParser._parse_port(_text(v))),
+    b"--dport": ("dst_port", lambda v: IptablesParser._parse_port(_text(v))),
+    b"-i": ("in_iface", lambda v: intern_name(_text(v))),
+    b"-o": ("out_iface", lambda v: intern_name(_text(v))),
+    b"-j": ("action", lambda v: _text(v).upper()),
+}
+
+_MATCH_FIELDS = ("protocol", "src", "dst", "src_port", "dst_port", "in_iface", "out_iface", "action")
+
+
+class FastIptablesParser:
+    def parse_file(self, path: Union[str, os.PathLike]) -> List[FirewallRule]:
+        """Parse an iptables-save file and return its rules."""
+        return list(self.iter_parse_file(path))
+
+    def iter_parse_file(self, path: Union[str, os.PathLike]) -> Iterator[FirewallRule]:
+        """Yield rules from an iptables-save file using a memory map."""
+        with open(path, "rb") as handle:
+            if os.fstat(handle.fileno()).st_size == 0:
+                return
+            source = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        # The map outlives the file handle; rules keep it alive for `raw`.
+        yield from self.iter_parse_map(source)
+
+    def iter_parse_map(self, source: mmap.mmap) -> Iterator[FirewallRule]:
+        """Yield rules from an already mapped iptables-save dump."""
+        current_table: Optional[str] = None
+        rule_order: dict[str, dict[str, int]] = {}
+        # Dumps repeat the same option values over and over, so each
+        # distinct (option, value) pair is only converted once per parse.
+        converted: dict[tuple, object] = {}
+        readline = source.readline
+        tell = source.tell
+        source.seek(0)
+
+        while True:
+            offset = tell()
+            line = readline()
+            if not line:
+                break
+
+            stripped = line.strip()
+            start = offset + len(line) - len(line.lstrip())
+            hits = None
+            if stripped.startswith(b"["):
+                # `iptables-save -c` prefix; `raw` starts after it.
+                hits, rest = self._split_counters(stripped)
+                start += len(stripped) - len(rest)
+                stripped = rest
+
+            if stripped.startswith(b"-A"):
+                tokens = stripped.split()
+                chain = _text(tokens[1])
+
+                counters = rule_order[current_table]
+                counters[chain] = counters.get(chain, 0) + 1
+
+                fields = self._match_fields(tokens, converted)
+                fields["table"] = current_table
+                fields["chain"] = chain
+                fields["order"] = counters[chain]
+                fields["packet_count"], fields["byte_count"] = hits or (None, None)
+                yield MappedFirewallRule(source, start, start + len(stripped), fields)
+            elif stripped.startswith(b"*"):
+                current_table = _text(stripped[1:])
+                rule_order[current_table] = {}
+
+    @staticmethod
+    def _split_counters(line: bytes):
+        """Bytes version of `IptablesParser._split_counters`."""
+        end = line.find(b"]")
+        if end < 0:
+            return None, line
+        try:
+            packets, byte_count = line[1:end].split(b":")
+            counters = (int(packets), int(byte_count))
+        except ValueError:
+            counters = None
+        return counters, line[end + 1:].lstrip()
+
+    @staticmethod
+    def _match_fields(tokens: List[bytes], converted: dict) -> dict:
+        """Extract the match fields of one `-A` line via the dispatch table."""
+        fields = dict.fromkeys(_MATCH_FIELDS)
+        dispatch = _DISPATCH
+        last = len(tokens) - 1
+        i = 2
+        while i < last:
+            entry = dispatch.get(tokens[i])
+            if entry is None:
+                i += 1
+                continue
+            key = (tokens[i], tokens[i + 1])
+            try:
+                value = converted[key]
+            except KeyError:
+                value = converted[key] = entry[1](tokens[i + 1])
+            fields[entry[0]] = value
+            i += 2
+        return fields
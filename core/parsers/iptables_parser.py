@@ -7,23 +7,33 @@ This parser extracts only the fields needed for analysis:
 - Source/destination ports (--sport/--dport)
 - Input/output interfaces (-i/-o)
 - Target action (-j)
+- Packet and byte counters (`[pkts:bytes]` prefix written by `iptables-save -c`)
 
 It preserves the original raw line in the FirewallRule object for debugging.
 """
 
-from typing import List, Optional, Union
+from typing import Iterable, Iterator, List, Optional, Union
 import ipaddress
 from core.models.firewall_rule import FirewallRule
+from core.utils.intern_cache import intern_name, parse_network, parse_port
 
 
 class IptablesParser:
     def parse(self, text: str) -> List[FirewallRule]:
         """Parse iptables-save text and extract rules."""
-        rules: List[FirewallRule] = []
+        return list(self.iter_parse(text.splitlines()))
+
+    def iter_parse(self, fileobj: Iterable[str]) -> Iterator[FirewallRule]:
+        """Yield rules one at a time from a text stream.
+
+        `fileobj` can be an open text file, `sys.stdin` or any other
+        iterable of lines, so large dumps never have to be held in memory
+        as a single string or a complete rule list.
+        """
         current_table: Optional[str] = None
         rule_order: dict[str, dict[str, int]] = {}
 
-        for line in text.splitlines():
+        for line in fileobj:
             line = line.strip()
 
             if not line or line.startswith("#"):
@@ -34,6 +44,10 @@ class IptablesParser:
                 rule_order[current_table] = {}
                 continue
 
+            counters = None
+            if line.startswith("["):
+                counters, line = self._split_counters(line)
+
             if line.startswith("-A"):
                 tokens = line.split()
                 chain = tokens[1]
@@ -49,9 +63,26 @@ class IptablesParser:
                     order=rule_order[current_table][chain],
                     raw=line
                 )
-                rules.append(rule)
+                if counters is not None:
+                    rule.packet_count, rule.byte_count = counters
+                yield rule
 
-        return rules
+    @staticmethod
+    def _split_counters(line: str):
+        """Split `[pkts:bytes] -A ...` into `((pkts, bytes), "-A ...")`.
+
+        The bracketed prefix is always removed, so the rule is kept; the
+        counters are None if it is not a valid counter pair.
+        """
+        end = line.find("]")
+        if end < 0:
+            return None, line
+        try:
+            packets, byte_count = line[1:end].split(":")
+            counters = (int(packets), int(byte_count))
+        except ValueError:
+            counters = None
+        return counters, line[end + 1:].lstrip()
 
     def _parse_tokens(
         self,
@@ -89,10 +120,10 @@ class IptablesParser:
                 dst_port = self._parse_port(tokens[i + 1])
                 i += 2
             elif tokens[i] == "-i":
-                in_iface = tokens[i + 1]
+                in_iface = intern_name(tokens[i + 1])
                 i += 2
             elif tokens[i] == "-o":
-                out_iface = tokens[i + 1]
+                out_iface = intern_name(tokens[i + 1])
                 i += 2
             elif tokens[i] == "-j":
                 action = tokens[i + 1].upper()
@@ -117,22 +148,16 @@ class IptablesParser:
 
     @staticmethod
     def _parse_ip(ip_str: str) -> Optional[ipaddress.IPv4Network]:
-        """Convert string to IPv4Network or return None if invalid."""
+        """Convert string to IPv4Network or return None if invalid.
+
+        Networks are interned, so repeated values share one object.
+        """
         try:
-            return ipaddress.ip_network(ip_str, strict=False)
+            return parse_network(ip_str)
         except ValueError:
             return None
 
     @staticmethod
     def _parse_port(port_str: str) -> Optional[Union[int, tuple[int, int]]]:
         """Convert port or port range string to int or tuple."""
-        if ":" in port_str:
-            try:
-                start, end = map(int, port_str.split(":"))
-                return (start, end)
-            except ValueError:
-                return None
-        try:
-            return int(port_str)
-        except ValueError:
-            return None
+        return parse_port(port_str, ":")
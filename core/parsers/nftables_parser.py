@@ -7,15 +7,21 @@ It maps nftables constructs to the generic FirewallRule model.
 
 import re
 import ipaddress
-from typing import List, Optional, Union, Dict
+from typing import Dict, Iterable, Iterator, List, Optional, Union
 from core.models.firewall_rule import FirewallRule
+from core.utils.intern_cache import intern_name, parse_network, parse_port
 
 
 class NftablesParser:
     def parse(self, text: str) -> List[FirewallRule]:
         """Parse nftables text and extract rules."""
-        rules: List[FirewallRule] = []
-        
+        return list(self.iter_parse(text.splitlines()))
+
+    def iter_parse(self, fileobj: Iterable[str]) -> Iterator[FirewallRule]:
+        """Yield rules one at a time from a text stream.
+
+        `fileobj` can be an open text file or any other iterable of lines.
+        """
         # Context tracking
         current_table: Optional[str] = None
         current_chain: Optional[str] = None
@@ -31,9 +37,7 @@ class NftablesParser:
         # closing brace }
         close_regex = re.compile(r'^\}\s*$')
 
-        lines = text.splitlines()
-        
-        for line in lines:
+        for line in fileobj:
             line = line.strip()
             if not line or line.startswith('#'):
                 continue
@@ -81,9 +85,7 @@ class NftablesParser:
                     rule_order[current_table][current_chain]
                 )
                 if rule:
-                    rules.append(rule)
-
-        return rules
+                    yield rule
 
     def _parse_rule(self, line: str, table: str, chain: str, order: int) -> Optional[FirewallRule]:
         """Parse a single rule line."""
@@ -138,17 +140,21 @@ class NftablesParser:
             
             # Interfaces
             elif token == 'iifname':
-                in_iface = tokens[i+1]
+                in_iface = intern_name(tokens[i+1])
                 i += 2
             elif token == 'oifname':
-                out_iface = tokens[i+1]
+                out_iface = intern_name(tokens[i+1])
                 i += 2
             
             # Actions (terminal)
             elif token in ('accept', 'drop', 'reject', 'return'):
                 action = token.upper()
                 i += 1
-            
+            # Jumps to other chains, like iptables' `-j CHAIN`
+            elif token in ('jump', 'goto') and i + 1 < len(tokens):
+                action = tokens[i+1].upper()
+                i += 2
+
             # Skip unknown tokens
             else:
                 i += 1
@@ -183,20 +189,11 @@ class NftablesParser:
     @staticmethod
     def _parse_ip(ip_str: str) -> Optional[ipaddress.IPv4Network]:
         try:
-            return ipaddress.ip_network(ip_str, strict=False)
+            return parse_network(ip_str)
         except ValueError:
             return None
     
     @staticmethod
     def _parse_port(port_str: str) -> Optional[Union[int, tuple]]:
         # Handle ranges like 80-90
-        if '-' in port_str:
-            try:
-                start, end = map(int, port_str.split('-'))
-                return (start, end)
-            except ValueError:
-                return None
-        try:
-            return int(port_str)
-        except ValueError:
-            return None
+        return parse_port(port_str, '-')
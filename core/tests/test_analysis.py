@@ -0,0 +1,50 @@
+from core.parsers.iptables_parser import IptablesParser
+from core.anomalies.analysis import AnalysisResult
+from core.anomalies.redundancy import detect_redundant_rules, iter_redundant_rules
+from core.anomalies.shadowing import detect_shadowed_rules, iter_shadowed_rules
+from core.anomalies.conflicts import detect_conflicting_rules, iter_conflicting_rules
+from core.optimizer.metrics import compute_metrics
+from core.optimizer.rule_optimizer import optimize_rules
+
+sample = """
+*filter
+-A INPUT -p tcp --dport 22 -j ACCEPT
+-A INPUT -p tcp --dport 22 -j ACCEPT
+-A INPUT -s 10.0.0.0/8 -j DROP
+-A INPUT -s 10.1.0.0/16 -p tcp -j ACCEPT
+-A INPUT -j DROP
+-A OUTPUT -p udp -j ACCEPT
+COMMIT
+"""
+
+
+def test_analysis_matches_individual_detectors():
+    rules = IptablesParser().parse(sample)
+    analysis = AnalysisResult.from_rules(rules)
+
+    assert analysis.redundant == detect_redundant_rules(rules)
+    assert analysis.shadowed == detect_shadowed_rules(rules)
+    assert analysis.conflicts == detect_conflicting_rules(rules)
+
+
+def test_metrics_and_optimizer_reuse_analysis():
+    rules = IptablesParser().parse(sample)
+    analysis = AnalysisResult.from_rules(rules)
+
+    assert compute_metrics(rules, analysis) == compute_metrics(rules)
+    assert optimize_rules(rules, analysis) == optimize_rules(rules)
+
+
+def test_parallel_analysis_matches_serial():
+    rules = IptablesParser().parse(sample)
+
+    assert AnalysisResult.from_rules(rules, workers=2) == AnalysisResult.from_rules(rules)
+
+
+def test_generator_detectors_yield_the_same_findings():
+    rules = IptablesParser().parse(sample)
+    analysis = AnalysisResult.from_rules(rules)
+
+    assert list(iter_redundant_rules(rules)) == analysis.redundant
+    assert list(iter_shadowed_rules(rules)) == analysis.shadowed
+    assert list(iter_conflicting_rules(rules)) == analysis.conflicts
@@ -0,0 +1,30 @@
+from core.parsers.iptables_parser import IptablesParser
+from core.models.chain_partition import ChainPartition
+from core.anomalies.shadowing import detect_shadowed_rules
+
+sample = """
+*filter
+-A INPUT -j DROP
+-A OUTPUT -p tcp --dport 22 -j ACCEPT
+-A INPUT -p tcp --dport 22 -j ACCEPT
+-A OUTPUT -j DROP
+-A OUTPUT -p udp -j ACCEPT
+COMMIT
+"""
+
+
+def test_partition_groups_by_table_and_chain():
+    rules = IptablesParser().parse(sample)
+    partition = ChainPartition(rules)
+
+    assert list(partition.chains) == [("filter", "INPUT"), ("filter", "OUTPUT")]
+    assert [r.order for r in partition.chains[("filter", "OUTPUT")]] == [1, 2, 3]
+    assert partition.position(rules[3]) == 3
+
+
+def test_partition_results_keep_flat_order():
+    rules = IptablesParser().parse(sample)
+    partition = ChainPartition(rules)
+
+    assert partition.sort_rules([rules[4], rules[2]]) == [rules[2], rules[4]]
+    assert detect_shadowed_rules(partition) == [rules[2], rules[4]]
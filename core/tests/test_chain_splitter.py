@@ -0,0 +1,143 @@
+import ipaddress
+import random
+import pytest
+from core.parsers.iptables_parser import IptablesParser
+from core.parsers.nftables_parser import NftablesParser
+from core.classifier.packet_classifier import Packet, rule_matches
+from core.optimizer.chain_splitter import DST, IN_IFACE, split_chain, split_chains
+
+
+SAMPLE = """*filter
+:INPUT DROP [0:0]
+-A INPUT -i eth0 -p tcp --dport 22 -j ACCEPT
+-A INPUT -i eth1 -p tcp --dport 80 -j ACCEPT
+-A INPUT -i eth0 -p tcp --dport 443 -j ACCEPT
+-A INPUT -j LOG
+-A INPUT -i eth1 -p udp --dport 53 -j ACCEPT
+-A INPUT -i eth0 -p udp --dport 123 -j ACCEPT
+-A INPUT -i eth1 -p tcp --dport 25 -j ACCEPT
+-A INPUT -i eth0 -p 6 --dport 8080 -j DROP
+-A INPUT -i eth1 -p tcp --dport 110 -j DROP
+-A INPUT -i eth2 -j DROP
+COMMIT
+*nat
+-A PREROUTING -i eth0 -j ACCEPT
+-A PREROUTING -i eth0 -j ACCEPT
+-A PREROUTING -i eth0 -j ACCEPT
+-A PREROUTING -i eth0 -j ACCEPT
+COMMIT
+"""
+
+
+def test_split_into_goto_tree():
+    result = split_chains(IptablesParser().parse(SAMPLE), min_rules=4, min_branch=3)
+
+    assert result.iptables_restore().splitlines() == [
+        "*filter",
+        ":INPUT_1 - [0:0]",
+        ":INPUT_2 - [0:0]",
+        "-A INPUT -i eth0 -g INPUT_1",
+        "-A INPUT -i eth1 -g INPUT_2",
+        "-A INPUT -j LOG",
+        "-A INPUT -i eth2 -j DROP",
+        # The LOG rule matches every interface, so each sub-chain keeps it
+        "-A INPUT_1 -i eth0 -p tcp --dport 22 -j ACCEPT",
+        "-A INPUT_1 -i eth0 -p tcp --dport 443 -j ACCEPT",
+        "-A INPUT_1 -j LOG",
+        "-A INPUT_1 -i eth0 -p udp --dport 123 -j ACCEPT",
+        "-A INPUT_1 -i eth0 -p 6 --dport 8080 -j DROP",
+        "-A INPUT_2 -i eth1 -p tcp --dport 80 -j ACCEPT",
+        "-A INPUT_2 -j LOG",
+        "-A INPUT_2 -i eth1 -p udp --dport 53 -j ACCEPT",
+        "-A INPUT_2 -i eth1 -p tcp --dport 25 -j ACCEPT",
+        "-A INPUT_2 -i eth1 -p tcp --dport 110 -j DROP",
+        "COMMIT",
+        # Only filter chains are split
+        "*nat",
+        "-A PREROUTING -i eth0 -j ACCEPT",
+        "-A PREROUTING -i eth0 -j ACCEPT",
+        "-A PREROUTING -i eth0 -j ACCEPT",
+        "-A PREROUTING -i eth0 -j ACCEPT",
+        "COMMIT",
+    ]
+
+    cost = result.costs[("filter", "INPUT")]
+    assert (cost.before_average, cost.before_worst) == (5.5, 10)
+    assert (round(cost.after_average, 2), cost.after_worst) == (4.47, 7)
+    assert list(result.costs) == [("filter", "INPUT")]
+
+
+def test_short_chains_are_not_split():
+    result = split_chains(IptablesParser().parse(SAMPLE))
+
+    assert result.costs == {}
+    assert len(result.chains[("filter", "INPUT")]) == 10
+
+
+def test_sub_chains_avoid_empty_jump_targets():
+    text = SAMPLE.replace(":INPUT DROP [0:0]\n", ":INPUT DROP [0:0]\n:INPUT_1 - [0:0]\n-A INPUT -j INPUT_1\n")
+    result = split_chains(IptablesParser().parse(text), min_rules=4, min_branch=3)
+    lines = result.iptables_restore().splitlines()
+
+    assert lines[:4] == ["*filter", ":INPUT_2 - [0:0]", ":INPUT_3 - [0:0]", ":INPUT_1 - [0:0]"]
+    assert "-A INPUT -j INPUT_1" in lines
+    assert not any(line.startswith("-A INPUT_1 ") for line in lines)
+
+
+def test_rules_without_options_are_kept():
+    text = SAMPLE.replace("-A INPUT -j LOG\n", "-A INPUT\n").replace("*nat\n", "*nat\n-A PREROUTING\n")
+    rules = IptablesParser().parse(text)
+
+    lines = split_chains(rules, min_rules=4, min_branch=3).iptables_restore().splitlines()
+    assert lines.count("-A INPUT") == 1
+    assert "-A INPUT_1" in lines and "-A INPUT_2" in lines
+    assert "-A PREROUTING" in lines
+    assert "-A INPUT" in split_chains(rules).iptables_restore().splitlines()
+
+
+def test_rejects_nftables_rules():
+    rules = NftablesParser().parse("table inet filter {\nchain input {\ntcp dport 22 accept\n}\n}\n")
+
+    with pytest.raises(ValueError):
+        split_chains(rules)
+
+
+def _walk(node, packet):
+    """Return every rule the tree evaluates as matching `packet`, in order."""
+    for key, value, child in node.branches:
+        if key == IN_IFACE:
+            taken = packet.in_iface == value
+        elif key == DST:
+            taken = ipaddress.ip_address(packet.dst) in value
+        else:
+            taken = packet.protocol == value
+        if taken:
+            return _walk(child, packet)
+    return [rule for rule in node.rules if rule_matches(rule, packet)]
+
+
+def test_tree_keeps_matches_of_every_packet():
+    rng = random.Random(7)
+    lines = ["*filter"]
+    for _ in range(400):
+        parts = ["-A INPUT"]
+        if rng.random() < 0.8:
+            parts.append(f"-i {rng.choice(['eth0', 'eth1', 'eth2', 'lo'])}")
+        if rng.random() < 0.8:
+            parts.append(f"-p {rng.choice(['tcp', 'udp', 'icmp'])}")
+        if rng.random() < 0.8:
+            parts.append(f"-d 10.{rng.randrange(4)}.{rng.randrange(8)}.0/{rng.choice([8, 16, 24])}")
+        parts.append(f"-j {rng.choice(['ACCEPT', 'DROP', 'LOG', 'RETURN'])}")
+        lines.append(" ".join(parts))
+    rules = IptablesParser().parse("\n".join(lines + ["COMMIT"]))
+    root = split_chain(rules, min_rules=16)
+    assert root.branches
+
+    for _ in range(2000):
+        packet = Packet(
+            dst=f"10.{rng.randrange(5)}.{rng.randrange(9)}.{rng.randrange(256)}",
+            protocol=rng.choice(["tcp", "udp", "icmp", "gre"]),
+            in_iface=rng.choice(["eth0", "eth1", "eth2", "lo", "eth9"]),
+        )
+        expected = [rule for rule in rules if rule_matches(rule, packet)]
+        assert _walk(root, packet) == expected
@@ -0,0 +1,89 @@
+import ipaddress
+import random
+from core.models.firewall_rule import FirewallRule
+from core.parsers.iptables_parser import IptablesParser
+from core.classifier.packet_classifier import Packet, PacketClassifier, linear_classify
+
+
+SAMPLE = """
+*filter
+-A INPUT -p tcp --dport 22 -s 10.0.0.0/8 -j ACCEPT
+-A INPUT -i lo -j ACCEPT
+-A INPUT -p tcp --dport 1000:2000 -j DROP
+-A INPUT -s 192.168.1.0/24 -j ACCEPT
+-A INPUT -s 2001:db8::/32 -p udp -j ACCEPT
+COMMIT
+"""
+
+
+def test_classify_returns_first_matching_rule():
+    classifier = PacketClassifier(IptablesParser().parse(SAMPLE))
+
+    def hit(**fields):
+        rule = classifier.classify(Packet(**fields))
+        return rule and rule.order
+
+    assert hit(src="10.1.2.3", protocol="tcp", dst_port=22) == 1
+    assert hit(src="10.1.2.3", protocol="tcp", dst_port=1500, in_iface="lo") == 2
+    assert hit(src="192.168.1.7", protocol="tcp", dst_port=1500) == 3
+    assert hit(src="192.168.1.7", protocol="icmp") == 4
+    assert hit(src="2001:db8::1", protocol="udp") == 5
+    # A packet without ports does not match rules that require one
+    assert hit(src="10.1.2.3", protocol="tcp") is None
+    assert hit(src="8.8.8.8", protocol="udp", dst_port=53) is None
+
+
+def test_interface_wildcards_and_protocol_numbers():
+    rules = IptablesParser().parse(
+        "*filter\n"
+        "-A INPUT -i eth+ -p tcp --dport 22 -j DROP\n"
+        "-A INPUT -p 6 --dport 80 -j ACCEPT\n"
+        "-A INPUT -p TCP -o wg+ -j ACCEPT\n"
+        "-A INPUT -i eth0 -j ACCEPT\n"
+        "COMMIT\n"
+    )
+    classifier = PacketClassifier(rules)
+
+    def hit(**fields):
+        packet = Packet(**fields)
+        rule = classifier.classify(packet)
+        assert rule is linear_classify(rules, packet)
+        return rule and rule.order
+
+    assert hit(protocol="tcp", dst_port=22, in_iface="eth0") == 1
+    assert hit(protocol="tcp", dst_port=22, in_iface="eth1") == 1
+    assert hit(protocol="tcp", dst_port=22, in_iface="wlan0") is None
+    assert hit(protocol="tcp", dst_port=80) == 2
+    assert hit(protocol="6", dst_port=80) == 2
+    assert hit(protocol="tcp", out_iface="wg0") == 3
+    assert hit(protocol="udp", in_iface="eth0") == 4
+
+
+def test_classifier_agrees_with_linear_scan():
+    rnd = random.Random(7)
+    nets = [None, "10.0.0.0/8", "10.1.0.0/16", "10.1.2.0/24", "10.1.2.3/32", "0.0.0.0/0"]
+    ports = [None, 22, 80, (1000, 2000), (0, 65535)]
+    rules = [
+        FirewallRule(
+            table="filter", chain="INPUT",
+            protocol=rnd.choice([None, "tcp", "udp", "6"]),
+            src=ipaddress.ip_network(s) if (s := rnd.choice(nets)) else None,
+            dst=ipaddress.ip_network(d) if (d := rnd.choice(nets)) else None,
+            src_port=rnd.choice(ports), dst_port=rnd.choice(ports),
+            in_iface=rnd.choice([None, "eth0", "eth+"]), out_iface=None,
+            action=rnd.choice(["ACCEPT", "DROP"]), raw=f"rule{i}", order=i + 1,
+        )
+        for i in range(300)
+    ]
+    classifier = PacketClassifier(rules, binth=4)
+
+    for _ in range(2000):
+        packet = Packet(
+            src=f"10.{rnd.randint(0, 2)}.{rnd.randint(0, 3)}.{rnd.randint(0, 4)}",
+            dst=rnd.choice([None, "10.1.2.3", "172.16.0.1"]),
+            protocol=rnd.choice([None, "tcp", "udp", "icmp"]),
+            src_port=rnd.choice([None, 22, 1500, 40000]),
+            dst_port=rnd.choice([None, 22, 80, 999, 2000]),
+            in_iface=rnd.choice([None, "eth0", "eth1"]),
+        )
+        assert classifier.classify(packet) is linear_classify(rules, packet)
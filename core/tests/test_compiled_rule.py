@@ -0,0 +1,78 @@
+import itertools
+from core.parsers.iptables_parser import IptablesParser
+from core.models.compiled_rule import compile_rules
+from core.anomalies.shadowing import rule_covers
+from core.anomalies.conflicts import rules_overlap, rule_conflicts
+from core.anomalies.redundancy import rules_match
+
+sample = """
+*filter
+-A INPUT -j DROP
+-A INPUT -s 0.0.0.0/0 -j DROP
+-A INPUT -p tcp --dport 22 -j ACCEPT
+-A INPUT -p tcp --dport 0:65535 -j ACCEPT
+-A INPUT -p tcp -s 10.0.0.0/8 --dport 1000:2000 -j ACCEPT
+-A INPUT -p tcp -s 10.1.0.0/16 --dport 1500 -i eth0 -j DROP
+-A INPUT -p udp -d 192.168.1.0/24 --sport 53 -j ACCEPT
+-A INPUT -d 192.168.0.0/16 -o eth1 -j REJECT
+-A INPUT -s 2001:db8::/32 -j ACCEPT
+-A INPUT -s 2001:db8:1::/48 -p tcp -j DROP
+COMMIT
+"""
+
+
+def test_compiled_predicates_match_dataclass_predicates():
+    rules = IptablesParser().parse(sample)
+    compiled = compile_rules(rules)
+
+    for a, b in itertools.product(compiled, repeat=2):
+        rule_a, rule_b = rules[a.position], rules[b.position]
+        if (rule_a.src is None or rule_b.src is None or
+                rule_a.src.version == rule_b.src.version):
+            assert a.covers(b) == rule_covers(rule_a, rule_b)
+            assert a.overlaps(b) == rules_overlap(rule_a, rule_b)
+            assert a.conflicts(b) == rule_conflicts(rule_a, rule_b)
+            assert a.makes_redundant(b) == rules_match(rule_b, rule_a)
+
+
+def test_compiled_rule_is_slotted():
+    compiled = compile_rules(IptablesParser().parse(sample))[0]
+    assert not hasattr(compiled, "__dict__")
+    assert not hasattr(compiled, "rule")
+
+
+def test_detectors_share_one_compiled_form_per_chain(monkeypatch):
+    from core.models import chain_partition
+    from core.anomalies.analysis import AnalysisResult
+
+    calls = []
+    original = chain_partition.compile_rules
+    monkeypatch.setattr(chain_partition, "compile_rules", lambda rules: calls.append(len(rules)) or original(rules))
+    rules = IptablesParser().parse(sample + "*nat\n-A PREROUTING -j ACCEPT\nCOMMIT\n")
+
+    AnalysisResult.from_rules(rules)
+
+    assert calls == [10, 1]
+
+
+def test_symbol_ids_are_unique_across_threads():
+    from concurrent.futures import ThreadPoolExecutor
+    from core.models.compiled_rule import SymbolTable
+
+    symbols = SymbolTable()
+    names = [f"eth{i}" for i in range(2000)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for _ in pool.map(lambda offset: [symbols.id(n) for n in names[offset:] + names[:offset]],
+                          range(0, 2000, 250)):
+            pass
+
+    ids = [symbols.id(name) for name in names]
+    assert sorted(ids) == list(range(1, 2001))
+
+
+def test_each_compile_rules_call_has_its_own_symbols():
+    rules = IptablesParser().parse(sample)
+    compile_rules(rules[5:6])
+    # eth1 is the first symbol of its own table, not the next id after
+    # the names seen by the previous call.
+    assert compile_rules(rules[7:8])[0].out_iface == 1
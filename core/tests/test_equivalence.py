@@ -0,0 +1,182 @@
+import itertools
+import random
+import pytest
+from core.parsers.iptables_parser import IptablesParser
+from core.parsers.nftables_parser import NftablesParser
+from core.classifier.packet_classifier import Packet, rule_matches
+from core.optimizer.equivalence import NON_TERMINATING, verify_equivalence
+from core.optimizer.rule_optimizer import optimize_rules
+
+
+def parse(text):
+    return IptablesParser().parse("*filter\n" + text + "\nCOMMIT\n")
+
+
+def nft(text):
+    return NftablesParser().parse("table inet filter {\nchain input {\n" + text + "\n}\n}\n")
+
+
+SAMPLE = """
+-A INPUT -s 10.0.0.0/8 -p tcp --dport 22 -j ACCEPT
+-A INPUT -s 10.1.0.0/16 -p tcp --dport 22 -j ACCEPT
+-A INPUT -s 10.2.0.0/16 -p tcp --dport 22 -j DROP
+-A INPUT -i eth0 -s 192.168.0.0/24 -j ACCEPT
+-A INPUT -i eth0 -s 192.168.1.0/24 -j ACCEPT
+-A INPUT -s 10.9.0.0/16 -p udp --dport 53 -j LOG
+-A INPUT -p udp --dport 53 -j ACCEPT
+-A INPUT -j DROP
+"""
+
+
+def test_optimized_rules_are_equivalent():
+    rules = parse(SAMPLE)
+    optimized = optimize_rules(rules, merge=True)
+    assert len(optimized) < len(rules)
+
+    result = verify_equivalence(rules, optimized)
+
+    assert result.equivalent
+    assert result.chains == 1
+
+
+def test_rule_shadowed_by_log_rule_is_caught():
+    rules = parse("-A INPUT -p udp --dport 53 -j LOG\n-A INPUT -p udp --dport 53 -j ACCEPT\n-A INPUT -j DROP")
+
+    example = verify_equivalence(rules, [rules[0], rules[2]]).counterexample
+
+    assert (example.packet.protocol, example.packet.dst_port) == ("udp", 53)
+    assert example.original is rules[1]
+    assert example.optimized is rules[2]
+
+
+@pytest.mark.xfail(strict=True, reason="optimize_rules treats LOG as a verdict when looking for shadowed rules")
+def test_optimizer_keeps_rules_behind_log_rules():
+    rules = parse("-A INPUT -p udp --dport 53 -j LOG\n-A INPUT -p udp --dport 53 -j ACCEPT\n-A INPUT -j DROP")
+
+    assert verify_equivalence(rules, optimize_rules(rules)).equivalent
+
+
+def test_unmodelled_matches_may_not_match():
+    rules = parse("-A INPUT -p tcp -m state --state NEW -j DROP\n-A INPUT -p tcp --dport 22 -j ACCEPT")
+    optimized = optimize_rules(rules)
+    assert optimized == rules[:1]
+
+    result = verify_equivalence(rules, optimized)
+
+    assert not result.equivalent
+    example = result.counterexample
+    assert (example.packet.protocol, example.packet.dst_port) == ("tcp", 22)
+    assert example.unmodelled == {"-m state --state NEW": False}
+    assert example.original is rules[1]
+    assert example.optimized is None
+
+    # The same unmodelled match is the same condition in both rulesets,
+    # and comments or `-m tcp` are not matches.
+    assert verify_equivalence(
+        rules, parse("-A INPUT -p tcp -m state --state NEW -j DROP\n"
+                     "-A INPUT -p tcp -m tcp --dport 22 -m comment --comment \"ssh in\" -j ACCEPT"),
+    ).equivalent
+    assert verify_equivalence(
+        nft("ct state established accept\ntcp dport 22 counter accept\ndrop"),
+        nft("ct state established accept\ntcp dport 22 accept\ndrop"),
+    ).equivalent
+    assert not verify_equivalence(nft("ct state established accept\ndrop"), nft("drop")).equivalent
+
+
+def test_counterexample_for_changed_verdict():
+    rules = parse(SAMPLE)
+    changed = rules[:3] + rules[4:]  # the eth0 192.168.0.0/24 ACCEPT is gone
+
+    result = verify_equivalence(rules, changed)
+
+    assert not result.equivalent
+    example = result.counterexample
+    assert (example.table, example.chain) == ("filter", "INPUT")
+    assert example.packet.in_iface == "eth0"
+    assert example.packet.src.startswith("192.168.0.")
+    assert example.original is rules[3]
+    assert example.optimized is rules[-1]
+
+
+def test_non_terminating_rules_are_ignored():
+    rules = parse(SAMPLE)
+
+    assert verify_equivalence(rules, [r for r in rules if r.action != "LOG"]).equivalent
+
+
+def test_negation_and_interface_wildcards():
+    assert verify_equivalence(
+        parse("-A INPUT ! -s 10.0.0.0/8 -j DROP\n-A INPUT -j ACCEPT"),
+        parse("-A INPUT -s 10.0.0.0/8 -j ACCEPT\n-A INPUT -j DROP"),
+    ).equivalent
+    assert verify_equivalence(
+        parse("-A INPUT -i eth+ -j DROP\n-A INPUT -i eth0 -j ACCEPT"),
+        parse("-A INPUT -i eth+ -j DROP"),
+    ).equivalent
+
+    example = verify_equivalence(
+        parse("-A INPUT -i eth+ -j DROP"), parse("-A INPUT -i eth1 -j DROP"),
+    ).counterexample
+    assert example.packet.in_iface.startswith("eth") and example.packet.in_iface != "eth1"
+
+
+def test_nftables_families():
+    # `ip saddr` only matches IPv4, so IPv6 packets reach the policy in the second ruleset
+    example = verify_equivalence(
+        nft("ip saddr != 10.0.0.0/8 drop\naccept"),
+        nft("ip saddr 10.0.0.0/8 accept\nip saddr 0.0.0.0/0 drop"),
+    ).counterexample
+    assert ":" in example.packet.src
+    assert example.optimized is None
+
+    assert verify_equivalence(nft("tcp dport != 22 drop"), nft("tcp dport 0-21 drop\ntcp dport 23-65535 drop")).equivalent
+
+
+def test_unparsed_values_are_rejected():
+    with pytest.raises(ValueError):
+        verify_equivalence(parse("-A INPUT -s example.org -j DROP"), [])
+
+
+def _verdict(rules, packet):
+    for rule in rules:
+        if rule.action not in NON_TERMINATING and rule_matches(rule, packet):
+            return rule.action
+    return None
+
+
+def test_agrees_with_linear_scan():
+    rng = random.Random(3)
+    packets = [
+        Packet(src=src, dst=dst, protocol=protocol,
+               dst_port=port if protocol in ("tcp", "udp") else None, in_iface=iface)
+        for src, dst, protocol, port, iface in itertools.product(
+            [f"10.0.0.{i}" for i in range(9)], ["10.0.1.1", "10.0.1.5"],
+            ["tcp", "udp", "icmp"], [None, 1, 3, 6], ["eth0", "eth1"],
+        )
+    ]
+    for _ in range(60):
+        lines = []
+        for _ in range(rng.randint(2, 15)):
+            parts = ["-A INPUT"]
+            if rng.random() < 0.4:
+                parts.append(f"-i {rng.choice(['eth0', 'eth1'])}")
+            protocol = rng.choice([None, "tcp", "udp"])
+            if protocol:
+                parts.append(f"-p {protocol}")
+                if rng.random() < 0.5:
+                    parts.append(f"--dport {rng.randint(1, 3)}:{rng.randint(3, 6)}")
+            if rng.random() < 0.6:
+                parts.append(f"-s 10.0.0.{rng.choice([0, 2, 4, 6])}/{rng.choice([29, 30, 31])}")
+            parts.append(f"-j {rng.choice(['ACCEPT', 'DROP', 'LOG'])}")
+            lines.append(" ".join(parts))
+        rules = parse("\n".join(lines))
+        changed = list(rules)
+        i, j = rng.randrange(len(rules)), rng.randrange(len(rules))
+        changed[i], changed[j] = changed[j], changed[i]
+
+        result = verify_equivalence(rules, changed)
+        if result.equivalent:
+            assert all(_verdict(rules, p) == _verdict(changed, p) for p in packets)
+        else:
+            packet = result.counterexample.packet
+            assert _verdict(rules, packet) != _verdict(changed, packet)
@@ -0,0 +1,62 @@
+import pickle
+from core.models.firewall_rule import FirewallRule
+from core.parsers.iptables_parser import IptablesParser
+from core.parsers.fast_iptables_parser import FastIptablesParser
+
+sample = """# Generated by iptables-save
+*filter
+:INPUT ACCEPT [0:0]
+-A INPUT -p TCP -m tcp --dport 1000:2000 -s 10.0.0.0/8 -j accept
+  -A INPUT -i eth0 -d 192.168.1.1 -m comment --comment "ssh in" -j DROP
+-A OUTPUT -o lo --sport 53 -j ACCEPT
+COMMIT
+*nat
+-A PREROUTING -p udp --dport 53 -j REDIRECT
+COMMIT
+"""
+
+
+def test_fast_parser_matches_iptables_parser(tmp_path):
+    path = tmp_path / "rules.v4"
+    path.write_text(sample)
+
+    fast = FastIptablesParser().parse_file(path)
+    slow = IptablesParser().parse(sample)
+
+    assert fast == slow
+    assert fast[1].raw == '-A INPUT -i eth0 -d 192.168.1.1 -m comment --comment "ssh in" -j DROP'
+    assert [(r.table, r.chain, r.order) for r in fast][-1] == ("nat", "PREROUTING", 1)
+
+
+def test_mapped_rule_pickles_as_plain_rule(tmp_path):
+    path = tmp_path / "rules.v4"
+    path.write_text(sample)
+
+    rule = FastIptablesParser().parse_file(path)[0]
+    copy = pickle.loads(pickle.dumps(rule))
+
+    assert type(copy) is FirewallRule
+    assert copy == rule
+
+
+def test_empty_file_has_no_rules(tmp_path):
+    path = tmp_path / "empty.v4"
+    path.write_text("")
+
+    assert FastIptablesParser().parse_file(path) == []
+
+
+def test_fast_parser_tolerates_non_utf8_bytes(tmp_path):
+    path = tmp_path / "rules.v4"
+    path.write_bytes(
+        b"*filter\n"
+        b"-A INPUT -i eth\xff0 -m comment --comment \"caf\xe9\" -j ACCEPT\n"
+        b"-A INPUT -p tcp --dport 22 -j DROP\n"
+        b"COMMIT\n"
+    )
+
+    rules = FastIptablesParser().parse_file(path)
+
+    assert [rule.action for rule in rules] == ["ACCEPT", "DROP"]
+    assert rules[0].in_iface == "eth�0"
+    assert rules == IptablesParser().parse(path.read_bytes().decode("utf-8", errors="replace"))
@@ -0,0 +1,102 @@
+import random
+from core.parsers.iptables_parser import IptablesParser
+from core.parsers.fast_iptables_parser import FastIptablesParser
+from core.optimizer.hit_reorder import must_keep_order, reorder_by_hits
+from core.optimizer.rule_optimizer import optimize_rules
+from core.optimizer.equivalence import verify_equivalence
+
+
+SAMPLE = """
+*filter
+:INPUT DROP [0:0]
+[10:600] -A INPUT -s 10.0.0.0/8 -p tcp --dport 22 -j ACCEPT
+[0:0] -A INPUT -s 192.168.0.0/16 -j LOG
+[5:300] -A INPUT -p udp --dport 53 -j DROP
+[900:54000] -A INPUT -d 203.0.113.0/24 -p tcp --dport 443 -j ACCEPT
+[300:18000] -A INPUT -s 10.1.0.0/16 -p tcp --dport 443 -j DROP
+[50:3000] -A INPUT ! -s 172.16.0.0/12 -p tcp --dport 80 -j ACCEPT
+[500:30000] -A INPUT -s 172.16.1.0/24 -p tcp --dport 8080 -j REJECT
+COMMIT
+"""
+
+
+def test_parser_reads_counters():
+    rules = IptablesParser().parse(SAMPLE)
+
+    assert [(r.packet_count, r.byte_count) for r in rules][:2] == [(10, 600), (0, 0)]
+    assert rules[0].raw == "-A INPUT -s 10.0.0.0/8 -p tcp --dport 22 -j ACCEPT"
+    assert IptablesParser().parse("*filter\n-A INPUT -j DROP\n")[0].packet_count is None
+
+
+def test_parser_keeps_rules_with_malformed_counters(tmp_path):
+    text = "*filter\n[12:x] -A INPUT -p tcp --dport 22 -j ACCEPT\n[7] -A INPUT -j DROP\n"
+    path = tmp_path / "rules.v4"
+    path.write_text(text)
+
+    for rules in (IptablesParser().parse(text), FastIptablesParser().parse_file(path)):
+        assert [(r.raw, r.packet_count) for r in rules] == [
+            ("-A INPUT -p tcp --dport 22 -j ACCEPT", None),
+            ("-A INPUT -j DROP", None),
+        ]
+
+
+def test_reorder_only_makes_safe_moves():
+    rules = IptablesParser().parse(SAMPLE)
+    result = reorder_by_hits(rules)
+
+    # The hot https rule moves up, but not past the LOG rule it overlaps,
+    # and the DROP it overlaps stays behind it. The negated rule cannot be
+    # reasoned about, so it keeps its place before the hot REJECT.
+    assert [r.order for r in result.rules] == [2, 4, 3, 5, 6, 7, 1]
+    assert round(result.before, 2) == 5.06
+    assert round(result.after, 2) == 3.59
+    assert result.moved == 6
+
+    assert must_keep_order(rules[1], rules[3])
+    assert must_keep_order(rules[3], rules[4])
+    assert not must_keep_order(rules[0], rules[3])
+    assert not must_keep_order(rules[3], rules[6])
+    assert must_keep_order(rules[5], rules[6])
+
+
+def test_optimize_rules_reorder_mode():
+    rules = IptablesParser().parse(SAMPLE)
+
+    assert optimize_rules(rules) == rules
+    assert [r.order for r in optimize_rules(rules, reorder=True)] == [2, 4, 3, 5, 6, 7, 1]
+
+
+def test_wildcard_interfaces_and_protocol_numbers_overlap():
+    rules = IptablesParser().parse(
+        "*filter\n"
+        "[0:0] -A INPUT -i eth+ -j DROP\n"
+        "[100:100] -A INPUT -i eth0 -p tcp -j ACCEPT\n"
+        "[0:0] -A INPUT -p 58 -j DROP\n"
+        "[100:100] -A INPUT -p ipv6-icmp -j ACCEPT\n"
+        "[200:200] -A INPUT -i lo -p tcp -j ACCEPT\n"
+        "COMMIT\n"
+    )
+
+    assert must_keep_order(rules[0], rules[1])
+    assert must_keep_order(rules[2], rules[3])
+    assert not must_keep_order(rules[0], rules[4])
+    assert [r.order for r in reorder_by_hits(rules).rules] == [5, 1, 2, 3, 4]
+
+
+def test_reordered_chains_are_equivalent():
+    rng = random.Random(11)
+    for _ in range(300):
+        lines = ["*filter"]
+        for _ in range(rng.randint(2, 10)):
+            parts = [f"[{rng.choice([0, 5, 100])}:0] -A INPUT"]
+            if rng.random() < 0.6:
+                parts.append(f"-i {rng.choice(['eth0', 'eth1', 'eth+', 'lo'])}")
+            if rng.random() < 0.5:
+                parts.append(f"-p {rng.choice(['tcp', '6', 'udp', '58', 'ipv6-icmp'])}")
+            if rng.random() < 0.4:
+                parts.append(f"-s 10.0.{rng.randrange(2)}.0/24")
+            parts.append(f"-j {rng.choice(['ACCEPT', 'DROP', 'REJECT'])}")
+            lines.append(" ".join(parts))
+        rules = IptablesParser().parse("\n".join(lines + ["COMMIT"]))
+
+        assert verify_equivalence(rules, reorder_by_hits(rules).rules).equivalent
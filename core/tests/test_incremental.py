@@ -0,0 +1,44 @@
+from core.parsers.iptables_parser import IptablesParser
+from core.anomalies.analysis import AnalysisResult
+from core.anomalies.incremental import reanalyze
+
+before = """
+*filter
+-A INPUT -p tcp --dport 22 -j ACCEPT
+-A INPUT -p tcp --dport 22 -j ACCEPT
+-A INPUT -s 10.0.0.0/8 -j DROP
+-A INPUT -s 10.1.0.0/16 -p tcp -j ACCEPT
+-A OUTPUT -p udp -j ACCEPT
+-A OUTPUT -p udp --dport 53 -j DROP
+COMMIT
+"""
+
+after = """
+*filter
+-A INPUT -p tcp --dport 22 -j ACCEPT
+-A INPUT -s 10.0.0.0/8 -j DROP
+-A INPUT -s 10.1.0.0/16 -p tcp -j ACCEPT
+-A INPUT -p tcp --dport 80 -j DROP
+-A OUTPUT -p udp -j ACCEPT
+-A OUTPUT -p udp --dport 53 -j DROP
+COMMIT
+"""
+
+
+def test_reanalyze_matches_full_analysis():
+    parser = IptablesParser()
+    previous = AnalysisResult.from_rules(parser.parse(before))
+    rules = parser.parse(after)
+
+    assert reanalyze(previous, rules) == AnalysisResult.from_rules(rules)
+
+
+def test_reanalyze_without_changes_reuses_everything():
+    parser = IptablesParser()
+    previous = AnalysisResult.from_rules(parser.parse(before))
+    rules = parser.parse(before)
+
+    result = reanalyze(previous, rules)
+    assert [r.order for r in result.redundant] == [2]
+    assert [(r.chain, r.order) for r in result.shadowed] == [("INPUT", 4), ("OUTPUT", 2)]
+    assert result == AnalysisResult.from_rules(rules)
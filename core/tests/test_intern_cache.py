@@ -0,0 +1,29 @@
+from core.parsers.iptables_parser import IptablesParser
+from core.utils.intern_cache import cache_stats, clear_caches, parse_port
+from core.utils.ip_utils import ip_matches
+
+sample = """
+*filter
+-A INPUT -i eth0 -s 10.0.0.0/8 -p tcp --dport 1000:2000 -j ACCEPT
+-A INPUT -i eth0 -s 10.0.0.0/8 -p tcp --dport 1000:2000 -j DROP
+COMMIT
+"""
+
+
+def test_repeated_values_share_one_object():
+    clear_caches()
+    first, second = IptablesParser().parse(sample)
+
+    assert first.src is second.src
+    assert first.dst_port is second.dst_port
+    assert first.in_iface is second.in_iface
+
+    stats = cache_stats()
+    assert stats["networks"]["misses"] == 1
+    assert stats["networks"]["hits"] == 1
+
+
+def test_invalid_values_are_not_interned():
+    assert parse_port("http", ":") is None
+    assert not ip_matches("10.0.0.0/8", "not-an-ip")
+    assert ip_matches("10.1.0.0/16", "10.0.0.0/8")
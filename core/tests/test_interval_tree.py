@@ -0,0 +1,28 @@
+from core.utils.interval_tree import IntervalIndex, port_range
+from core.parsers.iptables_parser import IptablesParser
+from core.anomalies.conflicts import detect_conflicting_rules
+
+
+def test_overlapping_returns_every_intersecting_range():
+    ranges = [(22, 22, "ssh"), (80, 80, "http"), (1000, 2000, "a"), (1500, 1600, "b"), (0, 65535, "all")]
+    index = IntervalIndex(ranges)
+
+    assert sorted(index.overlapping(1550, 1550)) == ["a", "all", "b"]
+    assert sorted(index.overlapping(23, 79)) == ["all"]
+    assert sorted(index.overlapping(*port_range(80))) == ["all", "http"]
+    assert list(IntervalIndex([]).overlapping(0, 10)) == []
+
+
+def test_port_prefilter_keeps_wildcard_partners():
+    sample = """
+*filter
+-A INPUT -p tcp --dport 22 -s 10.0.0.0/8 -j ACCEPT
+-A INPUT -p tcp --dport 80 -j DROP
+-A INPUT -p tcp -s 10.1.0.0/16 -d 192.168.0.0/16 -j DROP
+-A INPUT -p tcp --dport 22 -d 192.168.1.0/24 -j DROP
+COMMIT
+"""
+    rules = IptablesParser().parse(sample)
+
+    pairs = [(a.order, b.order) for a, b in detect_conflicting_rules(rules)]
+    assert pairs == [(1, 3), (1, 4)]
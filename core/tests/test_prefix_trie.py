@@ -0,0 +1,37 @@
+import ipaddress
+from core.utils.prefix_trie import PrefixTrie
+from core.parsers.iptables_parser import IptablesParser
+from core.anomalies.shadowing import detect_shadowed_rules
+from core.anomalies.redundancy import detect_redundant_rules
+
+
+def net(text):
+    return ipaddress.ip_network(text)
+
+
+def test_covering_walks_supernets_only():
+    trie = PrefixTrie()
+    for text in ["0.0.0.0/0", "10.0.0.0/8", "10.1.0.0/16", "192.168.0.0/16", "2001:db8::/32"]:
+        trie.setdefault(net(text), lambda text=text: text)
+
+    assert list(trie.covering(net("10.1.2.0/24"))) == ["0.0.0.0/0", "10.0.0.0/8", "10.1.0.0/16"]
+    assert list(trie.covering(net("10.0.0.0/8"))) == ["0.0.0.0/0", "10.0.0.0/8"]
+    assert list(trie.covering(net("2001:db8:1::/48"))) == ["2001:db8::/32"]
+    assert len(trie) == 5
+
+
+def test_indexed_detectors_respect_wildcards():
+    sample = """
+*filter
+-A INPUT -s 10.0.0.0/8 -j DROP
+-A INPUT -s 10.1.0.0/16 -d 192.168.1.1 -j ACCEPT
+-A INPUT -d 192.168.1.1 -j ACCEPT
+-A INPUT -j ACCEPT
+-A INPUT -s 10.1.0.0/16 -j DROP
+COMMIT
+"""
+    rules = IptablesParser().parse(sample)
+
+    # A network-specific rule cannot shadow a rule with a wildcard source.
+    assert [r.order for r in detect_shadowed_rules(rules)] == [2, 5]
+    assert [r.order for r in detect_redundant_rules(rules)] == [5]
@@ -0,0 +1,76 @@
+from core.parsers.iptables_parser import IptablesParser
+from core.parsers.nftables_parser import NftablesParser
+from core.optimizer.rule_merger import merge_rules
+from core.optimizer.rule_optimizer import optimize_rules
+
+
+IPTABLES = """
+*filter
+-A INPUT -s 10.0.0.0/24 -p tcp -m state --state NEW -j ACCEPT
+-A INPUT -s 10.0.1.0/24 -p tcp -m state --state NEW -j ACCEPT
+-A INPUT -s 10.0.2.0/23 -p tcp -m state --state NEW -j ACCEPT
+-A INPUT -s 10.0.8.0/24 -p tcp -m state --state NEW -j ACCEPT
+-A INPUT -p udp --dport 1000:1999 -j DROP
+-A INPUT -p udp --dport 2000 -j DROP
+-A INPUT -p udp --dport 2001:2100 -j DROP
+-A INPUT -s 10.0.0.0/25 -j LOG
+-A INPUT -s 10.0.0.0/24 -j LOG
+-A OUTPUT -d 192.168.0.0/24 -j ACCEPT
+-A OUTPUT -d 192.168.1.0/24 -m comment --comment "other" -j ACCEPT
+COMMIT
+"""
+
+
+def test_merges_adjacent_addresses_and_ports():
+    result = merge_rules(IptablesParser().parse(IPTABLES))
+
+    assert [r.raw for r in result.rules] == [
+        "-A INPUT -s 10.0.0.0/22 -p tcp -m state --state NEW -j ACCEPT",
+        "-A INPUT -s 10.0.8.0/24 -p tcp -m state --state NEW -j ACCEPT",
+        "-A INPUT -p udp --dport 1000:2100 -j DROP",
+        # Overlapping LOG rules log twice, so they are kept
+        "-A INPUT -s 10.0.0.0/25 -j LOG",
+        "-A INPUT -s 10.0.0.0/24 -j LOG",
+        # A different comment is a different rule text
+        "-A OUTPUT -d 192.168.0.0/24 -j ACCEPT",
+        "-A OUTPUT -d 192.168.1.0/24 -m comment --comment \"other\" -j ACCEPT",
+    ]
+    assert result.rules[2].dst_port == (1000, 2100)
+    assert result.chains == {("filter", "INPUT"): (9, 5), ("filter", "OUTPUT"): (2, 2)}
+    assert (result.before, result.after) == (11, 7)
+
+
+def test_merges_grid_of_sources_and_destinations():
+    sample = "*filter\n" + "\n".join(
+        f"-A FORWARD -s 10.0.{s}.0/24 -d 192.168.{d}.0/24 -j ACCEPT"
+        for s in range(4) for d in range(2)
+    )
+    result = merge_rules(IptablesParser().parse(sample))
+
+    assert [r.raw for r in result.rules] == ["-A FORWARD -s 10.0.0.0/22 -d 192.168.0.0/23 -j ACCEPT"]
+
+
+def test_merges_nftables_rules():
+    sample = """
+table inet filter {
+    chain input {
+        ip saddr 10.0.0.0/24 tcp dport 22 accept
+        ip saddr 10.0.1.0/24 tcp dport 22 accept
+        tcp dport 80-89 drop
+        tcp dport 90-99 drop
+    }
+}
+"""
+    result = merge_rules(NftablesParser().parse(sample))
+
+    assert [r.raw for r in result.rules] == [
+        "ip saddr 10.0.0.0/23 tcp dport 22 accept",
+        "tcp dport 80-99 drop",
+    ]
+
+
+def test_optimize_rules_merge_mode():
+    rules = IptablesParser().parse(IPTABLES)
+
+    assert len(optimize_rules(rules)) == 11
+    assert len(optimize_rules(rules, merge=True)) == 7
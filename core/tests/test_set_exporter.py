@@ -0,0 +1,97 @@
+import pytest
+from core.parsers.iptables_parser import IptablesParser
+from core.parsers.nftables_parser import NftablesParser
+from core.exporters.set_exporter import export_sets, jump_targets
+
+
+IPTABLES = "*filter\n" + "\n".join(
+    f"-A INPUT -s 10.{i}.0.0/16 -p tcp -m tcp --dport 22 -j ACCEPT" for i in range(0, 10, 2)
+) + """
+-A INPUT -p udp -m udp --dport 53 -j ACCEPT
+-A INPUT -j BLOCKED
+-A BLOCKED -p tcp -m tcp --dport 80 -j DROP
+-A BLOCKED -p tcp -m tcp --dport 81 -j DROP
+-A BLOCKED -p tcp -m tcp --dport 82 -j DROP
+-A BLOCKED -p tcp -m tcp --dport 443 -j DROP
+-A BLOCKED -s 192.168.0.0/24 -j LOG
+-A BLOCKED -s 192.168.0.0/25 -j LOG
+COMMIT
+"""
+
+
+def test_iptables_runs_become_ipsets():
+    export = export_sets(IptablesParser().parse(IPTABLES))
+
+    assert [(s.name, s.family) for s in export.sets] == [
+        ("fw_INPUT_src_1", 4), ("fw_BLOCKED_dst_port_2", None),
+    ]
+    assert export.sets[1].elements == [(80, 82), 443]
+    assert export.rule_count == 6
+
+    assert export.ipset_restore().splitlines()[:3] == [
+        "create fw_INPUT_src_1 hash:net family inet -exist",
+        "flush fw_INPUT_src_1",
+        "add fw_INPUT_src_1 10.0.0.0/16",
+    ]
+    assert "add fw_BLOCKED_dst_port_2 80-82" in export.ipset_restore()
+    assert export.iptables_restore().splitlines() == [
+        "*filter",
+        ":BLOCKED - [0:0]",
+        "-A INPUT -m set --match-set fw_INPUT_src_1 src -p tcp -m tcp --dport 22 -j ACCEPT",
+        "-A INPUT -p udp -m udp --dport 53 -j ACCEPT",
+        "-A INPUT -j BLOCKED",
+        "-A BLOCKED -p tcp -m tcp -m set --match-set fw_BLOCKED_dst_port_2 dst -j DROP",
+        # Overlapping LOG rules are not combined
+        "-A BLOCKED -s 192.168.0.0/24 -j LOG",
+        "-A BLOCKED -s 192.168.0.0/25 -j LOG",
+        "COMMIT",
+    ]
+    with pytest.raises(ValueError):
+        export.nft_script()
+
+
+def test_short_runs_are_left_alone():
+    export = export_sets(IptablesParser().parse(IPTABLES), min_size=6)
+
+    assert export.sets == []
+    assert export.rule_count == 13
+
+
+def test_empty_jump_targets_are_declared():
+    text = """*filter
+:INPUT DROP [0:0]
+:LOGDROP - [0:0]
+:ssh_in - [0:0]
+-A INPUT -p tcp --dport 22 -g ssh_in
+-A INPUT -j LOG --log-prefix "dropped "
+-A INPUT -j LOGDROP
+COMMIT
+"""
+    export = export_sets(IptablesParser().parse(text))
+
+    assert export.iptables_restore().splitlines()[:3] == [
+        "*filter", ":ssh_in - [0:0]", ":LOGDROP - [0:0]",
+    ]
+    assert jump_targets(["-A INPUT -j ACCEPT", "-A INPUT -j LOGDROP", "-A X -j RETURN"]) == ["LOGDROP"]
+
+
+def test_nftables_runs_become_named_sets():
+    sample = """
+table inet filter {
+    chain input {
+        type filter hook input priority 0; policy drop;
+""" + "\n".join(f"        ip saddr 192.168.{i}.0/24 tcp dport 22 accept" for i in range(5)) + """
+        tcp dport 8080 drop
+    }
+}
+"""
+    export = export_sets(NftablesParser().parse(sample))
+
+    assert export.nft_script().splitlines() == [
+        "add set inet filter fw_input_src_1 { type ipv4_addr; flags interval; }",
+        "flush set inet filter fw_input_src_1",
+        "add element inet filter fw_input_src_1 { 192.168.0.0/22, 192.168.4.0/24 }",
+        "flush chain inet filter input",
+        "add rule inet filter input ip saddr @fw_input_src_1 tcp dport 22 accept",
+        "add rule inet filter input tcp dport 8080 drop",
+    ]
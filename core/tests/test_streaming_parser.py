@@ -0,0 +1,41 @@
+import io
+from core.parsers.iptables_parser import IptablesParser
+from core.parsers.nftables_parser import NftablesParser
+
+iptables_sample = """
+*filter
+-A INPUT -p tcp --dport 22 -j ACCEPT
+-A INPUT -s 10.0.0.0/8 -j DROP
+-A OUTPUT -o eth0 -j ACCEPT
+COMMIT
+"""
+
+nftables_sample = """
+table inet filter {
+    chain input {
+        type filter hook input priority 0; policy accept;
+        tcp dport 22 accept
+        ip saddr 10.0.0.0/8 drop
+    }
+}
+"""
+
+
+def test_iptables_iter_parse_matches_parse():
+    parser = IptablesParser()
+    stream = parser.iter_parse(io.StringIO(iptables_sample))
+
+    first = next(stream)
+    assert (first.chain, first.dst_port, first.action) == ("INPUT", 22, "ACCEPT")
+    assert [first] + list(stream) == parser.parse(iptables_sample)
+
+
+def test_nftables_iter_parse_matches_parse():
+    parser = NftablesParser()
+    rules = list(parser.iter_parse(io.StringIO(nftables_sample)))
+
+    assert rules == parser.parse(nftables_sample)
+    assert [(r.table, r.chain, r.order, r.action) for r in rules] == [
+        ("inet filter", "input", 1, "ACCEPT"),
+        ("inet filter", "input", 2, "DROP"),
+    ]
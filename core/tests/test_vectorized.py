@@ -0,0 +1,95 @@
+import pytest
+from core.parsers.iptables_parser import IptablesParser
+from core.anomalies.analysis import AnalysisResult
+
+pytest.importorskip("numpy")
+
+# The fixtures of the existing detector tests, plus mixed cases.
+REDUNDANCY = """
+*filter
+-A INPUT -p tcp --dport 22 -j ACCEPT
+-A INPUT -p tcp --dport 22 -j ACCEPT
+-A INPUT -j DROP
+COMMIT
+"""
+
+SHADOWING = """
+*filter
+-A INPUT -j DROP
+-A INPUT -p tcp --dport 22 -j ACCEPT
+COMMIT
+"""
+
+CONFLICTS = """
+*filter
+-A INPUT -s 10.0.0.0/8 -j ACCEPT
+-A INPUT -s 10.1.1.0/24 -j DROP
+-A INPUT -s 192.168.0.0/16 -j ACCEPT
+-A FORWARD -s 10.0.0.0/8 -d 172.16.0.0/12 -p tcp --dport 1000:2000 -j ACCEPT
+-A FORWARD -s 10.1.0.0/16 -d 172.16.5.0/24 -p tcp --dport 1500 -j DROP
+-A FORWARD -s 192.168.1.0/24 -d 172.16.0.0/12 -p tcp --dport 1500 -j ACCEPT
+-A OUTPUT -p tcp --dport 1000:2000 -j ACCEPT
+-A OUTPUT -p tcp --dport 1500:2500 -j DROP
+-A OUTPUT -p udp --dport 3000:4000 -j DROP
+COMMIT
+"""
+
+ANALYSIS = """
+*filter
+-A INPUT -p tcp --dport 22 -j ACCEPT
+-A INPUT -p tcp --dport 22 -j ACCEPT
+-A INPUT -s 10.0.0.0/8 -j DROP
+-A INPUT -s 10.1.0.0/16 -p tcp -j ACCEPT
+-A INPUT -j DROP
+-A OUTPUT -p udp -j ACCEPT
+COMMIT
+"""
+
+MIXED = """
+*filter
+-A INPUT -p tcp --dport 22 -j ACCEPT
+-A INPUT -p tcp --dport 22 -j ACCEPT
+-A INPUT -s 10.0.0.0/8 -d 172.16.0.0/12 -p tcp --dport 1000:2000 -j ACCEPT
+-A INPUT -s 10.1.0.0/16 -d 172.16.5.0/24 -p tcp --dport 1500 -j DROP
+-A INPUT -s 192.168.1.0/24 -d 172.16.0.0/12 -p tcp --dport 1500 -j ACCEPT
+-A INPUT -s 10.1.1.0/24 -i eth0 -j DROP
+-A INPUT -s 2001:db8::/32 -j ACCEPT
+-A INPUT -s 2001:db8:1::/48 -p udp --sport 53 -j DROP
+-A OUTPUT -o eth1 -j REJECT
+-A INPUT -j DROP
+-A OUTPUT -p udp -j ACCEPT
+COMMIT
+"""
+
+FAMILIES_AND_WILDCARDS = """
+*filter
+-A FORWARD -i eth+ -s 10.0.0.0/8 -j ACCEPT
+-A FORWARD -i eth0 -s 10.1.0.0/16 -j DROP
+-A FORWARD -i eth+ -s 10.2.0.0/16 -p tcp -j ACCEPT
+-A FORWARD -s ::/0 -j DROP
+-A FORWARD -s 2001:db8::/32 -i eth+ -j ACCEPT
+-A FORWARD -s 2001:db8:5::/48 -i eth1 -p tcp --dport 443 -j DROP
+-A FORWARD -d 0.0.0.0/0 -o wg+ -j ACCEPT
+-A FORWARD -d 192.168.0.0/16 -o wg0 -p udp --dport 51820 -j DROP
+-A FORWARD -d fd00::/8 -o wg+ -j REJECT
+-A FORWARD -d fd00:1::/32 -o wg+ -j REJECT
+COMMIT
+"""
+
+
+@pytest.mark.parametrize("sample", [
+    REDUNDANCY, SHADOWING, CONFLICTS, ANALYSIS, MIXED, FAMILIES_AND_WILDCARDS,
+], ids=["redundancy", "shadowing", "conflicts", "analysis", "mixed", "families-and-wildcards"])
+def test_numpy_backend_matches_python_backend(sample):
+    rules = IptablesParser().parse(sample)
+    python = AnalysisResult.from_rules(rules)
+    numpy = AnalysisResult.from_rules(rules, backend="numpy")
+
+    assert numpy.redundant == python.redundant
+    assert numpy.shadowed == python.shadowed
+    assert numpy.conflicts == python.conflicts
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        AnalysisResult.from_rules([], backend="gpu")
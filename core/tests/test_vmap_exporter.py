@@ -0,0 +1,75 @@
+import pytest
+from core.parsers.iptables_parser import IptablesParser
+from core.parsers.nftables_parser import NftablesParser
+from core.exporters.vmap_exporter import dispatch_of, export_vmaps
+
+SAMPLE = """
+table inet filter {
+    chain input {
+        type filter hook input priority 0; policy drop;
+        ct state established,related accept
+        iifname "lan0" jump from_lan
+        iifname wan0 jump from_wan
+        iifname "dmz0" goto from_dmz
+        tcp dport 22 accept
+        tcp dport 80-89 accept
+        tcp dport 443 drop
+        tcp dport 85 drop
+        tcp dport 8080 counter accept
+        ip saddr 10.0.0.0/8 tcp dport 1 drop
+        ip saddr 10.0.0.0/8 tcp dport 2 drop
+        ip saddr 10.0.0.0/8 tcp dport 3 reject
+    }
+}
+"""
+
+
+def test_parser_keeps_jumps():
+    rules = NftablesParser().parse(SAMPLE)
+
+    assert [rule.action for rule in rules[1:4]] == ["FROM_LAN", "FROM_WAN", "FROM_DMZ"]
+    assert rules[1].in_iface == '"lan0"'
+
+
+def test_dispatch_of_splits_rule():
+    rules = NftablesParser().parse(SAMPLE)
+
+    assert dispatch_of(rules[2]) == ((), ("iifname",), '"wan0"', "jump from_wan")
+    assert dispatch_of(rules[9]) == (("ip", "saddr", "10.0.0.0/8"), ("tcp", "dport"), "1", "drop")
+    assert dispatch_of(rules[0]) is None
+    assert dispatch_of(rules[8]) is None  # counter between value and verdict
+    assert dispatch_of(rules[11]) is None  # reject is not a verdict
+
+
+def test_disjoint_runs_become_vmaps():
+    export = export_vmaps(NftablesParser().parse(SAMPLE))
+
+    assert export.nft_script().splitlines() == [
+        "flush chain inet filter input",
+        "add rule inet filter input ct state established,related accept",
+        'add rule inet filter input iifname vmap { "lan0" : jump from_lan, '
+        '"wan0" : jump from_wan, "dmz0" : goto from_dmz }',
+        "add rule inet filter input tcp dport vmap { 22 : accept, 80-89 : accept, 443 : drop }",
+        # 85 overlaps 80-89, so it ends the run
+        "add rule inet filter input tcp dport 85 drop",
+        "add rule inet filter input tcp dport 8080 counter accept",
+        "add rule inet filter input ip saddr 10.0.0.0/8 tcp dport 1 drop",
+        "add rule inet filter input ip saddr 10.0.0.0/8 tcp dport 2 drop",
+        "add rule inet filter input ip saddr 10.0.0.0/8 tcp dport 3 reject",
+    ]
+    assert export.replaced == 6
+    assert [m.key for m in export.maps] == ["iifname", "tcp dport"]
+
+
+def test_min_size_and_head():
+    export = export_vmaps(NftablesParser().parse(SAMPLE), min_size=2)
+
+    assert ("add rule inet filter input ip saddr 10.0.0.0/8 tcp dport vmap { 1 : drop, 2 : drop }"
+            in export.nft_script().splitlines())
+
+
+def test_rejects_iptables_rules():
+    rules = IptablesParser().parse("*filter\n-A INPUT -p tcp --dport 22 -j ACCEPT\nCOMMIT\n")
+
+    with pytest.raises(ValueError):
+        export_vmaps(rules)
@@ -0,0 +1,81 @@
+"""Shared, bounded interning caches for parsed values.
+
+Real rulesets repeat the same CIDRs, ports and interface names thousands
+of times. The helpers here parse each distinct string once and hand back
+the same object for every later occurrence, which saves parse time and
+memory and lets equality checks short-circuit on identity.
+
+Each cache is a bounded LRU (`functools.lru_cache`); `cache_stats()`
+reports hits, misses and sizes and `clear_caches()` empties them.
+"""
+
+import ipaddress
+from functools import lru_cache
+from typing import Dict, Optional, Tuple, Union
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+NETWORK_CACHE_SIZE = 65536
+PORT_CACHE_SIZE = 16384
+NAME_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=NETWORK_CACHE_SIZE)
+def parse_network(text: str) -> Network:
+    """Return the (shared) network for `text`; raises `ValueError` if invalid.
+
+    Invalid values are not cached, so they raise on every call.
+    """
+    return ipaddress.ip_network(text, strict=False)
+
+
+@lru_cache(maxsize=PORT_CACHE_SIZE)
+def parse_port(text: str, separator: str = ":") -> Optional[Union[int, Tuple[int, int]]]:
+    """Return a port (int) or port range (tuple) for `text`, or None if invalid.
+
+    `separator` is the range separator of the source syntax (`:` for
+    iptables, `-` for nftables).
+    """
+    if separator in text:
+        try:
+            start, end = map(int, text.split(separator))
+            return (start, end)
+        except ValueError:
+            return None
+    try:
+        return int(text)
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
+def intern_name(text: str) -> str:
+    """Return a shared instance of a short name such as an interface."""
+    return text
+
+
+_CACHES = {
+    "networks": parse_network,
+    "ports": parse_port,
+    "names": intern_name,
+}
+
+
+def cache_stats() -> Dict[str, Dict[str, int]]:
+    """Return hit/miss/size counters for each cache."""
+    stats = {}
+    for name, cached in _CACHES.items():
+        info = cached.cache_info()
+        stats[name] = {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "maxsize": info.maxsize,
+        }
+    return stats
+
+
+def clear_caches() -> None:
+    """Empty every cache and reset its statistics."""
+    for cached in _CACHES.values():
+        cached.cache_clear()
@@ -0,0 +1,64 @@
+"""Static interval tree over integer ranges.
+
+`IntervalIndex` stores closed `(start, end)` ranges, such as port ranges,
+and returns the values of every stored range that overlaps a query range.
+It is an implicit augmented tree: ranges are sorted by start and each
+midpoint records the largest end in its subtree, so a query skips every
+subtree that ends before the query starts or begins after it ends.
+"""
+
+from typing import Generic, Iterable, Iterator, List, Tuple, TypeVar, Union
+
+T = TypeVar("T")
+Port = Union[int, Tuple[int, int]]
+
+
+def port_range(port: Port) -> Tuple[int, int]:
+    """Normalise a single port or a port range to a `(start, end)` tuple."""
+    if isinstance(port, int):
+        return (port, port)
+    return port
+
+
+class IntervalIndex(Generic[T]):
+    """Find stored ranges overlapping a query range in O(log n + k)."""
+
+    def __init__(self, intervals: Iterable[Tuple[int, int, T]]):
+        entries = sorted(intervals, key=lambda e: (e[0], e[1]))
+        self._starts: List[int] = [e[0] for e in entries]
+        self._ends: List[int] = [e[1] for e in entries]
+        self._values: List[T] = [e[2] for e in entries]
+        # `_max_end[mid]` is the largest end within the subtree whose
+        # midpoint is `mid`; every index is the midpoint of exactly one
+        # subtree of the implicit tree.
+        self._max_end: List[int] = list(self._ends)
+        self._build(0, len(entries))
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def _build(self, lo: int, hi: int) -> int:
+        if lo >= hi:
+            return -1
+        mid = (lo + hi) // 2
+        best = max(self._ends[mid], self._build(lo, mid), self._build(mid + 1, hi))
+        self._max_end[mid] = best
+        return best
+
+    def overlapping(self, start: int, end: int) -> Iterator[T]:
+        """Yield values of stored ranges that share a point with `[start, end]`."""
+        starts, ends, values, max_end = self._starts, self._ends, self._values, self._max_end
+        stack = [(0, len(values))]
+        while stack:
+            lo, hi = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            if max_end[mid] < start:
+                continue  # nothing in this subtree reaches the query
+            stack.append((lo, mid))
+            if starts[mid] > end:
+                continue  # this range and everything right of it start too late
+            if ends[mid] >= start:
+                yield values[mid]
+            stack.append((mid + 1, hi))
@@ -1,6 +1,6 @@
-from ipaddress import ip_network
 from typing import Optional
 import ipaddress
+from core.utils.intern_cache import parse_network
 
 
 
@@ -13,9 +13,9 @@ def ip_matches(a: Optional[str], b: Optional[str]) -> bool:
         return True
 
     try:
-        net_a = ip_network(a, strict=False)
-        net_b = ip_network(b, strict=False)
-        return net_a.overlaps(net_b)
+        net_a = parse_network(a)
+        net_b = parse_network(b)
+        return net_a is net_b or net_a.overlaps(net_b)
     except ValueError:
         return False
 
@@ -0,0 +1,136 @@
+"""Prefix trie over IP networks.
+
+`PrefixTrie` is a binary (radix-2) trie keyed on the bits of a network
+address. Finding every stored network that contains a given network is a
+single walk from the root down to the network's prefix length, instead of
+a `subnet_of` call against every stored network.
+
+`NetworkIndex` nests two tries (a `src` trie whose nodes hold `dst` tries)
+with the wildcard (`None`) handling used by the anomaly detectors, so that
+"which earlier rules could cover this one" can be answered without a
+linear scan over the earlier rules.
+"""
+
+import ipaddress
+from typing import Callable, Dict, Generic, Iterator, List, Optional, TypeVar, Union
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+T = TypeVar("T")
+
+# Node layout: [child for bit 0, child for bit 1, stored value].
+_VALUE = 2
+_EMPTY = object()
+
+
+class PrefixTrie(Generic[T]):
+    """Map IP networks to values and find the values stored on supernets.
+
+    IPv4 and IPv6 networks live under separate roots, so a network never
+    matches a network of the other address family.
+    """
+
+    def __init__(self):
+        self._roots: Dict[int, list] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def setdefault(self, network: Network, default: Callable[[], T]) -> T:
+        """Return the value stored on `network`, storing `default()` if absent."""
+        node = self._roots.get(network.version)
+        if node is None:
+            node = self._roots[network.version] = [None, None, _EMPTY]
+
+        address = int(network.network_address)
+        top = network.max_prefixlen - 1
+        for depth in range(network.prefixlen):
+            bit = (address >> (top - depth)) & 1
+            child = node[bit]
+            if child is None:
+                child = node[bit] = [None, None, _EMPTY]
+            node = child
+
+        if node[_VALUE] is _EMPTY:
+            node[_VALUE] = default()
+            self._size += 1
+        return node[_VALUE]
+
+    def covering(self, network: Network) -> Iterator[T]:
+        """Yield the values stored on `network` and on all its supernets.
+
+        Values are yielded from the shortest prefix to the longest.
+        """
+        node = self._roots.get(network.version)
+        if node is None:
+            return
+
+        address = int(network.network_address)
+        top = network.max_prefixlen - 1
+        plen = network.prefixlen
+        depth = 0
+        while True:
+            value = node[_VALUE]
+            if value is not _EMPTY:
+                yield value
+            if depth == plen:
+                return
+            node = node[(address >> (top - depth)) & 1]
+            if node is None:
+                return
+            depth += 1
+
+
+class _FieldIndex(Generic[T]):
+    """Values indexed by one network field, plus those with a wildcard."""
+
+    def __init__(self, make_child: Callable[[], T]):
+        self.make_child = make_child
+        self.trie: PrefixTrie[T] = PrefixTrie()
+        self.wildcard: Optional[T] = None
+
+    def slot(self, network: Optional[Network]) -> T:
+        if network is None:
+            if self.wildcard is None:
+                self.wildcard = self.make_child()
+            return self.wildcard
+        return self.trie.setdefault(network, self.make_child)
+
+    def covering(self, network: Optional[Network], wildcard_covers: bool) -> Iterator[T]:
+        if network is not None:
+            yield from self.trie.covering(network)
+            if not wildcard_covers:
+                return
+        if self.wildcard is not None:
+            yield self.wildcard
+
+
+class NetworkIndex(Generic[T]):
+    """Index values by the `src`/`dst` networks of their rules.
+
+    Args:
+        wildcard_covers: If True an unspecified (`None`) network on a stored
+            rule covers any network, which is the shadowing semantics. If
+            False a wildcard only covers another wildcard, which is the
+            redundancy semantics.
+    """
+
+    def __init__(self, wildcard_covers: bool = True):
+        self.wildcard_covers = wildcard_covers
+        self._src: _FieldIndex[_FieldIndex[List[T]]] = _FieldIndex(
+            lambda: _FieldIndex(list)
+        )
+
+    def add(self, rule, value: T) -> None:
+        """Index `value` under the `src` and `dst` networks of `rule`."""
+        self._src.slot(rule.src).slot(rule.dst).append(value)
+
+    def candidates(self, rule) -> Iterator[T]:
+        """Yield values whose `src` and `dst` both cover those of `rule`.
+
+        This is only a pre-filter on the address fields; callers still need
+        to check the remaining fields of each candidate.
+        """
+        for dst_index in self._src.covering(rule.src, self.wildcard_covers):
+            for values in dst_index.covering(rule.dst, self.wildcard_covers):
+                yield from values
@@ -5,15 +5,26 @@ import type { AnalysisSession } from '../services/api';
 interface HistoryListProps {
     history: AnalysisSession[];
     isLoading: boolean;
+    hasMore?: boolean;
+    isLoadingMore?: boolean;
+    onLoadMore?: () => void;
     onSelectSession?: (sessionId: string) => void;
 }
 
 /**
  * HistoryList Component
  * 
- * Displays a list of past analysis sessions.
+ * Displays a list of past analysis sessions. The history is paginated,
+ * so older sessions are loaded on demand with the "Load more" button.
  */
-export function HistoryList({ history, isLoading, onSelectSession }: HistoryListProps) {
+export function HistoryList({
+    history,
+    isLoading,
+    hasMore = false,
+    isLoadingMore = false,
+    onLoadMore,
+    onSelectSession,
+}: HistoryListProps) {
     if (isLoading) {
         return (
             <div className="cyber-card p-6 text-center text-muted-foreground">
@@ -88,6 +99,23 @@ export function HistoryList({ history, isLoading, onSelectSession }: HistoryList
                         </div>
                     </div>
                 ))}
+
+                {hasMore && (
+                    <button
+                        onClick={onLoadMore}
+                        disabled={isLoadingMore}
+                        className="btn-secondary w-full"
+                    >
+                        {isLoadingMore ? (
+                            <>
+                                <div className="loading-spinner" />
+                                Loading...
+                            </>
+                        ) : (
+                            'Load more'
+                        )}
+                    </button>
+                )}
             </div>
         </div>
     );
@@ -17,7 +17,9 @@ const Index = () => {
   // State for analysis results
   const [analysisResult, setAnalysisResult] = useState<AnalysisResponse | null>(null);
   const [history, setHistory] = useState<AnalysisSession[]>([]);
+  const [historyNext, setHistoryNext] = useState<string | null>(null);
   const [isHistoryLoading, setIsHistoryLoading] = useState(false);
+  const [isMoreHistoryLoading, setIsMoreHistoryLoading] = useState(false);
 
   // Loading and error states
   const [isLoading, setIsLoading] = useState(false);
@@ -31,8 +33,9 @@ const Index = () => {
   async function fetchHistory() {
     setIsHistoryLoading(true);
     try {
-      const data = await getHistory();
-      setHistory(data);
+      const page = await getHistory();
+      setHistory(page.results);
+      setHistoryNext(page.next);
     } catch (err) {
       console.error('Failed to load history:', err);
     } finally {
@@ -40,6 +43,21 @@ const Index = () => {
     }
   }
 
+  // Append the next (older) page of history
+  async function fetchMoreHistory() {
+    if (!historyNext) return;
+    setIsMoreHistoryLoading(true);
+    try {
+      const page = await getHistory(historyNext);
+      setHistory((sessions) => [...sessions, ...page.results]);
+      setHistoryNext(page.next);
+    } catch (err) {
+      console.error('Failed to load more history:', err);
+    } finally {
+      setIsMoreHistoryLoading(false);
+    }
+  }
+
   /**
    * Handles the rule analysis process
    * Sends rules to backend API and processes response
@@ -164,7 +182,13 @@ const Index = () => {
           {/* Right Column: History (1/4 width) */}
           <div className="lg:col-span-1">
             <div className="sticky top-24">
-              <HistoryList history={history} isLoading={isHistoryLoading} />
+              <HistoryList
+                history={history}
+                isLoading={isHistoryLoading}
+                hasMore={historyNext !== null}
+                isLoadingMore={isMoreHistoryLoading}
+                onLoadMore={fetchMoreHistory}
+              />
             </div>
           </div>
 
@@ -95,16 +95,27 @@ export interface AnalysisSession {
 }
 
 /**
- * Fetches analysis history from the backend
+ * A page of analysis history, as returned by the cursor-paginated endpoint
+ */
+export interface HistoryPage {
+  next: string | null;
+  previous: string | null;
+  results: AnalysisSession[];
+}
+
+/**
+ * Fetches one page of analysis history from the backend, newest first
  * 
- * @returns Promise containing list of past analysis sessions
+ * @param pageUrl - The `next` URL of a previous page, or omitted for the first page
+ * @returns Promise containing the sessions of the page and the cursors around it
  */
-export async function getHistory(): Promise<AnalysisSession[]> {
-  const response = await fetch(`${API_BASE_URL}/api/history/`);
+export async function getHistory(pageUrl?: string | null): Promise<HistoryPage> {
+  const response = await fetch(pageUrl ?? `${API_BASE_URL}/api/history/`);
   if (!response.ok) {
     throw new Error('Failed to fetch history');
   }
-  return response.json();
+  const page: HistoryPage = await response.json();
+  return page;
 }
 
 /**
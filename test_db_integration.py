@@ -43,7 +43,7 @@ COMMIT
              print(f"Error: {response.status_code} - {response.text}")
              sys.exit(1)
              
-        history = response.json()
+        history = response.json()["results"]
         print(f"History contains {len(history)} entries.")
         
         # Check if our session is there